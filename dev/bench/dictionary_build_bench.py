@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+"""
+Benchmark of SpellChecker dictionary construction: add_token one word at a time
+against the bulk add_tokens, checking that both build the same similar tokens graph.
+
+Words are the most common words of a text file or made up (with misspelled
+variants, like the vocabulary of an OCR dump).
+
+Examples:
+
+    python dictionary_build_bench.py --words 3000
+    python dictionary_build_bench.py --corpus texas_dump.txt --words 5000 --processes 8
+    python dictionary_build_bench.py --words 20000 --skip-incremental
+"""
+
+import argparse
+import random
+import time
+
+import nltk
+
+from georeg import spell_checker
+from spellcheck_bench import make_words, misspell
+
+def graph_of(checker):
+    graph = checker._graph
+    thresh = checker.similarity_floor
+    return dict((word, frozenset(graph.words[j] for j in graph.similar_ids(i, thresh))) for i, word in enumerate(graph.words))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark SpellChecker dictionary construction.")
+    parser.add_argument("--corpus", default=None, help="text file to take the most common words from")
+    parser.add_argument("--words", type=int, default=3000, help="dictionary size")
+    parser.add_argument("--similarity-thresh", type=int, default=50)
+    parser.add_argument("--processes", type=int, default=None, help="processes for the bulk build (default: one per cpu)")
+    parser.add_argument("--skip-incremental", action="store_true", help="only time the bulk build")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    if args.corpus:
+        with open(args.corpus) as file:
+            tokens = nltk.FreqDist(spell_checker.tokenize(file.read())).most_common(args.words)
+    else:
+        # a third of the words are misspellings of the others
+        base = make_words(args.words * 2 / 3, rng)
+        words = set(base)
+        while len(words) < args.words:
+            words.add(misspell(rng.choice(base), rng, rng.randint(1, 2)))
+        tokens = [(w, rng.randint(1, 100)) for w in sorted(words)]
+
+    bulk = spell_checker.SpellChecker(similarity_thresh=args.similarity_thresh)
+    start = time.time()
+    bulk.add_tokens(tokens, args.processes)
+    bulk_time = time.time() - start
+
+    edges = sum(len(s) for s in graph_of(bulk).itervalues()) / 2
+    print "%d words, %d similar pairs" % (len(tokens), edges)
+    print "add_tokens: %.2f seconds" % bulk_time
+
+    if not args.skip_incremental:
+        incremental = spell_checker.SpellChecker(similarity_thresh=args.similarity_thresh)
+        start = time.time()
+        for token_str, count in tokens:
+            incremental.add_token(token_str, count)
+        incremental_time = time.time() - start
+
+        print "add_token:  %.2f seconds (%.1fx slower)" % (incremental_time, incremental_time / bulk_time)
+        print "same graph: %s" % (graph_of(incremental) == graph_of(bulk))
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+"""
+Benchmark of SpellChecker's lookup engines against get_best_spelling_correction_slow.
+
+The dictionary is read from a vocab .tsv (as written by write_dictionary_to_tsv)
+or a compiled .bin (as written by write_compiled_dictionary),
+built from the most common words of a text file, or made up. Queries are
+dictionary words with random OCR-like edits. For each engine the time per
+lookup and how often it agrees with the slow exhaustive lookup are reported.
+
+Examples:
+
+    python spellcheck_bench.py --words 3000
+    python spellcheck_bench.py --dictionary ../../georeg/data/TX_vocab.tsv --queries 2000
+    python spellcheck_bench.py --corpus texas_dump.txt --words 5000
+"""
+
+import argparse
+import random
+import string
+import time
+
+from georeg import spell_checker
+
+def make_words(n, rng):
+    words = set()
+    while len(words) < n:
+        words.add("".join(rng.choice(string.ascii_lowercase) for _ in xrange(rng.randint(3, 12))))
+    return sorted(words)
+
+def misspell(word, rng, edits):
+    for _ in xrange(edits):
+        pos = rng.randrange(len(word))
+        kind = rng.randrange(3)
+        if kind == 0: # substitution
+            word = word[:pos] + rng.choice(string.ascii_lowercase) + word[pos + 1:]
+        elif kind == 1 and len(word) > 2: # deletion
+            word = word[:pos] + word[pos + 1:]
+        else: # insertion
+            word = word[:pos] + rng.choice(string.ascii_lowercase) + word[pos:]
+    return word
+
+def load_checker(args, rng, lookup_engine):
+    checker = spell_checker.SpellChecker(similarity_thresh=args.similarity_thresh, lookup_engine=lookup_engine)
+
+    start = time.time()
+    if args.dictionary and args.dictionary.endswith(".bin"):
+        checker.load_compiled_dictionary(args.dictionary)
+    elif args.dictionary:
+        checker.load_dictionary_from_tsv(args.dictionary)
+    elif args.corpus:
+        checker.add_common_tokens_from_txt_file(args.corpus, args.words)
+    else:
+        for word in make_words(args.words, random.Random(args.seed)):
+            checker.add_token(word, rng.randint(1, 100))
+
+    return checker, time.time() - start
+
+def bench(lookup, queries):
+    start = time.time()
+    results = [lookup(q) for q in queries]
+    return results, (time.time() - start) / len(queries)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark SpellChecker lookup engines.")
+    parser.add_argument("--dictionary", default=None, help="vocab .tsv or compiled .bin to load")
+    parser.add_argument("--corpus", default=None, help="text file to take the most common words from")
+    parser.add_argument("--words", type=int, default=2000, help="dictionary size when not loading a .tsv")
+    parser.add_argument("--queries", type=int, default=500, help="number of lookups")
+    parser.add_argument("--max-edits", type=int, default=2, help="most random edits per query")
+    parser.add_argument("--similarity-thresh", type=int, default=50)
+    parser.add_argument("--target-similarity", type=int, default=80)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    reference, build_time = load_checker(args, rng, "graph")
+    print "Dictionary: %d words (graph built in %.2f seconds)" % (len(list(reference.words)), build_time)
+
+    words = sorted(reference.words)
+    queries = [misspell(rng.choice(words), rng, rng.randint(1, args.max_edits)) for _ in xrange(args.queries)]
+
+    slow_results, slow_time = bench(lambda q: reference.get_best_spelling_correction_slow(q, 100), queries)
+    slow_scores = [score for _, score in slow_results]
+    print "%-8s %10.1f us/lookup" % ("slow", slow_time * 1e6)
+
+    for lookup_engine in spell_checker.LOOKUP_ENGINES:
+        start = time.time()
+        reference.set_lookup_engine(lookup_engine)
+        index_time = time.time() - start
+
+        results, lookup_time = bench(lambda q: reference.get_best_spelling_correction(q, args.target_similarity), queries)
+
+        # an engine agrees with the exhaustive search if it found a word as similar as the best one
+        # (or found nothing when the best word is under the similarity threshold)
+        agree = sum(1 for (_, score), best in zip(results, slow_scores)
+                    if abs(score - best) < 1e-9 or (best < args.similarity_thresh and score == 0)
+                    or score >= args.target_similarity)
+
+        print "%-8s %10.1f us/lookup, %5.1fx faster than slow, %5.1f%% as good as slow (index built in %.2f seconds)" % (
+            lookup_engine, lookup_time * 1e6, slow_time / lookup_time, agree * 100.0 / len(queries), index_time)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+"""
+Validation report of downsampled layout detection (the layout_scale config option):
+finds the text block contours of sample pages at full resolution and at each scale
+and compares them.
+
+A full resolution contour is matched by the downsampled contour whose bounding box
+overlaps it most, the report lists for each page and scale the number of contours,
+the share of full resolution contours matched with at least --min-iou intersection
+over union, the mean IoU of the matches, the largest bounding box edge error and
+the time spent detecting.
+
+Examples:
+
+    python layout_validation.py --state RI --year 1979 scans/RI/1979/*.tif
+    python layout_validation.py --scales 0.5 0.33 0.25 --report layout_report.txt page1.png page2.png
+"""
+
+import argparse
+import os
+import time
+
+import cv2
+import numpy as np
+
+import georeg
+from georeg import layout
+
+def bounding_boxes(contours):
+    """(contours, 4) array of (x, y, w, h)"""
+    return np.array([cv2.boundingRect(c) for c in contours], dtype=np.float64).reshape(-1, 4)
+
+def match_boxes(full, scaled):
+    """
+    (ious, edge errors) of the best scaled match of every full resolution box,
+    edge errors are the largest difference of the boxes' edges in pixels
+    """
+    if not len(full) or not len(scaled):
+        return np.zeros(len(full)), np.full(len(full), np.inf)
+
+    x1, y1 = full[:, 0, None], full[:, 1, None]
+    x2, y2 = x1 + full[:, 2, None], y1 + full[:, 3, None]
+    sx1, sy1 = scaled[None, :, 0], scaled[None, :, 1]
+    sx2, sy2 = sx1 + scaled[None, :, 2], sy1 + scaled[None, :, 3]
+
+    overlap = np.clip(np.minimum(x2, sx2) - np.maximum(x1, sx1), 0, None) * \
+              np.clip(np.minimum(y2, sy2) - np.maximum(y1, sy1), 0, None)
+    union = (x2 - x1) * (y2 - y1) + (sx2 - sx1) * (sy2 - sy1) - overlap
+    ious = overlap / np.maximum(union, 1)
+
+    best = ious.argmax(axis=1)
+    rows = np.arange(len(full))
+    errors = np.max(np.abs(np.column_stack((x1[:, 0] - sx1[0, best], y1[:, 0] - sy1[0, best],
+                                            x2[:, 0] - sx2[0, best], y2[:, 0] - sy2[0, best]))), axis=1)
+    return ious[rows, best], errors
+
+def settings(state, year, cfg):
+    """(kernel_shape, iterations, thresh_value) of a registry's config file or of the defaults"""
+    if cfg is None and state:
+        cfg = os.path.join(georeg.__path__[0], "configs", state, "%d.cfg" % year)
+
+    # the same defaults and options as RegistryProcessor.load_settings_from_cfg
+    import ConfigParser
+    cp = ConfigParser.SafeConfigParser({"kernel_shape_x": "10", "kernel_shape_y": "3",
+                                        "iterations": "8", "thresh_value": "60"})
+    cp.add_section("RegistryProcessor")
+    if cfg:
+        cp.read(cfg)
+
+    kernel_shape = (cp.getint("RegistryProcessor", "kernel_shape_x"), cp.getint("RegistryProcessor", "kernel_shape_y"))
+    return kernel_shape, cp.getint("RegistryProcessor", "iterations"), cp.getint("RegistryProcessor", "thresh_value")
+
+def timed_contours(thresh, kernel_shape, iterations, scale, repeat):
+    best = None
+    for _ in xrange(repeat):
+        start = time.time()
+        contours = layout.find_text_contours(thresh, kernel_shape, iterations, scale)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return contours, best
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare downsampled and full resolution layout detection.")
+    parser.add_argument("pages", nargs="+", help="page images")
+    parser.add_argument("--state", default=None, help="take the detection settings from this state's config")
+    parser.add_argument("--year", type=int, default=None)
+    parser.add_argument("--cfg", default=None, help="config file to take the detection settings from")
+    parser.add_argument("--scales", type=float, nargs="+", default=[0.5, 0.33, 0.25])
+    parser.add_argument("--min-iou", type=float, default=0.8, help="intersection over union counted as a match")
+    parser.add_argument("--repeat", type=int, default=1, help="time the best of this many runs")
+    parser.add_argument("--pre-processed", action="store_true", help="images are already thresholded")
+    parser.add_argument("--report", default=None, help="also write the report to this file")
+    args = parser.parse_args()
+
+    kernel_shape, iterations, thresh_value = settings(args.state, args.year, args.cfg)
+
+    lines = ["kernel %dx%d, %d iterations" % (kernel_shape[0], kernel_shape[1], iterations)]
+    max_factor = layout.max_downsample_factor(kernel_shape, iterations)
+    for scale in args.scales:
+        factor = min(layout.downsample_factor(scale), max_factor)
+        if factor == 1:
+            lines.append("  at scale %.2f: full resolution (the close is too short to downsample)" % scale)
+            continue
+        close_shape, open_shape = layout.scaled_morphology(kernel_shape, iterations, factor)
+        lines.append("  at scale %.2f (1/%d): close %dx%d, open %dx%d" % (
+            scale, factor, close_shape[0], close_shape[1], open_shape[0], open_shape[1]))
+    lines.append("")
+    lines.append("%-30s %6s %9s %9s %8s %9s %9s %9s" % ("page", "scale", "contours", "matched", "mean iou", "max err", "time", "speedup"))
+
+    totals = dict((scale, [0, 0, 0.0, 0.0]) for scale in args.scales) # matched, full contours, full time, time
+
+    for path in args.pages:
+        image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            raise IOError("can't read image: %s" % path)
+
+        # as RegistryProcessor._get_contours thresholds
+        _, thresh = cv2.threshold(image, 0 if args.pre_processed else thresh_value, 255, cv2.THRESH_BINARY_INV)
+
+        full, full_time = timed_contours(thresh, kernel_shape, iterations, 1.0, args.repeat)
+        full_boxes = bounding_boxes(full)
+        name = os.path.basename(path)[-30:]
+        lines.append("%-30s %6.2f %9d %9s %8s %9s %8.0fms %9s" % (name, 1.0, len(full), "", "", "", full_time * 1e3, ""))
+
+        for scale in args.scales:
+            scaled, scaled_time = timed_contours(thresh, kernel_shape, iterations, scale, args.repeat)
+            ious, errors = match_boxes(full_boxes, bounding_boxes(scaled))
+            matched = ious >= args.min_iou
+
+            lines.append("%-30s %6.2f %9d %8.1f%% %8.3f %8.0fpx %8.0fms %8.1fx" % (
+                "", scale, len(scaled), 100.0 * matched.mean() if len(full) else 100.0,
+                ious.mean() if len(full) else 1.0, errors[matched].max() if matched.any() else 0,
+                scaled_time * 1e3, full_time / max(scaled_time, 1e-9)))
+
+            total = totals[scale]
+            total[0] += matched.sum()
+            total[1] += len(full)
+            total[2] += full_time
+            total[3] += scaled_time
+
+    lines.append("")
+    for scale in args.scales:
+        matched, count, full_time, scaled_time = totals[scale]
+        lines.append("scale %.2f: %.1f%% of %d contours matched, %.1fx faster" % (
+            scale, 100.0 * matched / max(count, 1), count, full_time / max(scaled_time, 1e-9)))
+
+    report = "\n".join(lines)
+    print report
+
+    if args.report:
+        with open(args.report, "w") as file:
+            file.write(report + "\n")
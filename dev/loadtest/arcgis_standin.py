@@ -0,0 +1,400 @@
+#!/usr/bin/env python
+
+"""
+Local stand-in for Brown's ArcGIS geocoding server, for load testing the
+geocoding stage without touching the real server.
+
+Implements the endpoints used by :class:`georeg.brownarcgis.BrownArcGIS`
+(generateToken, findAddressCandidates, geocodeAddresses, reverseGeocode and
+the GeocodeServer info page) with configurable latency, error rates, token
+expiry and throughput caps. Answers are made up but deterministic: the same
+address always gets the same coordinates (inside Rhode Island) or no match.
+
+Point georeg at it with BROWNGIS_HOST=127.0.0.1:<port>, or start it
+in-process from the load test (see loadtest.py).
+"""
+
+import argparse
+import BaseHTTPServer
+import json
+import random
+import SocketServer
+import threading
+import time
+import urlparse
+import zlib
+
+__all__ = ("StandinServer", "LatencyDistribution")
+
+GEOCODE_SERVER_PATH = "/arcgis/rest/services/brown_geocoding/Street_Addresses_US/GeocodeServer"
+TOKEN_PATH = "/arcgis/tokens/generateToken"
+
+# bounding box the made up coordinates fall in
+_min_lat, _max_lat = 41.3, 42.0
+_min_long, _max_long = -71.9, -71.1
+
+class LatencyDistribution(object):
+    """
+    Response time distribution given as "kind:arg,arg", one of
+    fixed:seconds, uniform:low,high, exponential:mean and lognormal:median,sigma
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        kind, _, args = spec.partition(":")
+        self.kind = kind
+        self.args = [float(a) for a in args.split(",")] if args else []
+
+        expected_args = {"fixed": 1, "uniform": 2, "exponential": 1, "lognormal": 2}
+        if expected_args.get(kind) != len(self.args):
+            raise ValueError("bad latency distribution: %s" % spec)
+
+    def sample(self, rng):
+        if self.kind == "fixed":
+            return self.args[0]
+        if self.kind == "uniform":
+            return rng.uniform(*self.args)
+        if self.kind == "exponential":
+            return rng.expovariate(1.0 / self.args[0]) if self.args[0] > 0 else 0.0
+
+        median, sigma = self.args
+        return rng.lognormvariate(0.0, sigma) * median
+
+class _ThroughputCap(object):
+    """delays requests so no more than max_rate are answered per second (0 for no cap)"""
+
+    def __init__(self, max_rate):
+        self.max_rate = max_rate
+        self.__next = time.time()
+        self.__lock = threading.Lock()
+
+    def wait(self):
+        if self.max_rate <= 0:
+            return 0.0
+
+        with self.__lock:
+            now = time.time()
+            start = max(now, self.__next)
+            self.__next = start + 1.0 / self.max_rate
+
+        delay = start - now
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive, like the real server
+
+    # buffer each response and send it right away, small unbuffered writes on a kept-alive
+    # connection would otherwise wait for the client's delayed ACK (about 40 ms a response)
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.standin.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def do_GET(self):
+        self._dispatch(urlparse.parse_qs(urlparse.urlsplit(self.path).query))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        params = urlparse.parse_qs(urlparse.urlsplit(self.path).query)
+        params.update(urlparse.parse_qs(body))
+        self._dispatch(params)
+
+    def _reply(self, status, obj):
+        body = json.dumps(obj)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.wfile.flush()
+
+    def _dispatch(self, params):
+        standin = self.server.standin
+        path = urlparse.urlsplit(self.path).path.rstrip("/")
+        params = dict((k, v[0]) for k, v in params.iteritems())
+
+        if path == "/stats":
+            return self._reply(200, standin.stats())
+
+        endpoints = {
+            TOKEN_PATH: "generateToken",
+            GEOCODE_SERVER_PATH: "info",
+            GEOCODE_SERVER_PATH + "/findAddressCandidates": "findAddressCandidates",
+            GEOCODE_SERVER_PATH + "/geocodeAddresses": "geocodeAddresses",
+            GEOCODE_SERVER_PATH + "/reverseGeocode": "reverseGeocode",
+        }
+        endpoint = endpoints.get(path)
+        if endpoint is None:
+            return self._reply(404, {"error": {"code": 404, "message": "not found: %s" % path}})
+
+        status, response = standin.handle(endpoint, params)
+        self._reply(status, response)
+
+class _HTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+class StandinServer(object):
+    """
+    Fake ArcGIS server. Every request to the geocoding endpoints waits for the
+    throughput cap, sleeps for a latency drawn from latency (plus
+    per_record_latency for each record of a batch) and then either fails
+    (error_rate: HTTP 500, service_error_rate: a JSON error, hang_rate: no
+    answer for hang_seconds) or answers.
+
+    Tokens expire token_lifetime seconds after they were issued, independent
+    of the lifetime the client asked for, and expired tokens get the usual
+    498 error. With require_token=False requests without a token are accepted.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0,
+                 latency="fixed:0", per_record_latency=0.0,
+                 error_rate=0.0, service_error_rate=0.0, hang_rate=0.0, hang_seconds=120.0,
+                 no_match_rate=0.1, token_lifetime=3600.0, require_token=False,
+                 max_rate=0.0, max_batch_size=300, seed=None, verbose=False):
+        self.latency = LatencyDistribution(latency) if isinstance(latency, basestring) else latency
+        self.per_record_latency = per_record_latency
+        self.error_rate = error_rate
+        self.service_error_rate = service_error_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.no_match_rate = no_match_rate
+        self.token_lifetime = token_lifetime
+        self.require_token = require_token
+        self.max_batch_size = max_batch_size
+        self.verbose = verbose
+
+        self.__rng = random.Random(seed)
+        self.__rng_lock = threading.Lock()
+        self.__cap = _ThroughputCap(max_rate)
+
+        self.__tokens = {} # token -> time issued
+        self.__token_count = 0
+
+        self.__counts = {}
+        self.__stats_lock = threading.Lock()
+
+        self.__httpd = _HTTPServer((host, port), _Handler)
+        self.__httpd.standin = self
+        self.__thread = None
+
+    @property
+    def address(self):
+        """host:port the server listens on (usable as BrownArcGIS's host)"""
+        return "%s:%d" % self.__httpd.server_address[:2]
+
+    def start(self):
+        """serve requests on a background thread"""
+        self.__thread = threading.Thread(target=self.__httpd.serve_forever)
+        self.__thread.daemon = True
+        self.__thread.start()
+        return self
+
+    def serve_forever(self):
+        self.__httpd.serve_forever()
+
+    def stop(self):
+        self.__httpd.shutdown()
+        self.__httpd.server_close()
+
+    def _count(self, stat, n=1):
+        with self.__stats_lock:
+            self.__counts[stat] = self.__counts.get(stat, 0) + n
+
+    def stats(self):
+        """request counts by endpoint and outcome"""
+        with self.__stats_lock:
+            return dict(self.__counts)
+
+    def _random(self):
+        with self.__rng_lock:
+            return self.__rng.random()
+
+    def _sample_latency(self, records):
+        with self.__rng_lock:
+            seconds = self.latency.sample(self.__rng)
+        return seconds + self.per_record_latency * records
+
+    def handle(self, endpoint, params):
+        """returns (http status, response object) for a request to endpoint"""
+        self._count(endpoint)
+
+        if endpoint == "generateToken":
+            return 200, self._issue_token(params)
+
+        if endpoint == "info":
+            return 200, {"currentVersion": 10.3,
+                         "locatorProperties": {"MaxBatchSize": self.max_batch_size}}
+
+        if not self._token_valid(params.get("token")):
+            self._count("token_rejected")
+            return 200, {"error": {"code": 498, "message": "Invalid token.", "details": []}}
+
+        records = None
+        if endpoint == "geocodeAddresses":
+            try:
+                records = json.loads(params.get("addresses", ""))["records"]
+            except (ValueError, KeyError, TypeError):
+                return 200, {"error": {"code": 400, "message": "Unable to complete operation.",
+                                       "details": ["Invalid addresses parameter"]}}
+
+            if len(records) > self.max_batch_size:
+                return 200, {"error": {"code": 400, "message": "Unable to complete operation.",
+                                       "details": ["Too many records, the maximum is %d" % self.max_batch_size]}}
+
+        queued = self.__cap.wait()
+        if queued:
+            self._count("queued_seconds", queued)
+
+        time.sleep(self._sample_latency(len(records) if records is not None else 1))
+
+        roll = self._random()
+        if roll < self.hang_rate:
+            self._count("hung")
+            time.sleep(self.hang_seconds)
+            return 504, {"error": {"code": 504, "message": "Gateway Timeout"}}
+        roll -= self.hang_rate
+        if roll < self.error_rate:
+            self._count("http_errors")
+            return 500, {"error": {"code": 500, "message": "Internal Server Error"}}
+        roll -= self.error_rate
+        if roll < self.service_error_rate:
+            self._count("service_errors")
+            return 200, {"error": {"code": 500, "message": "Unable to complete operation.", "details": []}}
+
+        self._count("answered")
+
+        if endpoint == "findAddressCandidates":
+            return 200, self._find_candidates(params)
+        if endpoint == "geocodeAddresses":
+            return 200, self._geocode_addresses(records)
+        return 200, self._reverse(params)
+
+    def _issue_token(self, params):
+        with self.__stats_lock:
+            self.__token_count += 1
+            token = "standin-token-%d" % self.__token_count
+            self.__tokens[token] = time.time()
+
+        expiration = float(params.get("expiration", 60)) * 60
+        return {"token": token, "expires": int((time.time() + expiration) * 1000)}
+
+    def _token_valid(self, token):
+        if not token:
+            return not self.require_token
+
+        with self.__stats_lock:
+            issued = self.__tokens.get(token)
+        return issued is not None and time.time() - issued < self.token_lifetime
+
+    def _locate(self, address):
+        """made up (x, y) for an address or None, the same address always gets the same answer"""
+        h = zlib.crc32(address.upper().encode("utf-8") if isinstance(address, unicode) else address.upper())
+        h &= 0xffffffff
+
+        if (h % 1000) < self.no_match_rate * 1000:
+            return None
+
+        lat = _min_lat + (_max_lat - _min_lat) * ((h >> 10) % 1000) / 1000.0
+        long = _min_long + (_max_long - _min_long) * ((h >> 20) % 1000) / 1000.0
+        return long, lat
+
+    @staticmethod
+    def _address_string(fields):
+        if fields.get("Single Line Input") or fields.get("SingleLine"):
+            return fields.get("Single Line Input") or fields.get("SingleLine")
+        return ", ".join(fields.get(k, "") for k in ("Street", "City", "State", "ZIP"))
+
+    def _find_candidates(self, params):
+        address = self._address_string(params)
+        location = self._locate(address)
+        if location is None:
+            return {"spatialReference": {"wkid": 4326}, "candidates": []}
+
+        return {"spatialReference": {"wkid": 4326},
+                "candidates": [{"address": address.upper(), "score": 100,
+                                "location": {"x": location[0], "y": location[1]},
+                                "attributes": {}}]}
+
+    def _geocode_addresses(self, records):
+        locations = []
+        for record in records:
+            attributes = record.get("attributes", {})
+            address = self._address_string(attributes)
+            location = self._locate(address)
+
+            if location is None:
+                locations.append({"address": "", "score": 0,
+                                  "attributes": {"ResultID": attributes.get("OBJECTID"), "Match_addr": ""}})
+            else:
+                locations.append({"address": address.upper(), "score": 100,
+                                  "location": {"x": location[0], "y": location[1]},
+                                  "attributes": {"ResultID": attributes.get("OBJECTID"),
+                                                 "Match_addr": address.upper()}})
+
+        return {"spatialReference": {"wkid": 4326}, "locations": locations}
+
+    def _reverse(self, params):
+        x, y = (float(v) for v in params.get("location", "0,0").split(",")[:2]) # ArcGIS is lon,lat
+        return {"address": {"Street": "%d STAND-IN ST" % (abs(int(x * 1000)) % 1000),
+                            "City": "PROVIDENCE", "State": "RI", "ZIP": "02903"},
+                "location": {"x": x, "y": y}}
+
+def add_arguments(parser):
+    """add the stand-in server's options to an argparse parser"""
+    parser.add_argument("--latency", default="lognormal:0.05,0.5",
+                        help="response time distribution: fixed:S, uniform:LO,HI, exponential:MEAN "
+                             "or lognormal:MEDIAN,SIGMA (seconds, default lognormal:0.05,0.5)")
+    parser.add_argument("--per-record-latency", type=float, default=0.001,
+                        help="extra seconds per record of a batch request (default 0.001)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of requests answered with HTTP 500")
+    parser.add_argument("--service-error-rate", type=float, default=0.0,
+                        help="fraction of requests answered with an ArcGIS JSON error")
+    parser.add_argument("--hang-rate", type=float, default=0.0,
+                        help="fraction of requests not answered for --hang-seconds")
+    parser.add_argument("--hang-seconds", type=float, default=120.0,
+                        help="how long hung requests take (default 120)")
+    parser.add_argument("--no-match-rate", type=float, default=0.1,
+                        help="fraction of addresses with no match (default 0.1)")
+    parser.add_argument("--token-lifetime", type=float, default=3600.0,
+                        help="seconds until the server rejects a token (default 3600)")
+    parser.add_argument("--require-token", action="store_true",
+                        help="reject requests without a token")
+    parser.add_argument("--max-rate", type=float, default=0.0,
+                        help="most requests answered per second, others wait (0 for no cap)")
+    parser.add_argument("--max-batch-size", type=int, default=300,
+                        help="MaxBatchSize advertised by the server (default 300)")
+    parser.add_argument("--seed", type=int, default=None, help="random seed")
+
+def from_arguments(args, host="127.0.0.1", port=0):
+    """make a StandinServer from parsed add_arguments options"""
+    return StandinServer(host=host, port=port, latency=args.latency,
+                         per_record_latency=args.per_record_latency,
+                         error_rate=args.error_rate, service_error_rate=args.service_error_rate,
+                         hang_rate=args.hang_rate, hang_seconds=args.hang_seconds,
+                         no_match_rate=args.no_match_rate, token_lifetime=args.token_lifetime,
+                         require_token=args.require_token, max_rate=args.max_rate,
+                         max_batch_size=args.max_batch_size, seed=args.seed,
+                         verbose=getattr(args, "verbose", False))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for Brown's ArcGIS geocoding server.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8080, help="port to listen on (default 8080)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log every request")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = from_arguments(args, args.host, args.port)
+    print "ArcGIS stand-in listening on %s (set BROWNGIS_HOST=%s)" % (server.address, server.address)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
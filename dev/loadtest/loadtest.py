@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+"""
+Load test of the geocoding stage.
+
+Geocodes made up businesses with georeg's geocoding functions (one request per
+business, several in flight at once, or through the batch endpoint) against the
+ArcGIS stand-in server started in-process, or against any server given with
+--server, and reports requests per second and tail latency.
+
+Examples:
+
+    python loadtest.py --businesses 2000 --mode concurrent --threads 16
+    python loadtest.py --businesses 20000 --mode batch --batch-size 1000 --latency fixed:0.2
+    python loadtest.py --mode concurrent --error-rate 0.05 --hang-rate 0.01 --hang-seconds 10
+"""
+
+import argparse
+import collections
+import random
+import threading
+import time
+
+import georeg.business_geocoder as geo
+from georeg.brownarcgis import BrownArcGIS
+from georeg.registry_processor import Business
+
+import arcgis_standin
+
+_streets = ["MAIN ST", "BROAD ST", "WESTMINSTER ST", "NORTH MAIN ST", "HOPE ST", "THAYER ST",
+            "ELMWOOD AVE", "CRANSTON ST", "WARWICK AVE", "POST RD", "PLAINFIELD ST", "ATWELLS AVE"]
+_cities = [("PROVIDENCE", "02903"), ("PAWTUCKET", "02860"), ("CRANSTON", "02910"),
+           ("WARWICK", "02886"), ("WOONSOCKET", "02895"), ("NEWPORT", "02840")]
+
+class TimedArcGIS(BrownArcGIS):
+    """BrownArcGIS that records how long every HTTP request takes and how it ended"""
+
+    def __init__(self, **kwargs):
+        super(TimedArcGIS, self).__init__(**kwargs)
+        self.timings = [] # (seconds, outcome)
+        self.__timings_lock = threading.Lock()
+
+    def _pooled_call(self, url, *args, **kwargs):
+        start = time.time()
+        try:
+            response = super(TimedArcGIS, self)._pooled_call(url, *args, **kwargs)
+        except Exception as e:
+            self._record(time.time() - start, e.__class__.__name__)
+            raise
+
+        outcome = "ok"
+        if isinstance(response, dict) and 'error' in response:
+            outcome = "error %s" % response['error'].get('code')
+        self._record(time.time() - start, outcome)
+        return response
+
+    def _record(self, seconds, outcome):
+        with self.__timings_lock:
+            self.timings.append((seconds, outcome))
+
+def make_businesses(n, seed=None):
+    rng = random.Random(seed)
+    businesses = []
+    for i in xrange(n):
+        business = Business()
+        business.name = "BUSINESS %d" % i
+        business.address = "%d %s" % (rng.randint(1, 2000), rng.choice(_streets))
+        business.city, business.zip = rng.choice(_cities)
+        businesses.append(business)
+    return businesses
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100.0))]
+
+def run(businesses, args):
+    if args.mode == "serial":
+        for business in businesses:
+            geo.geocode_business(business, args.state, args.timeout)
+    elif args.mode == "concurrent":
+        geo.geocode_businesses_concurrent(businesses, args.state, args.timeout,
+                                          max_in_flight=args.threads, max_rate=args.max_client_rate)
+    else:
+        for i in xrange(0, len(businesses), args.batch_size):
+            geo.geocode_businesses_batch(businesses[i:i+args.batch_size], args.state, args.timeout)
+
+def report(businesses, geolocator, elapsed, server):
+    timings = list(geolocator.timings)
+    latencies = sorted(seconds for seconds, _ in timings)
+    outcomes = collections.Counter(outcome for _, outcome in timings)
+    statuses = collections.Counter(business.geocode_status for business in businesses)
+
+    print "Elapsed: %.2f seconds" % elapsed
+    print "HTTP requests: %d (%.1f requests/second)" % (len(timings), len(timings) / elapsed)
+    print "Businesses: %d (%.1f businesses/second)" % (len(businesses), len(businesses) / elapsed)
+    print "Latency (seconds): p50 %.4f, p90 %.4f, p99 %.4f, p99.9 %.4f, max %.4f" % (
+        percentile(latencies, 50), percentile(latencies, 90), percentile(latencies, 99),
+        percentile(latencies, 99.9), latencies[-1] if latencies else float('nan'))
+    print "Request outcomes: %s" % ", ".join("%s %d" % item for item in sorted(outcomes.items()))
+    print "Business statuses: %s" % ", ".join("%s %d" % item for item in sorted(statuses.items()))
+
+    stats = geo.geocoder_stats()
+    print "Geocoder stats: requests %d, errors %d, deferred %d, breaker trips %d (%s)" % (
+        stats['requests'], stats['errors'], stats['deferred'], stats['breaker_trips'], stats['breaker_state'])
+    if stats['batch_seconds'] > 0:
+        print "Batch throughput: %.1f records/second (chunk size now %d)" % (
+            stats['batch_records'] / stats['batch_seconds'], geolocator.chunker.size)
+
+    if server is not None:
+        print "Server: %s" % ", ".join("%s %s" % item for item in sorted(server.stats().items()))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test georeg's geocoding stage.")
+    parser.add_argument("--server", default=None,
+                        help="host:port of a running server (default: start the stand-in server in-process)")
+    parser.add_argument("--mode", choices=("serial", "concurrent", "batch"), default="concurrent",
+                        help="serial: geocode_business one at a time, concurrent: geocode_businesses_concurrent, "
+                             "batch: geocode_businesses_batch (default concurrent)")
+    parser.add_argument("--businesses", type=int, default=1000, help="number of businesses to geocode")
+    parser.add_argument("--threads", type=int, default=8, help="requests in flight in concurrent mode")
+    parser.add_argument("--max-client-rate", type=float, default=0,
+                        help="requests per second the client sends in concurrent mode (0 for no limit)")
+    parser.add_argument("--batch-size", type=int, default=1000,
+                        help="businesses per geocode_businesses_batch call in batch mode")
+    parser.add_argument("--timeout", type=float, default=60, help="longest a request may take (seconds)")
+    parser.add_argument("--state", default="RI")
+    parser.add_argument("--auth", action="store_true",
+                        help="use authenticated mode (tokens) with dummy credentials")
+    arcgis_standin.add_arguments(parser)
+    args = parser.parse_args()
+
+    server = None
+    host = args.server
+    if host is None:
+        server = arcgis_standin.from_arguments(args).start()
+        host = server.address
+
+    credentials = {}
+    if args.auth:
+        credentials = dict(username="loadtest", password="loadtest", referer="loadtest")
+
+    geolocator = TimedArcGIS(host=host, pool_size=max(args.threads, 1), **credentials)
+    geo.set_geolocator(geolocator)
+    geo.set_cache(None) # every business must reach the server
+
+    businesses = make_businesses(args.businesses, args.seed)
+
+    start = time.time()
+    try:
+        run(businesses, args)
+    finally:
+        elapsed = time.time() - start
+        report(businesses, geolocator, elapsed, server)
+        geolocator.pool.clear()
+        if server is not None:
+            server.stop()
@@ -0,0 +1,44 @@
+"""
+Address canonicalization: OCR fixes for addresses read from registry images and
+canonical keys that identify the same address written different ways.
+"""
+
+import re
+
+__all__ = ("fix_ocr_digits", "canonical_street", "canonical_place", "canonical_key")
+
+_street_abbreviations = {
+    "STREET": "ST", "AVENUE": "AVE", "AV": "AVE", "ROAD": "RD", "BOULEVARD": "BLVD",
+    "DRIVE": "DR", "LANE": "LN", "PLACE": "PL", "COURT": "CT", "TERRACE": "TER",
+    "PARKWAY": "PKWY", "HIGHWAY": "HWY", "SQUARE": "SQ", "CIRCLE": "CIR",
+    "NORTH": "N", "SOUTH": "S", "EAST": "E", "WEST": "W",
+}
+
+# whitespace separated words made of digits and the letters OCR confuses with them
+# (I for 1, O for 0) that contain a digit or are all I's, e.g. "I2", "1O5", "I"
+_numeric_word_pattern = re.compile(r"(?<!\S)(?=[IO]*[0-9]|I+(?!\S))[IO0-9]+(?!\S)")
+_non_alnum_pattern = re.compile(r"[^A-Z0-9 ]+")
+
+def _fix_digits(match):
+    return match.group(0).replace("I", "1").replace("O", "0")
+
+def fix_ocr_digits(text):
+    """replace I with 1 and O with 0 inside numbers (e.g. house numbers and zip codes) and collapse spacing"""
+    return " ".join(_numeric_word_pattern.sub(_fix_digits, text).split())
+
+def canonical_place(value):
+    """uppercase value with punctuation and extra spacing removed"""
+    return " ".join(_non_alnum_pattern.sub(" ", (value or "").upper()).split())
+
+def canonical_street(street):
+    """canonical_place of a street with suffixes and directions abbreviated (STREET -> ST, NORTH -> N)"""
+    words = _non_alnum_pattern.sub(" ", (street or "").upper()).split()
+    return " ".join(_street_abbreviations.get(w, w) for w in words)
+
+def canonical_key(street, city, state, zip_cd):
+    """
+    make a key identifying an address from its parts,
+    case, punctuation, spacing and abbreviation differences are ignored
+    :return: (street, city, state, zip) tuple of canonical strings
+    """
+    return canonical_street(street), canonical_place(city), canonical_place(state), canonical_place(zip_cd)
@@ -0,0 +1,80 @@
+"""
+Adaptive records-per-request sizing for batch geocoding.
+"""
+
+import threading
+
+__all__ = ("AdaptiveChunker", )
+
+class AdaptiveChunker(object):
+    """
+    Tunes how many records are sent per batch request from observed latency and errors:
+    the chunk grows while requests finish well within target_latency, shrinks in proportion
+    when they run over it, and is halved after an error. It never exceeds max_size
+    (the server's advertised maximum batch size).
+    """
+
+    def __init__(self, initial_size=100, min_size=10, max_size=300, target_latency=10.0, growth=1.25):
+        """
+        :param initial_size: records in the first request
+        :param min_size: smallest chunk that will be sent
+        :param max_size: largest chunk that will be sent
+        :param target_latency: seconds a single request should take
+        :param growth: factor the chunk grows by after a fast request
+        """
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_latency = target_latency
+        self.growth = growth
+
+        # throughput stats
+        self.records = 0
+        self.seconds = 0.0
+        self.requests = 0
+        self.errors = 0
+
+        self.__size = max(min_size, min(initial_size, max_size))
+        self.__lock = threading.Lock()
+
+    @property
+    def size(self):
+        """number of records to put in the next request"""
+        with self.__lock:
+            return self.__size
+
+    def set_max_size(self, max_size):
+        with self.__lock:
+            self.max_size = max_size
+            self.__size = max(self.min_size, min(self.__size, max_size))
+
+    def record_success(self, records, seconds):
+        """update the chunk size after records were geocoded in seconds"""
+        with self.__lock:
+            self.records += records
+            self.seconds += seconds
+            self.requests += 1
+
+            # only full chunks say anything about whether the chunk could be bigger
+            if records < self.__size:
+                return
+
+            if seconds < self.target_latency / 2:
+                size = int(self.__size * self.growth) + 1
+            elif seconds > self.target_latency:
+                size = int(self.__size * self.target_latency / seconds)
+            else:
+                return
+
+            self.__size = max(self.min_size, min(size, self.max_size))
+
+    def record_error(self):
+        """halve the chunk size after a failed request"""
+        with self.__lock:
+            self.errors += 1
+            self.requests += 1
+            self.__size = max(self.min_size, self.__size / 2)
+
+    def throughput(self):
+        """returns records geocoded per second of request time, or -1 if nothing was sent yet"""
+        with self.__lock:
+            return self.records / self.seconds if self.seconds > 0 else -1
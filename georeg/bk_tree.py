@@ -0,0 +1,139 @@
+"""
+BK-tree (metric tree) over Levenshtein distance, used by :class:`.SpellChecker`
+to find the closest dictionary words without comparing against every word.
+"""
+
+from Levenshtein import distance
+
+__all__ = ("BKTree", )
+
+class BKTree(object):
+    """
+    Every node holds a word and its children keyed by their edit distance to it.
+    By the triangle inequality a word within distance r of a query can only be in
+    the subtree of child k of a node at distance d from the query if |d - k| <= r,
+    so a search skips every other subtree.
+    """
+
+    def __init__(self):
+        self._root = None # [word, value, {distance: child node}]
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def clear(self):
+        self._root = None
+        self._size = 0
+
+    def add(self, word, value):
+        """add word (stored as unicode) with an associated value, an existing word's value is replaced"""
+        word = unicode(word)
+
+        if self._root is None:
+            self._root = [word, value, {}]
+            self._size += 1
+            return
+
+        node = self._root
+        while True:
+            d = distance(word, node[0])
+            if d == 0:
+                node[1] = value
+                return
+
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [word, value, {}]
+                self._size += 1
+                return
+            node = child
+
+    def search(self, word, max_distance):
+        """
+        returns a list of (distance, word, value) for every word within max_distance of word
+        """
+        word = unicode(word)
+        results = []
+
+        if self._root is None:
+            return results
+
+        stack = [self._root]
+        while stack:
+            node_word, value, children = stack.pop()
+            d = distance(word, node_word)
+
+            if d <= max_distance:
+                results.append((d, node_word, value))
+
+            for k, child in children.iteritems():
+                if d - max_distance <= k <= d + max_distance:
+                    stack.append(child)
+
+        return results
+
+    def closest(self, word, score, max_distance, good_enough=None):
+        """
+        find the word maximizing score(distance, candidate word, value) among words
+        within max_distance of word, the search radius shrinks as better words are found
+        :param score: function (distance, candidate word, value) -> (score, max distance
+               a word could have and still score at least as high)
+        :param good_enough: stop searching once a word scores at least this
+        :return: (score, word, value) of the best word or None if no word is close enough
+        """
+        word = unicode(word)
+
+        if self._root is None:
+            return None
+
+        # search within growing radii, close words are usually found with a small radius
+        # which then bounds the radius of the remaining search
+        radius = 0
+        while True:
+            radius = min(radius, max_distance)
+            best, bound = self._closest_within(word, score, radius, good_enough)
+
+            if best is not None and (bound <= radius or (good_enough is not None and best[0] >= good_enough)):
+                return best
+            if radius >= max_distance:
+                return best
+
+            radius = radius * 2 + 1 if best is None else bound
+
+    def _closest_within(self, word, score, max_distance, good_enough):
+        """one pass of closest() with a fixed maximum radius, returns (best, radius bound of best)"""
+        best = None
+        bound = max_distance
+
+        stack = [self._root]
+        while stack:
+            node_word, value, children = stack.pop()
+            d = distance(word, node_word)
+
+            if d <= max_distance:
+                node_score, radius = score(d, node_word, value)
+                if best is None or node_score > best[0]:
+                    best = (node_score, node_word, value)
+                    bound = radius
+                    max_distance = min(max_distance, radius)
+
+                    if good_enough is not None and node_score >= good_enough:
+                        break
+
+            if not children:
+                continue
+
+            # look up the children within range directly when there are fewer keys in range than children
+            lo, hi = d - max_distance, d + max_distance
+            if hi - lo + 1 < len(children):
+                for k in xrange(max(lo, 1), hi + 1):
+                    child = children.get(k)
+                    if child is not None:
+                        stack.append(child)
+            else:
+                for k, child in children.iteritems():
+                    if lo <= k <= hi:
+                        stack.append(child)
+
+        return best, bound
@@ -3,43 +3,76 @@
 """
 
 import json
+import httplib
+import socket
+import threading
 from time import time
 from math import ceil
-from geopy.compat import urlencode, urlopen, Request
+from geopy.compat import urlencode, Request
 from geopy.geocoders import ArcGIS
 from geopy.geocoders.base import Geocoder, DEFAULT_SCHEME, DEFAULT_TIMEOUT, DEFAULT_WKID
+from geopy.geocoders.base import ERROR_CODE_MAP
 from geopy.exc import GeocoderServiceError, GeocoderAuthenticationFailure
+from geopy.exc import GeocoderTimedOut, GeocoderUnavailable, GeocoderParseError
 from geopy.exc import ConfigurationError
 from geopy.location import Location
 from geopy.util import logger
 
+from http_pool import HTTPConnectionPool, DEFAULT_POOL_SIZE
+from batch_chunker import AdaptiveChunker
+
 __all__ = ("BrownArcGIS", )
 
+DEFAULT_HOST = 'quidditch.gis.brown.edu:6080'
+
+def _server_failed(error):
+    """whether a request failed because of the server (a timeout, no connection or a 5xx response)"""
+    return isinstance(error, (GeocoderTimedOut, GeocoderUnavailable)) or getattr(error, 'status', 0) >= 500
+
 class BrownArcGIS(ArcGIS):
     """
     Extend ArcGIS class from GeoPy 1.11.0
     """
 
-    auth_api = 'http://quidditch.gis.brown.edu:6080/arcgis/tokens/generateToken'
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, token_refresh_margin=60, host=DEFAULT_HOST, **kwargs):
+        """
+        :param int pool_size: Maximum number of keep-alive connections
+            kept open to the server (shared by all threads).
+
+        :param int token_refresh_margin: In authenticated mode the token is
+            refreshed this many seconds before it expires.
+
+        :param string host: host[:port] of the ArcGIS server, e.g. a local
+            stand-in server for load tests.
 
-    def __init__(self, **kwargs):
+        Other arguments are passed to :class:`geopy.geocoders.ArcGIS`.
+        """
+
+        # all threads share one token, only one of them refreshes it at a time
+        self.token_refresh_margin = token_refresh_margin
+        self.__token_lock = threading.RLock()
+        self.__token_refreshed_at = 0.0
 
         super(BrownArcGIS, self).__init__(scheme='https', **kwargs)
 
         self.scheme = 'http' # https not supported
+        self.host = host
 
-        self.api = (
-            '%s://quidditch.gis.brown.edu:6080/arcgis/rest/services/brown_geocoding'
-            '/Street_Addresses_US/GeocodeServer/findAddressCandidates' % self.scheme
-        )
-        self.batch_api = (
-            '%s://quidditch.gis.brown.edu:6080/arcgis/rest/services/brown_geocoding'
-            '/Street_Addresses_US/GeocodeServer/geocodeAddresses' % self.scheme
-        )
-        self.reverse_api = (
-            '%s://quidditch.gis.brown.edu:6080/arcgis/rest/services/brown_geocoding'
-            '/Street_Addresses_US/GeocodeServer/reverseGeocode' % self.scheme
+        # every request to the server goes through this pool
+        self.pool = HTTPConnectionPool(maxsize=pool_size)
+
+        self.auth_api = '%s://%s/arcgis/tokens/generateToken' % (self.scheme, host)
+        self.server_api = (
+            '%s://%s/arcgis/rest/services/brown_geocoding'
+            '/Street_Addresses_US/GeocodeServer' % (self.scheme, host)
         )
+        self.api = self.server_api + '/findAddressCandidates'
+        self.batch_api = self.server_api + '/geocodeAddresses'
+        self.reverse_api = self.server_api + '/reverseGeocode'
+
+        # batch records per request, tuned from observed latency (see geocode_batch)
+        self.chunker = AdaptiveChunker()
+        self._max_batch_size = None
 
     def geocode(self, query='', street='', city='', state='', zip_cd='',
                 n_matches=1, timeout=None):
@@ -80,13 +113,13 @@ class BrownArcGIS(ArcGIS):
         url = "?".join((self.api, urlencode(params)))
 
         logger.debug("%s.geocode: %s", self.__class__.__name__, url)
+        requested_at = time()
         response = self._call_geocoder(url, timeout=timeout)
 
         # Handle any errors; recursing in the case of an expired token
         if 'error' in response:
             if response['error']['code'] == self._TOKEN_EXPIRED:
-                self.retry += 1
-                self._refresh_authentication_token()
+                self._token_rejected(requested_at)
                 return self.geocode(query, street, city, state, zip_cd, n_matches, timeout)
             raise GeocoderServiceError(str(response['error']))
 
@@ -107,16 +140,29 @@ class BrownArcGIS(ArcGIS):
 
         return {'candidates':geocoded}
 
-    def geocode_batch(self, addresses, timeout=None, wkid=DEFAULT_WKID):
+    def geocode_batch(self, addresses, timeout=None, wkid=DEFAULT_WKID, method='POST'):
         """
         Process address dict returning top match only.
 
-        :param list addresses: List of tuples (uid, address) uid = int, address = sting.
+        Addresses are sent in chunks sized by self.chunker, which adapts the
+        number of records per request to the server's response times (up to
+        the server's advertised maximum batch size).
+
+        :param list addresses: List of tuples (uid, address) uid = int, address = string
+            or a dict of address fields, i.e. {'Street':..., 'City':..., 'State':..., 'ZIP':...}.
 
         :param int timeout: Time, in seconds, to wait for the geocoding service
             to respond before raising a :class:`geopy.exc.GeocoderTimedOut`
             exception. Set this only if you wish to override, on this call
             only, the value set during the geocoder's initialization.
+
+        :param string method: 'POST' to send records in the request body,
+            'GET' to send them in the query string.
+
+        A chunk that times out or gets a 5xx response is resent smaller, up
+        to _MAX_RETRIES times in a row, 4xx responses and service errors are
+        raised. The exception raised has a ``geocoded`` attribute with the
+        results of the chunks that succeeded before it.
         """
 
         if not len(addresses):
@@ -124,35 +170,72 @@ class BrownArcGIS(ArcGIS):
                 "Must pass a list of tuples with uid and address."
             )
 
+        if self._max_batch_size is None:
+            self.chunker.set_max_size(self.max_batch_size())
+
         geocoded = []
-        for i in xrange(0, len(addresses), 300):
+        failures = 0
+        i = 0
+        while i < len(addresses):
+            chunk_size = self.chunker.size
 
             records = []
-            for a in addresses[i:i+300]:
-                attributes_dict = {"attributes":{"OBJECTID":a[0],"Single Line Input":a[1]}}
-                records.append(attributes_dict)
+            for a in addresses[i:i+chunk_size]:
+                if isinstance(a[1], dict):
+                    attributes = dict(a[1])
+                else:
+                    attributes = {"Single Line Input":a[1]}
+                attributes["OBJECTID"] = a[0]
+                records.append({"attributes":attributes})
 
-            query = {"records":records}
+            query = json.dumps({"records":records})
 
             params = {'addresses': query,
                       'outSR': wkid,
                       'f': 'json'}
 
-            url = "?".join((self.batch_api, urlencode(params)))
-
-            logger.debug("%s.geocode: %s", self.__class__.__name__, url)
-            response = self._call_geocoder(url, timeout=timeout)
-
-            # Handle any errors; recursing in the case of an expired token.
+            logger.debug("%s.geocode_batch: %d records", self.__class__.__name__, len(records))
+            requested_at = time()
+            try:
+                if method == 'POST':
+                    # the query string keeps a parameter so the token can be appended to it
+                    response = self._call_geocoder("?".join((self.batch_api, "f=json")), timeout=timeout,
+                                                   data=urlencode(params))
+                else:
+                    response = self._call_geocoder("?".join((self.batch_api, urlencode(params))), timeout=timeout)
+            except GeocoderServiceError as e:
+                # resend this chunk smaller if the server failed (not the request),
+                # giving up after a few consecutive failures
+                if not _server_failed(e):
+                    e.geocoded = geocoded
+                    raise
+                self.chunker.record_error()
+                failures += 1
+                if failures > self._MAX_RETRIES:
+                    e.geocoded = geocoded
+                    raise
+                continue
+
+            # Handle any errors; resending this chunk in the case of an expired token
+            # (chunks that already succeeded are kept)
             if 'error' in response:
                 if response['error']['code'] == self._TOKEN_EXPIRED:
-                    self.retry += 1
-                    self._refresh_authentication_token()
-                    return self.geocode(timeout=timeout)
-                raise GeocoderServiceError(str(response['error']))
+                    self._token_rejected(requested_at)
+                    continue
+                error = GeocoderServiceError(str(response['error']))
+                error.geocoded = geocoded
+                raise error
+
+            self.chunker.record_success(len(records), time() - requested_at)
+            failures = 0
+            i += len(records)
 
-            #add code for parsing output here
             for location in response['locations']:
+                # unmatched addresses come back with a score of 0 and no usable location
+                if not location.get('score') or 'location' not in location:
+                    geocoded.append({'uid':location['attributes']['ResultID'], 'attributes':None})
+                    continue
+
                 geocoded.append({
                     'uid':location['attributes']['ResultID'],
                     'attributes':{
@@ -163,6 +246,21 @@ class BrownArcGIS(ArcGIS):
 
         return {'geocoded':geocoded}
 
+    def max_batch_size(self, timeout=None):
+        """
+        Return the largest number of records the server accepts per batch
+        request (its advertised MaxBatchSize), or 300 if it can't be found.
+        """
+        if self._max_batch_size is None:
+            try:
+                response = self._call_geocoder("?".join((self.server_api, "f=json")), timeout=timeout)
+                self._max_batch_size = int(response['locatorProperties']['MaxBatchSize'])
+            except (GeocoderServiceError, KeyError, TypeError, ValueError):
+                logger.debug("%s: MaxBatchSize not advertised, using 300", self.__class__.__name__)
+                self._max_batch_size = 300
+
+        return self._max_batch_size
+
     def reverse(self, query, timeout=None, distance=100, wkid=DEFAULT_WKID):
         """
         Given a point, find an address.
@@ -199,6 +297,7 @@ class BrownArcGIS(ArcGIS):
         url = "?".join((self.reverse_api, urlencode(params)))
 
         logger.debug("%s.reverse: %s", self.__class__.__name__, url)
+        requested_at = time()
         response = self._call_geocoder(url, timeout=timeout)
 
         if not len(response):
@@ -206,8 +305,7 @@ class BrownArcGIS(ArcGIS):
 
         if 'error' in response:
             if response['error']['code'] == self._TOKEN_EXPIRED:
-                self.retry += 1
-                self._refresh_authentication_token()
+                self._token_rejected(requested_at)
                 return self.reverse(query, timeout=timeout, distance=distance, wkid=wkid)
             raise GeocoderServiceError(str(response['error']))
 
@@ -217,6 +315,96 @@ class BrownArcGIS(ArcGIS):
 
         return address
 
+    def set_pool_size(self, pool_size):
+        """replace the connection pool with one holding up to pool_size connections"""
+        self.pool.clear()
+        self.pool = HTTPConnectionPool(maxsize=pool_size)
+
+    def _authenticated_call_geocoder(self, url, timeout=None, **kwargs):
+        """
+        Add the shared token to a request, the token is refreshed ahead of
+        its expiry rather than after the server has rejected it.
+        """
+        request = Request(
+            "&token=".join((url, self._valid_token())), # no urlencoding
+            headers={"Referer": self.referer}
+        )
+        return self._base_call_geocoder(request, timeout=timeout, **kwargs)
+
+    def _valid_token(self):
+        """returns the current token, refreshing it first if it's missing or about to expire"""
+        # short lived tokens are refreshed after 3/4 of their lifetime instead
+        margin = min(self.token_refresh_margin, self.token_lifetime / 4.0)
+
+        with self.__token_lock:
+            if self.token is None or time() >= self.token_expiry - margin:
+                self._refresh_authentication_token()
+            return self.token
+
+    def _token_rejected(self, requested_at):
+        """
+        Called when the server reports an expired token for a request sent at requested_at,
+        the token is refreshed unless another thread already did so after that request was sent.
+        """
+        with self.__token_lock:
+            if self.__token_refreshed_at <= requested_at:
+                self.retry += 1
+                self._refresh_authentication_token()
+
+    def _call_geocoder(self, url, timeout=None, raw=False, requester=None,
+                       deserializer=json.loads, **kwargs):
+        """
+        Send every geocoder request through the connection pool.
+        (in authenticated mode geopy wraps this method to add the token)
+        """
+        return self._pooled_call(url, timeout=timeout, raw=raw,
+                                 deserializer=deserializer, data=kwargs.get('data'))
+
+    def _pooled_call(self, url, timeout=None, raw=False, deserializer=json.loads, data=None):
+        """
+        GET a url (or POST data to it) over a pooled keep-alive connection
+        and deserialize the response, raising the same geopy exceptions as
+        :meth:`geopy.geocoders.base.Geocoder._call_geocoder`.
+        """
+        headers = dict(self.headers)
+
+        # the authenticated call path passes a Request carrying the token and referer
+        if isinstance(url, Request):
+            headers.update(url.header_items())
+            data = url.get_data() if data is None else data
+            url = url.get_full_url()
+
+        method = 'GET' if data is None else 'POST'
+
+        try:
+            page = self.pool.request(method, url, body=data, headers=headers,
+                                     timeout=(timeout or self.timeout))
+        except socket.timeout:
+            raise GeocoderTimedOut('Service timed out')
+        except (httplib.HTTPException, socket.error) as error:
+            raise GeocoderUnavailable('Service not available: %s' % error)
+
+        if page.status >= 400:
+            if page.status in ERROR_CODE_MAP:
+                error = ERROR_CODE_MAP[page.status]("\n%s" % page.body)
+            else:
+                error = GeocoderServiceError("HTTP %d\n%s" % (page.status, page.body))
+            error.status = page.status
+            raise error
+
+        if raw:
+            return page
+
+        if deserializer is None:
+            return page.body
+
+        try:
+            return deserializer(page.body)
+        except ValueError:
+            raise GeocoderParseError(
+                "Could not deserialize using deserializer:\n%s" % page.body
+            )
+
     def _refresh_authentication_token(self):
         """
         POST to ArcGIS requesting a new token.
@@ -235,10 +423,7 @@ class BrownArcGIS(ArcGIS):
         }
         self.token_expiry = int(time()) + self.token_lifetime
         data = urlencode(token_request_arguments)
-        req = Request(url=self.auth_api, headers=self.headers)
-        page = urlopen(req, data=data, timeout=self.timeout)
-        page = page.read()
-        response = json.loads(page)
+        response = self._pooled_call(self.auth_api, timeout=self.timeout, data=data)
         if not 'token' in response:
             raise GeocoderAuthenticationFailure(
                 'Missing token in auth request. '
@@ -248,3 +433,4 @@ class BrownArcGIS(ArcGIS):
             )
         self.retry = 0
         self.token = response['token']
+        self.__token_refreshed_at = time()
@@ -1,34 +1,393 @@
 import os
-import re
-from brownarcgis import BrownArcGIS
+import threading
+from time import time, sleep
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from geopy.exc import GeocoderQueryError, ConfigurationError, GeocoderTimedOut
+from geopy.util import logger
+from brownarcgis import BrownArcGIS, DEFAULT_HOST
+from geocode_cache import GeocodeCache, DEFAULT_CACHE_PATH
+from address_canonicalizer import fix_ocr_digits, canonical_key
+from circuit_breaker import LatencyTracker, CircuitBreaker
 
-geolocator = BrownArcGIS(username = os.environ.get("BROWNGIS_USERNAME"),
-                         password = os.environ.get("BROWNGIS_PASSWORD"),
-                         referer = os.environ.get("BROWNGIS_REFERER"))
+# the geocoder backend, created on first use (see get_geolocator and set_geolocator)
+_geolocator = None
 
-def geocode_business(business, state = 'RI', timeout=60):
+def get_geolocator():
+    """returns the geocoder backend, by default Brown's ArcGIS server configured from the environment"""
+    global _geolocator
+    if _geolocator is None:
+        _geolocator = BrownArcGIS(username = os.environ.get("BROWNGIS_USERNAME"),
+                                  password = os.environ.get("BROWNGIS_PASSWORD"),
+                                  referer = os.environ.get("BROWNGIS_REFERER"),
+                                  host = os.environ.get("BROWNGIS_HOST", DEFAULT_HOST))
+    return _geolocator
+
+def set_geolocator(backend):
+    """
+    replace the geocoder backend, i.e. with an :class:`.OfflineGeocoder`
+    (see :class:`.GeocoderBackend` for the methods a backend must provide),
+    results of earlier backends are not reused
+    """
+    global _geolocator
+    _geolocator = backend
+
+    with _run_results_lock:
+        _run_results.clear()
+
+def _cache_name():
+    """name the current backend's results are cached under (see GeocoderBackend.cache_name)"""
+    backend = get_geolocator()
+    return getattr(backend, 'cache_name', None) or backend.__class__.__name__
+
+# results are cached on disk between runs, set GEOREG_GEOCODE_CACHE to "" to turn this off
+cache = None
+if os.environ.get("GEOREG_GEOCODE_CACHE", DEFAULT_CACHE_PATH):
+    cache = GeocodeCache(os.environ.get("GEOREG_GEOCODE_CACHE", DEFAULT_CACHE_PATH))
+
+# values of Business.geocode_status
+GEOCODE_PENDING = "pending" # not geocoded yet
+GEOCODE_SUCCESS = "success"
+GEOCODE_FAILED = "failed" # the geocoder found no match or could not be reached
+GEOCODE_NO_ADDRESS = "no address" # the parser found no address to geocode
+GEOCODE_DEFERRED = "deferred" # not sent because the geocoder is failing, retry later
+
+# shared by all threads of a process
+latency = LatencyTracker()
+breaker = CircuitBreaker()
+
+_stats_lock = threading.Lock()
+_stats = {'requests': 0, 'errors': 0, 'deferred': 0, 'retries': 0, 'duplicates': 0}
+
+# results of this run by canonical address key, so each unique address is sent to the geocoder once per run
+_run_results = {}
+_run_results_lock = threading.Lock()
+
+def _count(stat, n=1):
+    with _stats_lock:
+        _stats[stat] += n
+
+def geocoder_stats():
+    """
+    returns a dict of geocoder health stats for this process:
+    requests sent, errors, businesses deferred while the breaker was open,
+    businesses retried, businesses that reused the result of an earlier business
+    with the same canonical address, breaker trips, breaker state, p50/p99 latency and
+    records geocoded by batch requests and the seconds spent on them
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+
+    stats['breaker_trips'] = breaker.trips
+    stats['breaker_state'] = breaker.state
+    stats['latency_p50'] = latency.latency_percentile(50)
+    stats['latency_p99'] = latency.latency_percentile(99)
+
+    # batch throughput (only remote backends size their batches adaptively)
+    chunker = getattr(_geolocator, 'chunker', None)
+    stats['batch_records'] = chunker.records if chunker else 0
+    stats['batch_seconds'] = chunker.seconds if chunker else 0.0
+
+    return stats
+
+def requeue_deferred(businesses):
+    """mark deferred businesses as pending again so they are retried"""
+    for business in businesses:
+        if business.geocode_status == GEOCODE_DEFERRED:
+            business.geocode_status = GEOCODE_PENDING
+            _count('retries')
+
+def _is_server_failure(error):
+    """errors caused by the request itself don't count against the server"""
+    return not isinstance(error, (GeocoderQueryError, ConfigurationError))
+
+def set_cache(new_cache):
+    """replace the geocode cache (pass None to disable caching)"""
+    global cache
+    cache = new_cache
+
+def canonicalize(business, state):
+    """fix OCR errors in the business's address and zip code, returns its canonical address key"""
+    business.address = fix_ocr_digits(business.address)
+    business.zip = fix_ocr_digits(business.zip)
+    return canonical_key(business.address, business.city, state, business.zip)
+
+def group_by_address(businesses, state = 'RI'):
+    """
+    canonicalize the addresses of pending businesses and group them by canonical key,
+    businesses without an address are marked as such
+    :return: OrderedDict of key -> businesses with that address, in order of first appearance
+    """
+    groups = OrderedDict()
+    for business in businesses:
+        if business.geocode_status != GEOCODE_PENDING:
+            continue
+
+        if not business.address:
+            business.geocode_status = GEOCODE_NO_ADDRESS
+            continue
+
+        groups.setdefault(canonicalize(business, state), []).append(business)
+
+    return groups
+
+def _fan_out(groups):
+    """copy the result of the first business of each group to the rest of the group"""
+    for group in groups.itervalues():
+        first = group[0]
+        for business in group[1:]:
+            business.geocode_status = first.geocode_status
+            business.confidence_score = first.confidence_score
+            business.lat = first.lat
+            business.long = first.long
+
+        if len(group) > 1:
+            _count('duplicates', len(group) - 1)
+            if first.geocode_status == GEOCODE_DEFERRED:
+                _count('deferred', len(group) - 1)
+
+def _known_result(key):
+    """
+    returns the result for an address already geocoded this run or found in the cache
+    (in the form returned by :meth:`.GeocodeCache.get`) or None
+    """
+    with _run_results_lock:
+        result = _run_results.get(key)
+
+    if result is not None:
+        _count('duplicates')
+        return result
+
+    if cache is not None:
+        result = cache.get(key, _cache_name())
+        if result is not None:
+            with _run_results_lock:
+                _run_results[key] = result
+
+    return result
+
+def _store_result(key, match):
+    """remember the geocoder's top match for key (None for no match) for the rest of the run and in the cache"""
+    if match:
+        result = {'found': True, 'score': float(match["score"]), 'lat': match["location"]["y"],
+                  'long': match["location"]["x"], 'match_addr': match["match_addr"]}
+    else:
+        result = {'found': False}
+
+    with _run_results_lock:
+        _run_results[key] = result
+
+    if cache is not None:
+        if match:
+            cache.put(key, result['score'], result['lat'], result['long'], result['match_addr'], _cache_name())
+        else:
+            cache.put_negative(key, _cache_name())
+
+    return result
+
+def _apply_cached(business, cached):
+    if not cached['found']:
+        business.geocode_status = GEOCODE_FAILED
+        return False
+
+    business.confidence_score = float(cached["score"])
+    business.lat = cached["lat"]
+    business.long = cached["long"]
+    business.geocode_status = GEOCODE_SUCCESS
+    return True
+
+class RateLimiter(object):
+    """thread safe limit on how many geocoder requests start per second"""
+
+    def __init__(self, max_rate):
+        self.interval = 1.0 / max_rate
+        self.__next_slot = 0.0
+        self.__lock = threading.Lock()
+
+    def wait(self):
+        """block until the caller may send its request"""
+        with self.__lock:
+            now = time()
+            slot = max(self.__next_slot, now)
+            self.__next_slot = slot + self.interval
+
+        if slot > now:
+            sleep(slot - now)
+
+def geocode_business(business, state = 'RI', timeout=60, rate_limiter=None):
     """geocode a business object and store the results inside it,
-    return confidence score"""
+    returns True if successful, businesses that were already geocoded are not queried again
+    and addresses already geocoded this run (or cached) are not sent to the geocoder again
+    (rate_limiter is only waited on when the geocoder is actually queried).
+    timeout is the longest a request may take, the actual timeout adapts to the server's latency.
+    If the geocoder keeps failing the business is marked deferred instead of being sent."""
 
-    # Sub "I" with "1" for numeric values.
-    business.zip = business.zip.replace("I", "1")
-    pattern = re.compile("(^|\s)([I0-9]+)(\s|$)")
-    matches = re.findall(pattern, business.address)
-    for _, match, _ in matches:
-        business.address = re.sub(match, match.replace("I", "1"),
-                                  business.address)
+    if business.geocode_status != GEOCODE_PENDING:
+        return business.geocode_status == GEOCODE_SUCCESS
 
-    try:
-        location = geolocator.geocode(street=business.address, city=business.city,
-                state=state, zip_cd=business.zip, n_matches = 1, timeout = timeout)
-    except:
-        location = None
-
-    if location:
-        match = location["candidates"][0]["attributes"]
-        business.confidence_score = float(match["score"])
-        business.lat = match["location"]["y"]
-        business.long = match["location"]["x"]
-        return True
+    if not business.address:
+        business.geocode_status = GEOCODE_NO_ADDRESS
+        return False
+
+    return _geocode(business, canonicalize(business, state), state, timeout, rate_limiter)
+
+def _geocode(business, key, state, timeout, rate_limiter):
+    """geocode_business for a business whose address was already canonicalized to key"""
+
+    known = _known_result(key)
+    if known is not None:
+        return _apply_cached(business, known)
+
+    if not breaker.allow_request():
+        business.geocode_status = GEOCODE_DEFERRED
+        _count('deferred')
+        return False
+
+    # probes of a recovering server get the full timeout so its new latency can be measured
+    if breaker.state == CircuitBreaker.HALF_OPEN:
+        request_timeout = timeout
     else:
+        request_timeout = latency.timeout(timeout)
+
+    if rate_limiter is not None:
+        rate_limiter.wait()
+
+    _count('requests')
+    start = time()
+
+    try:
+        location = get_geolocator().geocode(street=business.address, city=business.city,
+                state=state, zip_cd=business.zip, n_matches = 1, timeout = request_timeout)
+    except Exception as e:
+        _count('errors')
+        logger.debug("geocoder error for \"%s\": %s", business.address, e)
+
+        # a timed out request took at least its timeout, so a slowing server raises the next timeouts
+        if isinstance(e, GeocoderTimedOut):
+            latency.record(max(time() - start, request_timeout))
+
+        # errors are not remembered, the address will be tried again
+        if _is_server_failure(e):
+            breaker.record_failure()
+            business.geocode_status = GEOCODE_DEFERRED
+            _count('deferred')
+        else:
+            breaker.record_success()
+            business.geocode_status = GEOCODE_FAILED
         return False
+
+    latency.record(time() - start)
+    breaker.record_success()
+
+    return _apply_cached(business, _store_result(key, location["candidates"][0]["attributes"] if location else None))
+
+def geocode_businesses_concurrent(businesses, state = 'RI', timeout=60, max_in_flight=8, max_rate=0):
+    """
+    geocode a list of business objects with up to max_in_flight requests at once
+    and store the results inside them, businesses sharing a canonical address are sent once
+    :param max_rate: maximum number of requests started per second (0 for no limit)
+    :return: list of True/False (geocoded or not) in the same order as businesses
+    """
+
+    groups = group_by_address(businesses, state)
+
+    if groups:
+        rate_limiter = RateLimiter(max_rate) if max_rate > 0 else None
+
+        pool = ThreadPool(min(max_in_flight, len(groups)))
+        try:
+            pool.map(lambda (key, group): _geocode(group[0], key, state, timeout, rate_limiter),
+                     groups.iteritems(), chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+        _fan_out(groups)
+
+    return [business.geocode_status == GEOCODE_SUCCESS for business in businesses]
+
+def geocode_businesses_batch(businesses, state = 'RI', timeout=60):
+    """
+    geocode a list of business objects through the geocoder's batch endpoint
+    and store the results inside them, businesses that were already geocoded are not queried again
+    and businesses sharing a canonical address are sent once
+    :return: list of True/False (geocoded or not) in the same order as businesses
+    """
+
+    groups = group_by_address(businesses, state)
+    addresses = []
+    keys = {}
+
+    for key, group in groups.iteritems():
+        first = group[0]
+
+        known = _known_result(key)
+        if known is not None:
+            _apply_cached(first, known)
+            continue
+
+        uid = len(keys)
+        keys[uid] = key
+        addresses.append((uid, {'Street': first.address, 'City': first.city,
+                                'State': state, 'ZIP': first.zip}))
+
+    if addresses:
+        _geocode_batch(addresses, keys, groups, timeout)
+
+    _fan_out(groups)
+
+    return [business.geocode_status == GEOCODE_SUCCESS for business in businesses]
+
+def _store_batch_results(geocoded, keys, groups):
+    """store the batch results geocoded ({'uid':..., 'attributes':...}) in the first business of groups[keys[uid]]"""
+    for location in geocoded:
+        uid = location['uid']
+
+        # ignore ids we didn't send
+        if uid not in keys:
+            continue
+
+        _apply_cached(groups[keys[uid]][0], _store_result(keys[uid], location['attributes']))
+
+def _geocode_batch(addresses, keys, groups, timeout):
+    """send addresses (uid, address fields) to the batch endpoint and store the results in the first business of groups[keys[uid]]"""
+
+    if not breaker.allow_request():
+        for key in keys.itervalues():
+            groups[key][0].geocode_status = GEOCODE_DEFERRED
+        _count('deferred', len(keys))
+        return
+
+    _count('requests')
+
+    try:
+        response = get_geolocator().geocode_batch(addresses, timeout=timeout)
+    except Exception as e:
+        _count('errors')
+        logger.debug("geocoder error for batch of %d: %s", len(addresses), e)
+
+        # keep the results of the chunks geocoded before the error
+        _store_batch_results(getattr(e, 'geocoded', ()), keys, groups)
+        unanswered = [key for key in keys.itervalues() if groups[key][0].geocode_status == GEOCODE_PENDING]
+
+        # errors are not remembered, the unanswered addresses will be tried again
+        if _is_server_failure(e):
+            breaker.record_failure()
+            status = GEOCODE_DEFERRED
+            _count('deferred', len(unanswered))
+        else:
+            breaker.record_success()
+            status = GEOCODE_FAILED
+
+        for key in unanswered:
+            groups[key][0].geocode_status = status
+        return
+
+    breaker.record_success()
+
+    _store_batch_results(response['geocoded'], keys, groups)
+
+    # anything the geocoder didn't return a record for failed
+    for key in keys.itervalues():
+        if groups[key][0].geocode_status == GEOCODE_PENDING:
+            groups[key][0].geocode_status = GEOCODE_FAILED
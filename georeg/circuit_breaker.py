@@ -0,0 +1,138 @@
+"""
+Latency-aware timeouts and a circuit breaker for remote geocoder calls.
+"""
+
+import threading
+from collections import deque
+from time import time
+
+__all__ = ("LatencyTracker", "CircuitBreaker")
+
+class LatencyTracker(object):
+    """
+    Keeps the response times of recent requests and derives request timeouts
+    from them, so a slow or hung server is given up on after a multiple of its
+    usual tail latency rather than a fixed timeout. Timed out requests should be
+    recorded too (with the timeout they hit) so the timeouts grow when the server slows down
+    """
+
+    def __init__(self, window=200, percentile=99, multiplier=3.0, min_timeout=2.0, min_samples=20):
+        """
+        :param window: number of recent response times kept
+        :param percentile: percentile of the response times the timeout is based on
+        :param multiplier: timeout = multiplier * percentile response time
+        :param min_timeout: timeouts are never shorter than this (seconds)
+        :param min_samples: until this many responses are seen the caller's maximum timeout is used
+        """
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.min_timeout = min_timeout
+        self.min_samples = min_samples
+
+        self.__latencies = deque(maxlen=window)
+        self.__lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.__lock:
+            self.__latencies.append(seconds)
+
+    def latency_percentile(self, percentile=None):
+        """returns the given percentile of recent response times or None if there are none"""
+        with self.__lock:
+            latencies = sorted(self.__latencies)
+
+        if not latencies:
+            return None
+
+        percentile = self.percentile if percentile is None else percentile
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percentile / 100.0))]
+
+    def timeout(self, max_timeout):
+        """returns the timeout to use for the next request, at most max_timeout"""
+        with self.__lock:
+            enough_samples = len(self.__latencies) >= self.min_samples
+
+        if not enough_samples:
+            return max_timeout
+
+        return min(max_timeout, max(self.min_timeout, self.latency_percentile() * self.multiplier))
+
+class CircuitBreaker(object):
+    """
+    Stops requests to a failing server. After failure_threshold consecutive
+    failures the breaker opens and rejects requests for reset_timeout seconds,
+    then lets a single probe request through (half open). A successful probe
+    closes the breaker, a failed one opens it again for twice as long
+    (up to max_reset_timeout).
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, max_reset_timeout=300.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+
+        self.trips = 0 # number of times the breaker has opened
+        self.rejections = 0 # number of requests refused while open
+
+        self.__state = self.CLOSED
+        self.__failures = 0
+        self.__current_reset_timeout = reset_timeout
+        self.__opened_at = 0.0
+        self.__probe_in_flight = False
+        self.__lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self.__lock:
+            return self.__state
+
+    def allow_request(self):
+        """returns True if a request may be sent now (call record_success/record_failure afterwards)"""
+        with self.__lock:
+            if self.__state == self.OPEN and time() - self.__opened_at >= self.__current_reset_timeout:
+                self.__state = self.HALF_OPEN
+
+            if self.__state == self.CLOSED:
+                return True
+
+            if self.__state == self.HALF_OPEN and not self.__probe_in_flight:
+                self.__probe_in_flight = True
+                return True
+
+            self.rejections += 1
+            return False
+
+    def seconds_until_probe(self):
+        """returns how long until a probe request will be allowed (0 if requests are allowed now)"""
+        with self.__lock:
+            if self.__state != self.OPEN:
+                return 0.0
+            return max(0.0, self.__opened_at + self.__current_reset_timeout - time())
+
+    def record_success(self):
+        with self.__lock:
+            self.__failures = 0
+            self.__probe_in_flight = False
+            self.__state = self.CLOSED
+            self.__current_reset_timeout = self.reset_timeout
+
+    def record_failure(self):
+        with self.__lock:
+            self.__failures += 1
+
+            if self.__state == self.HALF_OPEN:
+                # the probe failed, wait longer before the next one
+                self.__probe_in_flight = False
+                self.__current_reset_timeout = min(self.__current_reset_timeout * 2, self.max_reset_timeout)
+                self.__open()
+            elif self.__state == self.CLOSED and self.__failures >= self.failure_threshold:
+                self.__open()
+
+    def __open(self):
+        self.__state = self.OPEN
+        self.__opened_at = time()
+        self.trips += 1
@@ -0,0 +1,198 @@
+"""
+Column layout of the pages of a registry volume.
+
+Every page of a volume has the same number of columns in nearly the same place, so
+rather than clustering the contours of every page from scratch a :class:`ColumnLayout`
+learns the column centers of the first few pages (with KMeans) and then assigns the
+contours of later pages to the nearest learnt column. A page is only clustered again
+(starting from the learnt columns, and from scratch if its columns still don't fit)
+when its columns are too far from the template.
+
+find_columns_by_projection is an alternative to clustering that finds the gutters
+between columns from the valleys of the page's vertical ink projection.
+"""
+
+import cv2
+import numpy as np
+from sklearn.cluster import KMeans
+
+__all__ = ("COLUMN_DETECTORS", "ColumnClustering", "ColumnLayout", "find_columns_by_projection")
+
+# engines of RegistryProcessor.column_detector
+COLUMN_DETECTORS = ("kmeans", "projection")
+
+class ColumnClustering(object):
+    """column assignments of a page's contours, with the same attributes as a fitted KMeans"""
+
+    def __init__(self, cluster_centers, labels, gutters=None):
+        """
+        :param cluster_centers: (columns, 2) array of the left and right x coordinates of the columns
+        :param labels: column of every contour
+        :param gutters: x coordinates of the gaps between the columns (if known)
+        """
+        self.cluster_centers_ = np.asarray(cluster_centers, dtype=np.float64)
+        self.labels_ = np.asarray(labels, dtype=np.int64)
+        self.gutters = gutters
+
+def _nearest_columns(coords, centers):
+    """ColumnClustering assigning every (left, right) in coords to its nearest center, with the centers recomputed"""
+    dists = ((coords[:, np.newaxis, :] - centers[np.newaxis, :, :]) ** 2).sum(axis=2)
+    labels = dists.argmin(axis=1)
+
+    counts = np.bincount(labels, minlength=len(centers)).astype(np.float64)
+    new_centers = centers.copy()
+    for dim in xrange(coords.shape[1]):
+        sums = np.bincount(labels, weights=coords[:, dim], minlength=len(centers))
+        new_centers[counts > 0, dim] = sums[counts > 0] / counts[counts > 0]
+
+    return ColumnClustering(new_centers, labels), counts
+
+class ColumnLayout(object):
+    """
+    column template of a volume, learnt from the first template_pages pages
+    (0 clusters every page from scratch)
+    """
+
+    def __init__(self, num_cols, template_pages=3, max_shift=0.25):
+        """
+        :param num_cols: columns of each image (columns per page * pages per image)
+        :param template_pages: number of pages the template is learnt from
+        :param max_shift: largest distance a page's column may be from the template's,
+                          as a fraction of the narrowest gap between template columns
+        """
+        self.num_cols = num_cols
+        self.template_pages = template_pages
+        self.max_shift = max_shift
+
+        self.template = None # (num_cols, 2) array of column centers sorted by left edge
+
+        # number of pages whose columns were found from the template, by clustering
+        # started from the template and by clustering from scratch
+        self.template_fits = 0
+        self.warm_starts = 0
+        self.full_clusterings = 0
+
+        self.__learnt = [] # sorted column centers of the pages the template is learnt from
+
+    def _fits(self, clustering, counts):
+        """whether every column has contours and is close enough to the template"""
+        if (counts == 0).any():
+            return False
+
+        lefts = self.template[:, 0]
+        if len(lefts) > 1:
+            spacing = np.diff(lefts).min()
+        else:
+            spacing = self.template[0, 1] - self.template[0, 0]
+
+        shift = np.abs(clustering.cluster_centers_ - self.template).max()
+        return shift <= self.max_shift * spacing
+
+    def _learn(self, clustering):
+        self.__learnt.append(np.array(sorted(clustering.cluster_centers_.tolist())))
+
+        if len(self.__learnt) >= self.template_pages:
+            self.template = np.mean(self.__learnt, axis=0)
+
+    def fit(self, coords):
+        """
+        find the columns of a page
+        :param coords: (contours, 2) array of the left and right x coordinates of the page's contours
+        :return: ColumnClustering (or fitted KMeans) of the page, with cluster_centers_ and labels_
+        """
+        coords = np.asarray(coords, dtype=np.float64)
+
+        if self.template is not None:
+            clustering, counts = _nearest_columns(coords, self.template)
+            if self._fits(clustering, counts):
+                self.template_fits += 1
+                return clustering
+
+            clustering = KMeans(n_clusters=self.num_cols, init=self.template, n_init=1).fit(coords)
+            if self._fits(clustering, np.bincount(clustering.labels_, minlength=self.num_cols)):
+                self.warm_starts += 1
+                return clustering
+
+        clustering = KMeans(n_clusters=self.num_cols).fit(coords)
+        self.full_clusterings += 1
+
+        if self.template is None and self.template_pages > 0:
+            self._learn(clustering)
+
+        return clustering
+
+def _valley(profile, start, end):
+    """
+    (first, last + 1) x of the run of lowest points of profile in [start, end), the run
+    is followed beyond the window so a wide gap is found whole
+    """
+    window = profile[start:end]
+    low = start + np.flatnonzero(window == window.min())[0]
+
+    first, last = low, low
+    while first > 0 and profile[first - 1] == profile[low]:
+        first -= 1
+    while last + 1 < len(profile) and profile[last + 1] == profile[low]:
+        last += 1
+
+    return first, last + 1
+
+def _gutters(profile, first, last, num_cols):
+    """
+    x of the gutters between num_cols columns of text from first to last, each at the
+    middle of the valley near where equal width columns would meet. A valley holding
+    several gutters is an empty column (or more), its gutters stay where equal columns
+    would meet (moved inside the valley)
+    """
+    # gutters are searched for within half a column of where equal columns would meet
+    col_width = (last - first) / float(num_cols)
+    expected = [int(first + i * col_width) for i in xrange(1, num_cols)]
+    valleys = [_valley(profile, int(x - col_width / 2), int(x + col_width / 2)) for x in expected]
+
+    gutters = []
+    for x, valley in zip(expected, valleys):
+        if valleys.count(valley) == 1:
+            gutters.append((valley[0] + valley[1] - 1) // 2)
+        else:
+            gutters.append(min(max(x, valley[0]), valley[1] - 1))
+    return gutters
+
+def find_columns_by_projection(thresh_image, coords, num_cols, smoothing=0.01):
+    """
+    find the columns of a page from the valleys of its vertical ink projection (the ink of
+    every x coordinate). The text is divided into num_cols roughly equal columns and the
+    gutter between each pair of neighbouring columns is the middle of the emptiest gap
+    near their border (see _gutters)
+    :param thresh_image: thresholded page (text is white)
+    :param coords: (contours, 2) array of the left and right x coordinates of the page's contours
+    :param num_cols: columns of the page (columns per page * pages per image)
+    :param smoothing: width of the window the projection is averaged over, as a fraction of the page's width
+    :return: ColumnClustering of the page, contours are in the column their middle is in,
+             columns without contours reach from gutter to gutter
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+
+    # ink of every column of pixels (cv2.reduce is several times faster than numpy's sum)
+    profile = cv2.reduce(thresh_image, 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S)[0] / 255
+
+    window = max(1, int(thresh_image.shape[1] * smoothing)) | 1
+    profile = np.convolve(profile, np.ones(window) / window, mode="same")
+
+    inked = np.flatnonzero(profile > 0)
+    if not len(inked):
+        raise RuntimeError("No text found on page, check debug images")
+    first, last = inked[0], inked[-1] + 1
+
+    gutters = _gutters(profile, first, last, num_cols)
+
+    labels = np.searchsorted(gutters, coords.mean(axis=1))
+
+    bounds = [first] + gutters + [last]
+    centers = np.array([[bounds[i], bounds[i + 1]] for i in xrange(num_cols)], dtype=np.float64)
+
+    counts = np.bincount(labels, minlength=num_cols)
+    for dim in xrange(2):
+        sums = np.bincount(labels, weights=coords[:, dim], minlength=num_cols)
+        centers[counts > 0, dim] = sums[counts > 0] / counts[counts > 0]
+
+    return ColumnClustering(centers, labels, gutters)
@@ -0,0 +1,207 @@
+"""
+Compiled binary format of :class:`.SpellChecker` dictionaries.
+
+A compiled dictionary is a header followed by flat arrays: the words' counts,
+the offsets of the words in a string table (words sorted by their utf-8 bytes,
+a word's id is its position), and the similar words graph in compressed sparse
+row form (indptr, neighbour ids and similarity scores). The file is mapped
+read-only instead of parsed, so loading takes milliseconds whatever the size of
+the dictionary and every process that maps the same file shares one copy of it
+in the page cache (words are read from the mapped string table when they are
+looked up, never copied into a list). A :class:`CompiledDictionary` pickles as
+its path, a worker process maps the file again instead of receiving a copy.
+"""
+
+import itertools
+import mmap
+import struct
+import numpy as np
+
+from token_graph import SimilarityGraph
+
+__all__ = ("CompiledDictionary", "write_compiled_dictionary")
+
+_MAGIC = "GEOREGD1"
+_VERSION = 1
+
+# magic, version, word count, link count, string table size, total occurrences, similarity thresh, similarity floor
+_HEADER = struct.Struct("<8sIxxxxQQQqdd")
+
+# start and end of a word in the string table (two neighbouring string_offsets)
+_WORD_BOUNDS = struct.Struct("<QQ")
+
+# (name, dtype, length as a function of (word count, link count, string table size)) in file order
+_SECTIONS = (
+    ("string_offsets", np.dtype("<u8"), lambda n, m, s: n + 1),
+    ("counts", np.dtype("<i8"), lambda n, m, s: n),
+    ("indptr", np.dtype("<u8"), lambda n, m, s: n + 1),
+    ("scores", np.dtype("<f8"), lambda n, m, s: m),
+    ("indices", np.dtype("<u4"), lambda n, m, s: m),
+    ("strings", np.dtype("u1"), lambda n, m, s: s),
+)
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+def _layout(n, m, s):
+    """list of (name, dtype, offset, length) of every section"""
+    layout = []
+    offset = _align(_HEADER.size)
+    for name, dtype, length in _SECTIONS:
+        count = length(n, m, s)
+        layout.append((name, dtype, offset, count))
+        offset = _align(offset + count * dtype.itemsize)
+    return layout
+
+def _encode(word):
+    return word.encode("utf-8") if isinstance(word, unicode) else word
+
+def write_compiled_dictionary(file_name, words, counts, links, similarity_thresh, similarity_floor, total_occurrences):
+    """
+    write a compiled dictionary
+    :param words: list of unique words
+    :param counts: list of the words' counts
+    :param links: (i, j, score) arrays of every pair of words[i] and words[j]
+                  at least similarity_floor similar (each pair once, in either order)
+    """
+    encoded = [_encode(w) for w in words]
+    order = sorted(xrange(len(encoded)), key=encoded.__getitem__)
+    new_id = np.empty(len(order), dtype=np.int64)
+    new_id[order] = np.arange(len(order))
+
+    strings = "".join(encoded[i] for i in order)
+    string_offsets = np.zeros(len(order) + 1, dtype="<u8")
+    string_offsets[1:] = np.cumsum([len(encoded[i]) for i in order])
+
+    # both directions of every link, grouped by source word
+    src, dst, link_scores = links
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    link_scores = np.asarray(link_scores, dtype="<f8")
+
+    src, dst = new_id[np.concatenate((src, dst))], new_id[np.concatenate((dst, src))]
+    link_scores = np.concatenate((link_scores, link_scores))
+
+    by_source = np.lexsort((dst, src))
+    indptr = np.zeros(len(order) + 1, dtype="<u8")
+    indptr[1:] = np.cumsum(np.bincount(src, minlength=len(order)))
+
+    arrays = {
+        "string_offsets": string_offsets,
+        "counts": np.asarray([counts[i] for i in order], dtype="<i8"),
+        "indptr": indptr,
+        "scores": link_scores[by_source],
+        "indices": dst[by_source].astype("<u4"),
+        "strings": np.frombuffer(strings, dtype="u1"),
+    }
+
+    with open(file_name, "wb") as file:
+        file.write(_HEADER.pack(_MAGIC, _VERSION, len(order), len(src), len(strings), total_occurrences,
+                                similarity_thresh, similarity_floor))
+
+        for name, dtype, offset, count in _layout(len(order), len(src), len(strings)):
+            file.write("\0" * (offset - file.tell()))
+            file.write(arrays[name].astype(dtype).tobytes())
+
+class _WordTable(object):
+    """sequence of a compiled dictionary's words by id, each read from the mapped file when it is accessed"""
+
+    __slots__ = ("_dictionary", "_len", "_map", "_offsets_start", "_strings_start")
+
+    def __init__(self, dictionary):
+        self._dictionary = dictionary
+        self._len = len(dictionary.counts)
+        self._map = dictionary._map
+        self._offsets_start = dictionary._string_offsets_start
+        self._strings_start = dictionary._strings_start
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, id):
+        if not 0 <= id < self._len: # negative ids and slices (which compare out of range) too
+            if isinstance(id, slice):
+                return [self[i] for i in xrange(*id.indices(self._len))]
+            if -self._len <= id < 0:
+                return self[id + self._len]
+            raise IndexError("word id out of range")
+
+        # unpacking the offsets from the map is several times faster than indexing string_offsets
+        start, end = _WORD_BOUNDS.unpack_from(self._map, self._offsets_start + 8 * id)
+        return self._map[self._strings_start + start:self._strings_start + end]
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self._blocks())
+
+    def _blocks(self, size=256):
+        """lists of the words, size at a time (slicing one str per block is much faster than slicing the map per word)"""
+        dictionary = self._dictionary
+        for block in xrange(0, self._len, size):
+            offsets = dictionary.string_offsets[block:block + size + 1]
+            strings = dictionary._map[dictionary._strings_start + int(offsets[0]):dictionary._strings_start + int(offsets[-1])]
+            bounds = (offsets - offsets[0]).tolist()
+            yield [strings[start:end] for start, end in itertools.izip(bounds, bounds[1:])]
+
+class CompiledDictionary(SimilarityGraph):
+    """
+    read-only view of a compiled dictionary file, the arrays are numpy views of the mapped file
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._open()
+
+    def _open(self):
+        with open(self.file_name, "rb") as file:
+            try:
+                self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError: # empty file
+                raise RuntimeError("dictionary file \"%s\" seems to be corrupt" % self.file_name)
+
+        try:
+            magic, version, n, m, s, total, thresh, floor = _HEADER.unpack_from(self._map)
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError()
+
+            offsets = {}
+            for name, dtype, offset, count in _layout(n, m, s):
+                setattr(self, name, np.frombuffer(self._map, dtype=dtype, count=count, offset=offset))
+                offsets[name] = offset
+            self._string_offsets_start = offsets["string_offsets"]
+            self._strings_start = offsets["strings"]
+        except (struct.error, ValueError):
+            self._map.close()
+            raise RuntimeError("dictionary file \"%s\" seems to be corrupt" % self.file_name)
+
+        self.total_occurrences = total
+        self.similarity_thresh = int(thresh) if thresh == int(thresh) else thresh
+        self.similarity_floor = int(floor) if floor == int(floor) else floor
+
+        self.words = _WordTable(self)
+        self._thresholded_cache = None
+
+    def __getstate__(self):
+        return {"file_name": self.file_name}
+
+    def __setstate__(self, state):
+        self.file_name = state["file_name"]
+        self._open()
+
+    def word(self, id):
+        """the word (a utf-8 str) with this id"""
+        return self.words[id]
+
+    def id_of(self, word):
+        """id of word or None if it isn't in the dictionary (a binary search of the sorted string table)"""
+        word = _encode(word)
+        lo, hi = 0, len(self.counts)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.word(mid) < word:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo < len(self.counts) and self.word(lo) == word:
+            return lo
+        return None
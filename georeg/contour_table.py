@@ -0,0 +1,174 @@
+"""
+Structure of arrays of the contours found on a registry image.
+
+A :class:`ContourTable` keeps every contour's bounding box, midpoint and column
+label as numpy columns and all of their points in one buffer (contour i's points
+are points[offsets[i]:offsets[i + 1]]), so filtering, offsetting and column
+assignment are single array operations instead of loops over contours and points.
+A :class:`Contour` is a lightweight view of one row of a table.
+"""
+
+import numpy as np
+
+__all__ = ("Contour", "ContourTable")
+
+class ContourTable(object):
+    """
+    contours with columns x, y, w, h, x_mid, y_mid and label (column of the contour, -1 if unassigned)
+    and their OCR text and font attributes
+    """
+
+    def __init__(self, contours=()):
+        """:param contours: list of cv2 contours (arrays of shape (points, 1, 2)), None for an empty contour"""
+        contours = [c if c is not None else np.zeros((0, 1, 2), np.int32) for c in contours]
+        n = len(contours)
+
+        self.offsets = np.zeros(n + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum([len(c) for c in contours])
+
+        nonempty = [c for c in contours if len(c)]
+        if nonempty:
+            self.points = np.concatenate(nonempty).astype(np.int32, copy=False)
+        else:
+            self.points = np.zeros((0, 1, 2), np.int32)
+
+        # bounding boxes (as cv2.boundingRect) of each contour's points
+        self.x = np.zeros(n, dtype=np.int64)
+        self.y = np.zeros(n, dtype=np.int64)
+        self.w = np.zeros(n, dtype=np.int64)
+        self.h = np.zeros(n, dtype=np.int64)
+
+        rows = np.flatnonzero(np.diff(self.offsets) > 0)
+        if len(rows):
+            starts = self.offsets[rows]
+            xs, ys = self.points[:, 0, 0], self.points[:, 0, 1]
+            self.x[rows] = np.minimum.reduceat(xs, starts)
+            self.y[rows] = np.minimum.reduceat(ys, starts)
+            self.w[rows] = np.maximum.reduceat(xs, starts) - self.x[rows] + 1
+            self.h[rows] = np.maximum.reduceat(ys, starts) - self.y[rows] + 1
+
+        self.x_mid = self.x + self.w // 2
+        self.y_mid = self.y + self.h // 2
+
+        self.labels = np.full(n, -1, dtype=np.int64)
+
+        self.text = [""] * n
+        self.font_attrs = [[] for _ in xrange(n)]
+
+    @classmethod
+    def from_contours(cls, contours):
+        """a table of contours, which may be a table already or a list of Contour objects"""
+        if isinstance(contours, ContourTable):
+            return contours
+
+        contours = list(contours)
+        if contours and all(c.table is contours[0].table for c in contours):
+            return contours[0].table.take([c.index for c in contours])
+
+        table = cls([c.data for c in contours])
+        for i, c in enumerate(contours):
+            table.text[i] = c.text
+            table.font_attrs[i] = c.font_attrs
+        return table
+
+    def __len__(self):
+        return len(self.x)
+
+    def __getitem__(self, index):
+        if not -len(self) <= index < len(self):
+            raise IndexError("contour index out of range")
+        return Contour(table=self, index=index % len(self))
+
+    def __iter__(self):
+        return (Contour(table=self, index=i) for i in xrange(len(self)))
+
+    def data(self, index):
+        """points of a contour (a view into the point buffer)"""
+        return self.points[self.offsets[index]:self.offsets[index + 1]]
+
+    def edges(self):
+        """(contours, 2) array of every contour's left and right x coordinates"""
+        return np.column_stack((self.x, self.x + self.w))
+
+    def bounding_rect(self):
+        """(x, y, w, h) bounding every contour"""
+        x, y = self.x.min(), self.y.min()
+        return int(x), int(y), int((self.x + self.w).max() - x), int((self.y + self.h).max() - y)
+
+    def take(self, indices):
+        """new table of the contours at indices (an index array or boolean mask)"""
+        indices = np.asarray(indices)
+        if indices.dtype == bool:
+            indices = np.flatnonzero(indices)
+        indices = indices.astype(np.int64)
+
+        table = ContourTable()
+
+        lengths = np.diff(self.offsets)[indices]
+        table.offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        table.offsets[1:] = np.cumsum(lengths)
+
+        # index of every point of the selected contours in our point buffer
+        point_index = np.arange(table.offsets[-1]) + np.repeat(self.offsets[:-1][indices] - table.offsets[:-1], lengths)
+        table.points = self.points[point_index]
+
+        for column in ("x", "y", "w", "h", "x_mid", "y_mid", "labels"):
+            setattr(table, column, getattr(self, column)[indices])
+
+        table.text = [self.text[i] for i in indices]
+        table.font_attrs = [self.font_attrs[i] for i in indices]
+        return table
+
+    def shift(self, dx, dy):
+        """move every contour (and its points) by (-dx, -dy)"""
+        self.points[:, 0, 0] -= dx
+        self.points[:, 0, 1] -= dy
+
+        self.x -= dx
+        self.x_mid -= dx
+        self.y -= dy
+        self.y_mid -= dy
+
+def _column_property(name):
+    def get(self):
+        return int(getattr(self.table, name)[self.index])
+
+    def set(self, value):
+        getattr(self.table, name)[self.index] = value
+
+    return property(get, set)
+
+def _list_property(name):
+    def get(self):
+        return getattr(self.table, name)[self.index]
+
+    def set(self, value):
+        getattr(self.table, name)[self.index] = value
+
+    return property(get, set)
+
+class Contour(object):
+    """a contour of a ContourTable, Contour(contour_data) makes a contour of its own one row table"""
+
+    __slots__ = ("table", "index")
+
+    def __init__(self, contour_data=None, table=None, index=0):
+        if table is None:
+            table = ContourTable([contour_data])
+        self.table = table
+        self.index = index
+
+    x = _column_property("x")
+    y = _column_property("y")
+    w = _column_property("w")
+    h = _column_property("h")
+    x_mid = _column_property("x_mid")
+    y_mid = _column_property("y_mid")
+    label = _column_property("labels")
+
+    text = _list_property("text")
+    font_attrs = _list_property("font_attrs")
+
+    @property
+    def data(self):
+        return self.table.data(self.index)
@@ -0,0 +1,100 @@
+"""
+Streaming, parallel token counting of text corpora for building :class:`.SpellChecker`
+dictionaries (see SpellChecker.add_common_tokens_from_files).
+
+Files are split into byte ranges at line boundaries, every worker process reads,
+tokenizes and counts one range at a time and the partial counts are merged as they
+arrive, so memory use depends on the chunk size and the number of distinct tokens
+rather than on the size of the corpus.
+"""
+
+import os
+import multiprocessing
+from collections import Counter
+
+__all__ = ("corpus_files", "count_tokens")
+
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+
+def corpus_files(paths):
+    """list of files in paths, directories are searched recursively (in sorted order)"""
+    if isinstance(paths, basestring):
+        paths = [paths]
+
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                files.extend(os.path.join(dirpath, fn) for fn in sorted(filenames))
+        else:
+            files.append(path)
+
+    return files
+
+def _ranges(files, chunk_size):
+    """(path, start, end) byte ranges of chunk_size covering every file"""
+    for path in files:
+        size = os.path.getsize(path)
+        for start in xrange(0, size, chunk_size):
+            yield path, start, min(start + chunk_size, size)
+
+def _read_range(path, start, end):
+    """text of the lines that start within [start, end) of a file"""
+    with open(path, "rb") as file:
+        if start > 0:
+            # skip the rest of a line starting before the range, it belongs to the previous range
+            file.seek(start - 1)
+            file.readline()
+
+        pos = file.tell()
+        if pos >= end:
+            return ""
+
+        text = file.read(end - pos)
+        if not text.endswith("\n"):
+            text += file.readline()
+
+        return text
+
+def _count_range(args):
+    path, start, end, tokenizer = args
+    return Counter(tokenizer(_read_range(path, start, end)))
+
+def count_tokens(paths, tokenizer, processes=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    count the tokens of text files
+    :param paths: file or directory or list of files and directories (see corpus_files)
+    :param tokenizer: function of text returning a list of tokens (i.e. spell_checker.tokenize),
+                      must be a module level function so it can be sent to worker processes
+    :param processes: number of processes to count with (default: one per cpu, 1 to count in this process)
+    :param chunk_size: approximate number of bytes tokenized at once by a process
+    :return: Counter of every token
+    """
+    ranges = ((path, start, end, tokenizer) for path, start, end in _ranges(corpus_files(paths), chunk_size))
+    counts = Counter()
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    if processes <= 1:
+        for args in ranges:
+            counts.update(_count_range(args))
+        return counts
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        # at most a few ranges per process are in flight so unmerged partial counts don't pile up
+        pending = []
+        for args in ranges:
+            pending.append(pool.apply_async(_count_range, (args, )))
+            if len(pending) >= processes * 2:
+                counts.update(pending.pop(0).get())
+
+        for result in pending:
+            counts.update(result.get())
+    finally:
+        pool.close()
+        pool.join()
+
+    return counts
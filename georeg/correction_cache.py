@@ -0,0 +1,69 @@
+"""
+Bounded in-memory cache of spelling corrections.
+"""
+
+import threading
+from collections import OrderedDict
+
+__all__ = ("CorrectionCache", )
+
+DEFAULT_CACHE_SIZE = 10000
+
+class CorrectionCache(object):
+    """
+    least recently used cache of :class:`.SpellChecker` lookups, OCR output repeats the
+    same misspellings many times so most lookups of a volume are answered from here.
+    Keys include the dictionary's version so a changed dictionary never answers from it.
+    Copies made for other processes start out empty.
+    """
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __getstate__(self):
+        return {"max_size": self.max_size}
+
+    def __setstate__(self, state):
+        self.__init__(state["max_size"])
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get(self, key, default=None):
+        """cached value of key or default, counts a hit or a miss"""
+        with self.__lock:
+            try:
+                value = self.__entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            # move to the most recently used end
+            self.__entries[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+
+        with self.__lock:
+            self.__entries.pop(key, None)
+            self.__entries[key] = value
+
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
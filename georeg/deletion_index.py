@@ -0,0 +1,81 @@
+"""
+Symmetric delete index (as in SymSpell), used by :class:`.SpellChecker` to find
+dictionary words within a small edit distance of a word with a few hash lookups.
+"""
+
+from Levenshtein import distance
+
+__all__ = ("DeletionIndex", )
+
+def _deletes(word, max_distance):
+    """set of every string made by deleting up to max_distance characters from word (including word)"""
+    variants = set([word])
+    frontier = [word]
+
+    for _ in xrange(max_distance):
+        next_frontier = []
+        for variant in frontier:
+            for i in xrange(len(variant)):
+                shorter = variant[:i] + variant[i + 1:]
+                if shorter not in variants:
+                    variants.add(shorter)
+                    next_frontier.append(shorter)
+        frontier = next_frontier
+
+    return variants
+
+class DeletionIndex(object):
+    """
+    Maps every variant of a word's first prefix_length characters with up to max_distance
+    characters deleted to the words it came from. Two words within edit distance
+    max_distance always share such a variant, so a lookup only needs the query's own
+    deletion variants to find every candidate, then checks their actual distance.
+    Only indexing the prefix keeps the index small for long words.
+    """
+
+    def __init__(self, max_distance=2, prefix_length=7):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+
+        self._variants = {} # variant -> [words]
+        self._values = {} # word -> value
+
+    def __len__(self):
+        return len(self._values)
+
+    def clear(self):
+        self._variants = {}
+        self._values = {}
+
+    def add(self, word, value):
+        """add word (stored as unicode) with an associated value, an existing word's value is replaced"""
+        word = unicode(word)
+
+        if word not in self._values:
+            for variant in _deletes(word[:self.prefix_length], self.max_distance):
+                self._variants.setdefault(variant, []).append(word)
+
+        self._values[word] = value
+
+    def lookup(self, word, max_distance=None):
+        """
+        returns a list of (distance, word, value) for every word within max_distance
+        (at most the index's max_distance) of word
+        """
+        word = unicode(word)
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+
+        candidates = set()
+        for variant in _deletes(word[:self.prefix_length], max_distance):
+            candidates.update(self._variants.get(variant, ()))
+
+        results = []
+        for candidate in candidates:
+            if abs(len(candidate) - len(word)) > max_distance:
+                continue
+
+            d = distance(word, candidate)
+            if d <= max_distance:
+                results.append((d, candidate, self._values[candidate]))
+
+        return results
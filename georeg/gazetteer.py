@@ -0,0 +1,193 @@
+"""
+Compiled per-state index of city names used to recognize the cities of registry entries
+and headers.
+
+A :class:`Gazetteer` is built from ``data/<STATE>-cities.txt`` (one city per line) and,
+when it exists, ``data/<STATE>-zips.txt`` (``zip<TAB>city`` per line). It holds a hash
+of every city's canonical name for exact matches, an index of the cities' character
+trigrams to find the few candidates of a misspelled name, and a ZIP to city table.
+Compiled gazetteers are cached on disk and rebuilt when their data files change, and
+load_gazetteer only loads each state once per process.
+"""
+
+import os
+import cPickle as pickle
+from collections import defaultdict
+
+import georeg
+from address_canonicalizer import canonical_place
+from spell_checker import ratio
+
+__all__ = ("Gazetteer", "build_gazetteer", "load_gazetteer")
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".georeg", "gazetteer")
+
+_CACHE_VERSION = 1
+
+# gazetteers loaded by this process, by state
+_loaded = {}
+
+def _trigrams(name):
+    padded = "  %s " % name
+    return set(padded[i:i + 3] for i in xrange(len(padded) - 2))
+
+class Gazetteer(object):
+    """cities of a state, matched by canonical name (see canonical_place)"""
+
+    def __init__(self, state, cities, zips=()):
+        """
+        :param cities: list of city names
+        :param zips: list of (zip, city name)
+        """
+        self.state = state
+        self.cities = []
+
+        self._exact = {} # canonical name -> city id
+        self._trigrams = defaultdict(list) # trigram -> [city ids]
+        self._zips = {} # zip -> city id
+
+        for city in cities:
+            self._add_city(city)
+
+        for zip, city in zips:
+            self._zips[zip.strip()] = self._add_city(city)
+
+        self._trigrams = dict(self._trigrams)
+
+    def _add_city(self, city):
+        city = city.strip()
+        key = canonical_place(city)
+
+        id = self._exact.get(key)
+        if id is None:
+            id = len(self.cities)
+            self.cities.append(city)
+            self._exact[key] = id
+
+            for trigram in _trigrams(key):
+                self._trigrams[trigram].append(id)
+
+        return id
+
+    def __len__(self):
+        return len(self.cities)
+
+    def lookup(self, name):
+        """city name exactly matching name (ignoring case, punctuation and spacing) or None"""
+        id = self._exact.get(canonical_place(name))
+        return self.cities[id] if id is not None else None
+
+    def city_for_zip(self, zip):
+        """city name of a ZIP code or None if it isn't known"""
+        id = self._zips.get((zip or "").strip()[:5])
+        return self.cities[id] if id is not None else None
+
+    def candidates(self, name, max_candidates=10):
+        """ids of the cities sharing the most trigrams with the canonical name"""
+        shared = defaultdict(int)
+        for trigram in _trigrams(name):
+            for id in self._trigrams.get(trigram, ()):
+                shared[id] += 1
+
+        return sorted(shared, key=lambda id: (-shared[id], id))[:max_candidates]
+
+    def match(self, line, cutoff=60):
+        """
+        the city named by line or None if no city is at least cutoff similar (see spell_checker.ratio),
+        a trailing "-continued" (of headers repeated on the next page) is ignored
+        """
+        key = canonical_place(line)
+
+        id = self._exact.get(key)
+        if id is not None:
+            return self.cities[id]
+
+        words = key.split(" ")
+        if len(words) > 1 and ratio(words[-1], "CONTINUED") > cutoff:
+            key = " ".join(words[:-1])
+
+            id = self._exact.get(key)
+            if id is not None:
+                return self.cities[id]
+
+        if not key:
+            return None
+
+        best_score, best_id = 0, None
+        for id in self.candidates(key):
+            score = ratio(key, canonical_place(self.cities[id]))
+            if score > best_score:
+                best_score, best_id = score, id
+
+        if best_score >= cutoff:
+            return self.cities[best_id]
+        return None
+
+def _data_files(state, data_dir):
+    return [os.path.join(data_dir, "%s-cities.txt" % state), os.path.join(data_dir, "%s-zips.txt" % state)]
+
+def _signature(paths):
+    """(path, size, modification time) of every existing file in paths"""
+    return [(p, os.path.getsize(p), os.path.getmtime(p)) for p in paths if os.path.exists(p)]
+
+def build_gazetteer(state, data_dir=None):
+    """build the gazetteer of a state from its data files"""
+    data_dir = data_dir or os.path.join(georeg.__path__[0], "data")
+    cities_path, zips_path = _data_files(state, data_dir)
+
+    with open(cities_path) as file:
+        cities = [line.strip() for line in file if line.strip()]
+
+    zips = []
+    if os.path.exists(zips_path):
+        with open(zips_path) as file:
+            for line in file:
+                fields = line.rstrip("\r\n").split("\t")
+                if len(fields) >= 2 and fields[0].strip():
+                    zips.append((fields[0], fields[1]))
+
+    return Gazetteer(state, cities, zips)
+
+def load_gazetteer(state, data_dir=None, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    the gazetteer of a state, from this process' memory, the on-disk cache
+    (if it is up to date with the data files) or built from the data files
+    :param cache_dir: directory of compiled gazetteers, None to not cache on disk
+    """
+    data_dir = data_dir or os.path.join(georeg.__path__[0], "data")
+    signature = _signature(_data_files(state, data_dir))
+
+    loaded = _loaded.get(state)
+    if loaded is not None and loaded[0] == signature:
+        return loaded[1]
+
+    gazetteer = None
+    cache_path = os.path.join(cache_dir, "%s.pickle" % state) if cache_dir else None
+
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path, "rb") as file:
+                version, cached_signature, cached = pickle.load(file)
+            if version == _CACHE_VERSION and cached_signature == signature:
+                gazetteer = cached
+        except Exception: # unreadable cache, rebuild it
+            gazetteer = None
+
+    if gazetteer is None:
+        gazetteer = build_gazetteer(state, data_dir)
+
+        if cache_path:
+            try:
+                if not os.path.isdir(cache_dir):
+                    os.makedirs(cache_dir)
+
+                # write to a temporary file first so other processes never read a partial cache
+                tmp_path = "%s.%d" % (cache_path, os.getpid())
+                with open(tmp_path, "wb") as file:
+                    pickle.dump((_CACHE_VERSION, signature, gazetteer), file, pickle.HIGHEST_PROTOCOL)
+                os.rename(tmp_path, cache_path)
+            except (IOError, OSError): # the cache is only an optimization
+                pass
+
+    _loaded[state] = (signature, gazetteer)
+    return gazetteer
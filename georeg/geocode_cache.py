@@ -0,0 +1,117 @@
+"""
+Persistent on-disk cache of geocoder results.
+"""
+
+import os
+import sqlite3
+import threading
+from time import time
+
+__all__ = ("GeocodeCache", )
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".georeg", "geocode_cache.sqlite")
+DEFAULT_NEGATIVE_TTL = 30 * 24 * 60 * 60 # failed lookups are retried after 30 days
+DEFAULT_BACKEND = "BrownArcGIS" # backend of the results of caches made before results were kept per backend
+
+class GeocodeCache(object):
+    """
+    sqlite backed cache of geocoder results keyed by canonical (street, city, state, zip)
+    (see :func:`.canonical_key`) and the name of the backend that geocoded them (so
+    results of different backends are never mixed), addresses the geocoder could not
+    find are remembered for negative_ttl seconds so they aren't queried every run
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, negative_ttl=DEFAULT_NEGATIVE_TTL):
+        self.path = path
+        self.negative_ttl = negative_ttl
+
+        self.hits = 0
+        self.misses = 0
+
+        self.__conn = None
+        self.__conn_pid = None
+
+        # one connection is shared by all threads of a process, serialized by this lock
+        self.__lock = threading.Lock()
+
+    def _connection(self):
+        # sqlite connections must not be shared with forked subprocesses,
+        # so every process opens its own connection on first use
+        if self.__conn is None or self.__conn_pid != os.getpid():
+            dirname = os.path.dirname(self.path)
+            if dirname and not os.path.exists(dirname):
+                try:
+                    os.makedirs(dirname)
+                except OSError: # another process may have created it first
+                    if not os.path.isdir(dirname):
+                        raise
+
+            self.__conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            self.__conn.execute("PRAGMA journal_mode=WAL")
+            self.__conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocode_results ("
+                "backend TEXT, street TEXT, city TEXT, state TEXT, zip TEXT, "
+                "found INTEGER, score REAL, lat REAL, long REAL, match_addr TEXT, "
+                "updated REAL, PRIMARY KEY (backend, street, city, state, zip))")
+
+            # results of caches without a backend column came from the default backend
+            if self.__conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='geocodes'").fetchone():
+                self.__conn.execute("INSERT OR IGNORE INTO geocode_results SELECT ?, * FROM geocodes", (DEFAULT_BACKEND,))
+                self.__conn.execute("DROP TABLE geocodes")
+
+            self.__conn.commit()
+            self.__conn_pid = os.getpid()
+
+        return self.__conn
+
+    def get(self, key, backend=DEFAULT_BACKEND):
+        """
+        look up a canonical address key geocoded by backend (see :attr:`.GeocoderBackend.cache_name`)
+        :return: None on a miss (or an expired negative entry), otherwise a dict with
+                 'found' and, if found, 'score', 'lat', 'long' and 'match_addr'
+        """
+        with self.__lock:
+            row = self._connection().execute(
+                "SELECT found, score, lat, long, match_addr, updated FROM geocode_results "
+                "WHERE backend=? AND street=? AND city=? AND state=? AND zip=?", (backend,) + tuple(key)).fetchone()
+
+            if row is None or (not row[0] and time() - row[5] > self.negative_ttl):
+                self.misses += 1
+                return None
+
+            self.hits += 1
+
+        if not row[0]:
+            return {'found': False}
+
+        return {'found': True, 'score': row[1], 'lat': row[2], 'long': row[3], 'match_addr': row[4]}
+
+    def put(self, key, score, lat, long, match_addr, backend=DEFAULT_BACKEND):
+        """record a successful geocode of key by backend"""
+        with self.__lock:
+            conn = self._connection()
+            conn.execute("INSERT OR REPLACE INTO geocode_results VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?, ?, ?)",
+                         (backend,) + tuple(key) + (score, lat, long, match_addr, time()))
+            conn.commit()
+
+    def put_negative(self, key, backend=DEFAULT_BACKEND):
+        """record that backend returned no match for key"""
+        with self.__lock:
+            conn = self._connection()
+            conn.execute("INSERT OR REPLACE INTO geocode_results VALUES (?, ?, ?, ?, ?, 0, NULL, NULL, NULL, NULL, ?)",
+                         (backend,) + tuple(key) + (time(),))
+            conn.commit()
+
+    def clear(self):
+        """delete every cached result"""
+        with self.__lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM geocode_results")
+            conn.commit()
+
+    def close(self):
+        with self.__lock:
+            if self.__conn is not None and self.__conn_pid == os.getpid():
+                self.__conn.close()
+            self.__conn = None
+            self.__conn_pid = None
@@ -0,0 +1,251 @@
+"""
+Geocoder backends usable by :mod:`georeg.business_geocoder`.
+
+A backend is any object with the ``geocode`` and ``geocode_batch`` methods of
+:class:`.GeocoderBackend`, :class:`.BrownArcGIS` is the default (remote) backend
+and :class:`.OfflineGeocoder` answers queries from a local address file.
+"""
+
+import csv
+import os
+import re
+from bisect import bisect_right
+from geopy.exc import ConfigurationError
+from address_canonicalizer import canonical_street, canonical_place
+
+__all__ = ("GeocoderBackend", "OfflineGeocoder")
+
+class GeocoderBackend(object):
+    """interface shared by all geocoder backends"""
+
+    @property
+    def cache_name(self):
+        """
+        name the backend's results are cached under (see :class:`.GeocodeCache`), backends
+        answering differently (i.e. from different files) must have different names
+        """
+        return self.__class__.__name__
+
+    def geocode(self, query='', street='', city='', state='', zip_cd='',
+                n_matches=1, timeout=None):
+        """
+        Return a ranked list of locations for an address in the form
+        {'candidates': [{'candidate': n, 'attributes': {'score': ..., 'match_addr': ...,
+        'location': {'x': long, 'y': lat}}}, ...]} or None if nothing matched.
+        (see :meth:`.BrownArcGIS.geocode` for the parameters)
+        """
+        raise NotImplementedError
+
+    def geocode_batch(self, addresses, timeout=None):
+        """
+        Geocode a list of (uid, address) tuples, returning the top match for each as
+        {'geocoded': [{'uid': uid, 'attributes': {...} or None}, ...]}
+        (see :meth:`.BrownArcGIS.geocode_batch` for the parameters),
+        exceptions carry the results of the addresses geocoded before them as their geocoded attribute
+        """
+        geocoded = []
+        for uid, address in addresses:
+            try:
+                if isinstance(address, dict):
+                    location = self.geocode(street=address.get('Street', ''), city=address.get('City', ''),
+                                            state=address.get('State', ''), zip_cd=address.get('ZIP', ''),
+                                            timeout=timeout)
+                else:
+                    location = self.geocode(query=address, timeout=timeout)
+            except Exception as e:
+                e.geocoded = geocoded
+                raise
+
+            geocoded.append({'uid': uid,
+                             'attributes': location['candidates'][0]['attributes'] if location else None})
+
+        return {'geocoded': geocoded}
+
+_house_number_pattern = re.compile(r"^\s*(\d+)[A-Z]?\s+(.*)$")
+
+class OfflineGeocoder(GeocoderBackend):
+    """
+    Geocodes from a local csv file of address points or street segments, no network needed.
+
+    The file must have a header row. Address point files have the columns
+    number, street, city, state, zip, lat, long
+    and street segment files have the columns
+    from_number, to_number, street, city, state, zip, from_lat, from_long, to_lat, to_long
+    (house numbers within a segment are linearly interpolated).
+
+    Streets are indexed by name and, for each zip code, by house number range,
+    so a lookup is a couple of dict lookups and a binary search.
+
+    Addresses only matched to their street (the house number is missing or outside
+    every known range) score well below address matches, so they can be told apart
+    from them by their confidence score or dropped with min_score.
+    """
+
+    # scores given to different kinds of matches
+    exact_score = 100.0 # house number inside a segment of the street in the same zip
+    city_score = 90.0 # house number inside a segment of the street in the same city
+    nearest_score = 50.0 # street found but the house number is outside every known range (nearest end used)
+    street_score = 40.0 # street found but the address has no house number (middle of the street used)
+
+    def __init__(self, path, min_score=0):
+        """
+        :param path: csv of address points or street segments
+        :param min_score: matches scoring lower than this are not found
+        """
+        self.path = path
+        self.min_score = min_score
+
+        # parallel lists, one entry per segment
+        self._from_numbers = []
+        self._to_numbers = []
+        self._streets = []
+        self._cities = []
+        self._states = []
+        self._zips = []
+        self._coords = [] # (from_lat, from_long, to_lat, to_long)
+
+        self._street_index = {} # street -> [segment ids]
+        self._range_index = {} # (zip, street) -> ([sorted range starts], [segment ids])
+
+        self._load(path)
+
+    def __len__(self):
+        return len(self._streets)
+
+    @property
+    def cache_name(self):
+        return "%s:%s:%g" % (self.__class__.__name__, os.path.abspath(self.path), self.min_score)
+
+    def _load(self, path):
+        with open(path, "r") as file:
+            reader = csv.DictReader(file)
+
+            for row in reader:
+                if 'number' in row:
+                    lo = hi = int(row['number'])
+                    coords = (float(row['lat']), float(row['long'])) * 2
+                else:
+                    lo, hi = int(row['from_number']), int(row['to_number'])
+                    coords = (float(row['from_lat']), float(row['from_long']),
+                              float(row['to_lat']), float(row['to_long']))
+
+                    if lo > hi:
+                        lo, hi = hi, lo
+                        coords = coords[2:] + coords[:2]
+
+                segment_id = len(self._streets)
+
+                self._from_numbers.append(lo)
+                self._to_numbers.append(hi)
+                self._streets.append(canonical_street(row['street']))
+                self._cities.append(canonical_place(row.get('city')))
+                self._states.append(canonical_place(row.get('state')))
+                self._zips.append((row.get('zip') or "").strip()[:5])
+                self._coords.append(coords)
+
+                self._street_index.setdefault(self._streets[segment_id], []).append(segment_id)
+
+        # build per-zip house number range index
+        ranges = {}
+        for segment_id, street in enumerate(self._streets):
+            ranges.setdefault((self._zips[segment_id], street), []).append(segment_id)
+
+        for key, segment_ids in ranges.iteritems():
+            segment_ids.sort(key=lambda i: self._from_numbers[i])
+            self._range_index[key] = ([self._from_numbers[i] for i in segment_ids], segment_ids)
+
+    def _find_in_ranges(self, starts, segment_ids, number):
+        """returns the id of a segment whose range contains number or None"""
+        # segments are sorted by start, so only those starting at or before number can contain it,
+        # a few are checked because odd/even sides of a street may have overlapping ranges
+        end = bisect_right(starts, number)
+        for pos in xrange(end - 1, max(end - 4, 0) - 1, -1):
+            segment_id = segment_ids[pos]
+            if self._to_numbers[segment_id] >= number:
+                return segment_id
+        return None
+
+    def _nearest(self, segment_ids, number):
+        return min(segment_ids, key=lambda i: min(abs(self._from_numbers[i] - number),
+                                                  abs(self._to_numbers[i] - number)))
+
+    def _interpolate(self, segment_id, number):
+        lo, hi = self._from_numbers[segment_id], self._to_numbers[segment_id]
+        from_lat, from_long, to_lat, to_long = self._coords[segment_id]
+
+        number = min(max(number, lo), hi)
+        t = (number - lo) * 1.0 / (hi - lo) if hi > lo else 0.0
+
+        return from_lat + (to_lat - from_lat) * t, from_long + (to_long - from_long) * t
+
+    def _locate(self, street, city, state, zip_cd):
+        """returns (segment id, house number, score) or None"""
+        match = _house_number_pattern.match(street.upper())
+        if match:
+            number, street = int(match.group(1)), match.group(2)
+        else:
+            number = None
+
+        street = canonical_street(street)
+        city = canonical_place(city)
+        state = canonical_place(state)
+        zip_cd = (zip_cd or "").strip()[:5]
+
+        candidates = self._street_index.get(street)
+        if not candidates:
+            return None
+
+        if state:
+            candidates = [i for i in candidates if not self._states[i] or self._states[i] == state]
+            if not candidates:
+                return None
+
+        if number is None:
+            # no house number, use the middle of the street's first segment
+            segment_id = candidates[0]
+            return segment_id, (self._from_numbers[segment_id] + self._to_numbers[segment_id]) / 2, self.street_score
+
+        if zip_cd and (zip_cd, street) in self._range_index:
+            starts, segment_ids = self._range_index[(zip_cd, street)]
+            segment_id = self._find_in_ranges(starts, segment_ids, number)
+            if segment_id is not None:
+                return segment_id, number, self.exact_score
+
+        if city:
+            in_city = [i for i in candidates if self._cities[i] == city]
+            for segment_id in in_city:
+                if self._from_numbers[segment_id] <= number <= self._to_numbers[segment_id]:
+                    return segment_id, number, self.city_score
+            if in_city:
+                candidates = in_city
+
+        return self._nearest(candidates, number), number, self.nearest_score
+
+    def geocode(self, query='', street='', city='', state='', zip_cd='',
+                n_matches=1, timeout=None):
+        """
+        Return the best match for an address (see :meth:`GeocoderBackend.geocode`),
+        single line queries are treated as the street.
+        """
+
+        if not (len(query) or len(street)):
+            raise ConfigurationError(
+                "Street or Full Address must be entered."
+            )
+
+        located = self._locate(street or query, city, state, zip_cd)
+        if located is None or located[2] < self.min_score:
+            return None
+
+        segment_id, number, score = located
+        lat, long = self._interpolate(segment_id, number)
+
+        match_addr = "%d %s, %s, %s, %s" % (number, self._streets[segment_id], self._cities[segment_id],
+                                             self._states[segment_id], self._zips[segment_id])
+
+        return {'candidates': [{
+            'candidate': 1,
+            'attributes': {
+                'score': score,
+                'match_addr': match_addr,
+                'location': {'x': long, 'y': lat}}}]}
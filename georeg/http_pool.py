@@ -0,0 +1,142 @@
+"""
+Keep-alive HTTP connection pool used by :class:`.BrownArcGIS`.
+"""
+
+import httplib
+import os
+import socket
+import threading
+import Queue
+from urlparse import urlsplit
+
+__all__ = ("HTTPConnectionPool", "HTTPResponse")
+
+DEFAULT_POOL_SIZE = 10
+
+class HTTPResponse(object):
+    """status code, headers and fully read body of a response"""
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def getcode(self):
+        return self.status
+
+    def read(self):
+        return self.body
+
+class HTTPConnectionPool(object):
+    """
+    Thread safe pool of persistent connections, one sub-pool per (scheme, host, port).
+    At most maxsize connections are open to each host, threads wait for a free
+    connection when they are all in use. Connections are never shared with
+    forked subprocesses, each process opens its own.
+    """
+
+    def __init__(self, maxsize=DEFAULT_POOL_SIZE):
+        self.maxsize = maxsize
+
+        self.__lock = threading.Lock()
+        self.__pools = {}
+        self.__pid = os.getpid()
+
+    def _host_pool(self, scheme, host, port):
+        with self.__lock:
+            # forked processes start with empty pools
+            if self.__pid != os.getpid():
+                self.__pools = {}
+                self.__pid = os.getpid()
+
+            key = (scheme, host, port)
+            if key not in self.__pools:
+                # None placeholders are replaced by real connections when first used
+                pool = Queue.LifoQueue(self.maxsize)
+                for _ in xrange(self.maxsize):
+                    pool.put(None)
+                self.__pools[key] = pool
+
+            return self.__pools[key]
+
+    @staticmethod
+    def _new_connection(scheme, host, port, timeout):
+        if scheme == 'https':
+            return httplib.HTTPSConnection(host, port, timeout=timeout)
+        return httplib.HTTPConnection(host, port, timeout=timeout)
+
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        """
+        Send a request over a pooled connection
+        :param method: 'GET' or 'POST'
+        :param url: absolute url
+        :param body: request body (for POST)
+        :param headers: dict of request headers
+        :param timeout: socket timeout in seconds
+        :return: :class:`HTTPResponse`
+        """
+
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        headers = dict(headers or {})
+        if body is not None and 'Content-Type' not in headers:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        pool = self._host_pool(parts.scheme, parts.hostname, parts.port)
+        conn = pool.get()
+
+        try:
+            # a kept-alive connection may have been closed by the server while idle,
+            # in that case the request is retried once on a new connection
+            for attempt in (0, 1):
+                reused = conn is not None
+                if conn is None:
+                    conn = self._new_connection(parts.scheme, parts.hostname, parts.port, timeout)
+                else:
+                    conn.timeout = timeout
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout)
+
+                try:
+                    conn.request(method, path, body, headers)
+                    response = conn.getresponse()
+                    data = response.read()
+                except socket.timeout:
+                    raise
+                except (httplib.HTTPException, socket.error):
+                    conn.close()
+                    conn = None
+                    if reused and attempt == 0:
+                        continue
+                    raise
+
+                if response.will_close:
+                    conn.close()
+                    conn = None
+
+                return HTTPResponse(response.status, dict(response.getheaders()), data)
+        except:
+            if conn is not None:
+                conn.close()
+                conn = None
+            raise
+        finally:
+            pool.put(conn)
+
+    def clear(self):
+        """close every idle connection"""
+        with self.__lock:
+            pools = self.__pools.values()
+            self.__pools = {}
+
+        for pool in pools:
+            while True:
+                try:
+                    conn = pool.get_nowait()
+                except Queue.Empty:
+                    break
+                if conn is not None:
+                    conn.close()
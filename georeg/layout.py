@@ -0,0 +1,132 @@
+"""
+Detection of the text blocks (contours) of a thresholded registry page.
+
+Blocks are found by closing the gaps between letters and opening away noise.
+On high resolution scans these morphology operations are among the slowest
+steps of processing a page, with a scale below 1 they run on a downsampled
+copy of the page (with the close and open scaled to match along each axis) and the
+contours found there are mapped back to full resolution for OCR.
+"""
+
+import cv2
+import numpy as np
+
+__all__ = ("downsample_factor", "find_text_contours", "max_downsample_factor", "scaled_morphology")
+
+def downsample_factor(scale):
+    """
+    integer factor pages are downsampled by for a layout scale, every factor x factor
+    block of pixels becomes one pixel so scale is rounded to 1 / factor
+    """
+    if scale <= 0 or scale >= 1:
+        return 1
+    return max(1, int(round(1.0 / scale)))
+
+def _reaches(kernel_shape, iterations):
+    """(x, y) pixels the close and the open of kernel_shape and iterations span"""
+    close = np.array([iterations * (k - 1) for k in kernel_shape])
+    open_ = np.array([(iterations / 3) * (k - 1) for k in kernel_shape])
+    return close, open_
+
+def max_downsample_factor(kernel_shape, iterations):
+    """
+    largest factor blocks can be found on a downsampled page by without their edges moving
+    too far: downsampling blurs edges by up to factor - 1 pixels, which is kept to an eighth
+    of the shortest reach of the close (pages are processed at full resolution beyond it)
+    """
+    close, _ = _reaches(kernel_shape, iterations)
+    close = close[close > 0]
+    if not len(close):
+        return 1
+    return max(1, int(close.min()) // 8 + 1)
+
+def scaled_morphology(kernel_shape, iterations, factor):
+    """
+    (close kernel shape, open kernel shape), each applied once, on an image downsampled
+    by factor that close and open the same gaps on both axes as kernel_shape and iterations
+    at full resolution. A close spans iterations * (kernel size - 1) pixels along each axis
+    and downsampling narrows gaps by about factor - 1 pixels, the scaled close is rounded
+    down (so lines just too far apart stay apart) and the scaled open to the nearest pixel
+    """
+    close, open_ = _reaches(kernel_shape, iterations)
+
+    small_close = np.maximum(0, np.floor((close + 1) / float(factor) - 1)).astype(int)
+    small_open = np.floor(open_ / float(factor) + 0.5).astype(int)
+
+    return tuple(small_close + 1), tuple(small_open + 1)
+
+def _anchor_shift(close_shape, close_iterations, open_shape, open_iterations):
+    """
+    (x, y) pixels _close_and_open moves blocks by, every dilation and erosion
+    with an even sized kernel moves them by half a pixel
+    """
+    return np.array([(close_iterations if c % 2 == 0 else 0) + (open_iterations if o % 2 == 0 else 0)
+                     for c, o in zip(close_shape, open_shape)])
+
+def _close_and_open(thresh_image, close_shape, close_iterations, open_shape, open_iterations):
+    # close operation to fill contours
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, tuple(close_shape))
+    closed = cv2.morphologyEx(thresh_image, cv2.MORPH_CLOSE, kernel, iterations = close_iterations)
+
+    # perform an open operation to remove noise
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, tuple(open_shape))
+    closed = cv2.morphologyEx(closed, cv2.MORPH_OPEN, kernel, iterations = open_iterations)
+
+    # contour data is the second to last element (of 3 in OpenCV 3, 2 in OpenCV 4)
+    return cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
+
+def _downsample(thresh_image, factor):
+    """image with a pixel for every factor x factor block, the block's brightest pixel (any ink is ink)"""
+    height, width = thresh_image.shape[:2]
+
+    # pad to whole blocks so resize averages exact blocks (its fast path for integer factors)
+    padded = cv2.copyMakeBorder(thresh_image, 0, -height % factor, 0, -width % factor, cv2.BORDER_CONSTANT, value=0)
+    small = cv2.resize(padded, (padded.shape[1] // factor, padded.shape[0] // factor), interpolation=cv2.INTER_AREA)
+
+    return cv2.threshold(small, 0, 255, cv2.THRESH_BINARY)[1]
+
+def _upscale_contours(contours, factor, offset, small_shape, full_shape):
+    """
+    map contours found on an image downsampled by factor to full resolution, points are
+    moved to the center of their block and by offset, points on the (ignored) 1 pixel border
+    of the small image stay on the border so blocks touching the edges still touch them
+    """
+    contours = list(contours)
+    if not contours:
+        return contours
+
+    small_last = np.array([small_shape[1], small_shape[0]]) - 2 # (x, y) of the last pixels findContours returns
+    full_last = np.array([full_shape[1], full_shape[0]]) - 2
+
+    lengths = [len(c) for c in contours]
+    small_points = np.concatenate(contours).astype(np.int64)
+
+    points = np.clip(small_points * factor + (factor - 1) / 2 + offset, 1, full_last)
+    points = np.where(small_points <= 1, 1, points)
+    points = np.where(small_points >= small_last, full_last, points)
+
+    return np.split(points.astype(np.int32), np.cumsum(lengths)[:-1])
+
+def find_text_contours(thresh_image, kernel_shape, iterations, scale=1.0):
+    """
+    contours of the blocks of text of a thresholded (text is white) image
+    :param kernel_shape: (x, y) size of the close and open kernel (at full resolution)
+    :param iterations: iterations of the close operation (the open runs a third as many)
+    :param scale: scale of the image the blocks are found on (see downsample_factor),
+                  contours are always returned at full resolution
+    :return: list of cv2 contours
+    """
+    factor = min(downsample_factor(scale), max_downsample_factor(kernel_shape, iterations))
+    if factor == 1:
+        return _close_and_open(thresh_image, kernel_shape, iterations, kernel_shape, iterations / 3)
+
+    small = _downsample(thresh_image, factor)
+
+    close_shape, open_shape = scaled_morphology(kernel_shape, iterations, factor)
+    contours = _close_and_open(small, close_shape, 1, open_shape, 1)
+
+    # blocks are where the full resolution morphology would have moved them
+    offset = _anchor_shift(kernel_shape, iterations, kernel_shape, iterations / 3) - \
+             _anchor_shift(close_shape, 1, open_shape, 1) * factor
+
+    return _upscale_contours(contours, factor, offset, small.shape, thresh_image.shape)
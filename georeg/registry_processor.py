@@ -4,37 +4,47 @@ import numpy as np
 import os
 import csv
 import sys
+import time
 import ConfigParser
 import itertools
 import collections
 import spell_checker
+import gazetteer
+import layout
 import business_geocoder as geo
+from contour_table import Contour, ContourTable
+from column_layout import COLUMN_DETECTORS, ColumnLayout, find_columns_by_projection
 from math import sqrt
 from operator import itemgetter, attrgetter
-from sklearn.cluster import KMeans
 
 import georeg
 from tessapi import TessBaseAPI
 
 class CityDetector(spell_checker.SpellChecker):
     """loads a file of cities for comparison against strings"""
-    def __init__(self, similarity_thresh = 50):
-        super(CityDetector, self).__init__(similarity_thresh)
+    def __init__(self, similarity_thresh = 50, lookup_engine = "graph"):
+        super(CityDetector, self).__init__(similarity_thresh, lookup_engine)
         
     def load_cities_txt_file(self, file_name):
+        if self.is_compiled:
+            self.remove_all_tokens()
+
         with open(file_name) as file:
             for line in file:
                 line = line.strip()
                 self.add_token(line, 1)
 
     def match_to_cities(self, line, cutoff=60):
+        return self._cached(("match_to_cities", line, cutoff), lambda: self._match_to_cities(line, cutoff))
+
+    def _match_to_cities(self, line, cutoff):
         line = line.lower().strip()
 
         # if the end of the string matches "—continued" then remove it
         if spell_checker.ratio(line[-12:], "-continued") > cutoff:
             line = line[:-12]
 
-        match, ratio = self.get_best_spelling_correction(line)
+        match, ratio = self._find_best_spelling_correction(line, 80)
 
         if ratio >= cutoff:
             return match
@@ -58,30 +68,12 @@ class Business:
         self.lat = ""
         self.long = ""
         self.confidence_score = 0.0
+        self.geocode_status = geo.GEOCODE_PENDING # set by the geocoding stage
 
         # keep track of source file
         self.image_file = ""
 
 
-class Contour:
-    def __init__(self, contour_data=None):
-        self.data = contour_data
-        self.text = ""
-        self.font_attrs = []
-
-        if contour_data is not None:
-            [self.x, self.y, self.w, self.h] = cv2.boundingRect(contour_data)
-            self.x_mid = self.x + self.w / 2
-            self.y_mid = self.y + self.h / 2
-        else:
-            self.x = 0
-            self.y = 0
-            self.w = 0
-            self.h = 0
-
-            self.x_mid = 0
-            self.y_mid = 0
-
 class RegistryProcessor(object):
 
     # lambdas were no longer sufficient with multiple threads for some reason
@@ -122,21 +114,52 @@ class RegistryProcessor(object):
             raise RuntimeError("error setting tesseract character whitelist")
 
         # uncomment this to register the generalized spellchecker with the tesseract api
+        # (every word is looked up, use the "symspell" engine, see set_spellcheck_engine)
         #self._tess_api.RegisterSpellCheckCallback(lambda str, conf: RegistryProcessor._spellcheck_callback(self, str, conf))
 
     def initialize_spell_checkers(self):
         """initialize both the general spell checker and city detector"""
 
+        self._load_spell_checker_dictionaries(True, True)
+
+    def _load_spell_checker_dictionaries(self, init_city_detector, init_spellchecker):
+        """
+        load the dictionaries of this state from the data directory,
+        compiled dictionaries (.bin, see SpellChecker.write_compiled_dictionary) are used when they exist
+        """
         basepath = georeg.__path__[0]
 
-        self._spell_checker.load_dictionary_from_tsv(os.path.abspath(os.path.join(basepath, "data", self.state + "_vocab.tsv")))
-        self._city_detector.load_cities_txt_file(os.path.join(basepath, "data", "%s-cities.txt" % self.state))
+        if init_city_detector:
+            path = os.path.join(basepath, "data", "%s-cities" % self.state)
+            if os.path.exists(path + ".bin"):
+                self._city_detector.load_compiled_dictionary(path + ".bin")
+            else:
+                self._city_detector.load_cities_txt_file(path + ".txt")
+        if init_spellchecker:
+            path = os.path.abspath(os.path.join(basepath, "data", self.state + "_vocab"))
+            if os.path.exists(path + ".bin"):
+                self._spell_checker.load_compiled_dictionary(path + ".bin")
+            else:
+                self._spell_checker.load_dictionary_from_tsv(path + ".tsv")
+
+    @property
+    def gazetteer(self):
+        """gazetteer of the current state's cities (see gazetteer.load_gazetteer)"""
+        if self._gazetteer is None or self._gazetteer.state != self.state:
+            self._gazetteer = gazetteer.load_gazetteer(self.state)
+        return self._gazetteer
+
+    def set_spellcheck_engine(self, lookup_engine):
+        """select the lookup engine used by both spell checkers (see spell_checker.LOOKUP_ENGINES)"""
+        self._spell_checker.set_lookup_engine(lookup_engine)
+        self._city_detector.set_lookup_engine(lookup_engine)
 
     def uninitialize_spell_checkers(self):
         """
         uninitialize both spell checkers,
         this needs to be called before a RegistryProcessor object is copied to another subprocess
         otherwise python will crash attempting to copy spellchecker's complicated innards
+        (not needed for compiled dictionaries, the subprocess maps the same file again)
         """
         self._spell_checker.remove_all_tokens()
         self._city_detector.remove_all_tokens()
@@ -155,6 +178,9 @@ class RegistryProcessor(object):
         self._spell_checker = spell_checker.SpellChecker()
         self._city_detector = CityDetector()
 
+        # compiled city index of self.state, loaded on first use (see the gazetteer property)
+        self._gazetteer = None
+
         self.__image = None
         self.__thresh_image = None
 
@@ -162,6 +188,7 @@ class RegistryProcessor(object):
         self.kernel_shape = (10, 3) # wider (i.e. higher x value) will cause more collisions along the x axis and visa versa for the y value
         self.thresh_value = 60  # higher = more exposure (max = 255)
         self.iterations = 8 # iterations of closing operation, higher values will help fill contours where text is farther apart but can cause contour collisions
+        self.layout_scale = 1.0 # scale of the image contours are found on, below 1 is faster on high resolution scans (see layout.find_text_contours)
         self.indent_width = 0.025 # indent width as % of contour width used for separating texas contours
 
         # percent of image width and height to add to bounding box width and height of contours (can improve ocr accuracy)
@@ -172,8 +199,17 @@ class RegistryProcessor(object):
         self.pages_per_image = 1
         self.page_boundary = -1 # coordinates of page boundary on current image (only used if self.pages_per_image == 2)
 
+        # number of pages the volume's column layout is learnt from, later pages are only
+        # clustered if their columns don't fit it (0 to cluster every page, see ColumnLayout)
+        self.column_template_pages = 3
+        self._column_layout = None
+
         self.std_thresh = 1  # number of standard deviations beyond which contour is no longer considered part of column
 
+        # how columns are found, "kmeans" clusters contour edges and "projection" looks for
+        # the gutters of the page's vertical ink projection (faster, and works on sparse pages)
+        self.column_detector = "kmeans"
+
         # performance & accuracy stats
         self.__ocr_confidence_sum = 0
         self.__num_words = 0
@@ -181,6 +217,25 @@ class RegistryProcessor(object):
         self.__num_geo_attempts = 0
         self.__per_image_business_counts = []
 
+        # when > 0 businesses are geocoded through the batch endpoint once this many are queued
+        # (see flush_geocode_queue), otherwise each business is geocoded as its image is processed
+        self.geocode_batch_size = 0
+        self.__geocode_queue = []
+
+        # outside of batch mode, number of simultaneous geocoder requests
+        # and maximum requests per second (0 = unlimited)
+        self.geocode_threads = 1
+        self.geocode_max_rate = 0
+
+        # number of times businesses deferred by the geocoder's circuit breaker are retried
+        # and the longest to wait (in seconds) for the breaker to allow a retry
+        self.geocode_retry_passes = 1
+        self.geocode_retry_wait = 60
+
+        # seconds spent in the parsing and geocoding stages
+        self.__parse_time = 0.0
+        self.__geocode_time = 0.0
+
         self.draw_debug_images = False  # turning this on can help with debugging
         self.assume_pre_processed = False  # assume images are preprocessed so to not waste extra computational power
 
@@ -197,12 +252,12 @@ class RegistryProcessor(object):
         self.state = state
         self.year = year
 
+        # a new volume has a new column layout
+        self._column_layout = None
+
         basepath = georeg.__path__[0]
 
-        if init_city_detector:
-            self._city_detector.load_cities_txt_file(os.path.join(basepath, "data", "%s-cities.txt" % self.state))
-        if init_spellchecker:
-            self._spell_checker.load_dictionary_from_tsv(os.path.abspath(os.path.join(basepath, "data", state + "_vocab.tsv")))
+        self._load_spell_checker_dictionaries(init_city_detector, init_spellchecker)
 
         # load config file from this state & year
         self.load_settings_from_cfg(os.path.join(basepath, "configs", state, str(year) + ".cfg"))
@@ -211,12 +266,9 @@ class RegistryProcessor(object):
     def process_image(self, path):
         """process a registry image and store results in the businesses member"""
 
-        self.businesses = [] # reset businesses list
-
         self.__image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
 
-        contours = self._get_contours(make_new_thresh = True)
-        contours = [Contour(c) for c in contours]
+        contours = ContourTable(self._get_contours(make_new_thresh = True))
 
         #remove noise from edge of image
         if not self.assume_pre_processed:
@@ -278,8 +330,6 @@ class RegistryProcessor(object):
         # get our custom call args if any
         call_args = self._define_contour_call_args(column_contours, noncolumn_contours)
 
-        num_businesses_found = 0
-
         if not os.path.exists(self._geoquery_log_fn): # if the log doesn't exist make it
             file = open(self._geoquery_log_fn, "w")
             file.close()
@@ -292,43 +342,112 @@ class RegistryProcessor(object):
             def process_with_args(args):
                 return self._process_contour(args), args
 
-        # here we process all of our contours
+        # parsing stage: turn contour text into business records
+        parse_start = time.time()
+
+        page_results = []
         for args in call_args:
             business, contour_txt = process_with_args(args)
+
+            if business is None:
+                raise TypeError("'NoneType' returned by _process_contour for business value, please return empty business objects instead")
+
             business.image_file = path
+            page_results.append((business, contour_txt))
 
-            num_businesses_found += 1
-            self.__num_geo_attempts += 1
+        self.__parse_time += time.time() - parse_start
 
-            result = None
+        # record the number of businesses found in this image
+        self.__per_image_business_counts.append(len(page_results))
 
-            try:
-                # if address was found attempt to geocode
-                if business.address:
-                    result = geo.geocode_business(business, self.state)
+        # businesses queued from earlier images stay in self.businesses until they are geocoded
+        if not self.geocoding_pending():
+            self.businesses = []
 
-                    # record business
-                    self.businesses.append(business)
+        self.businesses.extend(b for b, _ in page_results if b.address)
+        self.__geocode_queue.extend(page_results)
 
-                if not result:
-                    with open(self._geoquery_log_fn, "a") as file:
-                        file.write("Unsuccessful geo-query from %s:\n" % os.path.basename(path))
-                        file.write("name: \"%s\" address: \"%s\", city: \"%s\", zip: \"%s\"\n" % (
-                            business.name, business.address, business.city, business.zip))
-                        file.write("=" * 100 + "\n")
-                        file.write("Contour Text:\n")
-                        file.write("=" * 100 + "\n")
-                        file.write(contour_txt.strip() + "\n")  # write contour text
-                        file.write("=" * 100 + "\n\n")
-                else:
-                    self.__num_geo_successes += 1
-            except AttributeError:
-                if business is None:
-                    raise TypeError("'NoneType' returned by _process_contour for business value, please return empty business objects instead")
-                else: raise
+        if len(self.__geocode_queue) >= self.geocode_batch_size:
+            self.flush_geocode_queue()
 
-        # record the number of businesses found in this image
-        self.__per_image_business_counts.append(num_businesses_found)
+    def geocoding_pending(self):
+        """returns True if there are businesses waiting to be batch geocoded"""
+        return len(self.__geocode_queue) > 0
+
+    def flush_geocode_queue(self):
+        """
+        geocoding stage: geocode every business queued by process_image() exactly once,
+        this must be called before record_to_tsv() if geocoding_pending() is True
+        """
+        queue = self.__geocode_queue
+        self.__geocode_queue = []
+
+        geocode_start = time.time()
+
+        pending = [b for b, _ in queue if b.geocode_status == geo.GEOCODE_PENDING]
+        self._geocode_businesses(pending)
+
+        # businesses skipped while the geocoder was failing get retried once it lets a probe through
+        deferred = [b for b in pending if b.geocode_status == geo.GEOCODE_DEFERRED]
+        for _ in xrange(self.geocode_retry_passes):
+            if not deferred:
+                break
+
+            wait = geo.breaker.seconds_until_probe()
+            if wait > self.geocode_retry_wait:
+                break
+            time.sleep(wait)
+
+            # a recovering geocoder only lets a single probe through,
+            # the rest are sent once the probe has closed the breaker again
+            if geo.breaker.state != geo.CircuitBreaker.CLOSED:
+                probe = deferred[:1]
+                geo.requeue_deferred(probe)
+                self._geocode_businesses(probe)
+
+            if geo.breaker.state == geo.CircuitBreaker.CLOSED:
+                deferred = [b for b in deferred if b.geocode_status == geo.GEOCODE_DEFERRED]
+                geo.requeue_deferred(deferred)
+                self._geocode_businesses(deferred)
+
+            deferred = [b for b in deferred if b.geocode_status == geo.GEOCODE_DEFERRED]
+
+        for business in deferred:
+            business.geocode_status = geo.GEOCODE_FAILED
+
+        for business, contour_txt in queue:
+            self._record_geocode_result(business, contour_txt)
+
+        self.__geocode_time += time.time() - geocode_start
+
+    def _geocode_businesses(self, businesses):
+        if self.geocode_batch_size > 0:
+            geo.geocode_businesses_batch(businesses, self.state)
+        elif self.geocode_threads > 1 or self.geocode_max_rate > 0:
+            geo.geocode_businesses_concurrent(businesses, self.state, max_in_flight=self.geocode_threads,
+                                              max_rate=self.geocode_max_rate)
+        else:
+            for business in businesses:
+                geo.geocode_business(business, self.state)
+
+    def _record_geocode_result(self, business, contour_txt):
+        """update geocoder stats and log the query if it was unsuccessful"""
+
+        self.__num_geo_attempts += 1
+
+        if business.geocode_status == geo.GEOCODE_SUCCESS:
+            self.__num_geo_successes += 1
+            return
+
+        with open(self._geoquery_log_fn, "a") as file:
+            file.write("Unsuccessful geo-query from %s:\n" % os.path.basename(business.image_file))
+            file.write("name: \"%s\" address: \"%s\", city: \"%s\", zip: \"%s\"\n" % (
+                business.name, business.address, business.city, business.zip))
+            file.write("=" * 100 + "\n")
+            file.write("Contour Text:\n")
+            file.write("=" * 100 + "\n")
+            file.write(contour_txt.strip() + "\n")  # write contour text
+            file.write("=" * 100 + "\n\n")
 
     def _get_noncolumn_contours_of_interest(self, noncolumn_contours):
         """
@@ -380,6 +499,15 @@ class RegistryProcessor(object):
         """returns geocoder success rate or -1 if not valid"""
         return (self.__num_geo_successes * 1.0 / self.__num_geo_attempts) * 100 if self.__num_geo_attempts > 0 else -1
 
+    def stage_times(self):
+        """returns (parsing seconds, geocoding seconds) spent so far"""
+        return (self.__parse_time, self.__geocode_time)
+
+    def spellcheck_cache_stats(self):
+        """returns (hits, misses) of both spell checkers' correction caches"""
+        caches = (self._spell_checker.correction_cache, self._city_detector.correction_cache)
+        return (sum(c.hits for c in caches), sum(c.misses for c in caches))
+
     def business_count_std_and_avg(self):
         """
         gets business count per image standard dev and average
@@ -402,6 +530,10 @@ class RegistryProcessor(object):
         self.__num_geo_successes = 0
         self.__num_geo_attempts = 0
         self.__per_image_business_counts = []
+        self.__parse_time = 0.0
+        self.__geocode_time = 0.0
+        self._spell_checker.correction_cache.reset_stats()
+        self._city_detector.correction_cache.reset_stats()
 
     def load_from_tsv(self, path):
         """load self.businesses from a tsv file where they were previously saved"""
@@ -454,6 +586,8 @@ class RegistryProcessor(object):
                 'bb_expansion_percent': str(self.bb_expansion_percent), 
                 'indent_width': str(self.indent_width),
                 'std_thresh': str(self.std_thresh),
+                'layout_scale': str(self.layout_scale),
+                'column_detector': self.column_detector,
             })
         cp.read(path)
 
@@ -466,6 +600,12 @@ class RegistryProcessor(object):
         self.bb_expansion_percent = cp.getfloat('RegistryProcessor','bb_expansion_percent')
         self.indent_width = cp.getfloat('RegistryProcessor','indent_width')
         self.std_thresh = cp.getfloat('RegistryProcessor','std_thresh')
+        self.layout_scale = cp.getfloat('RegistryProcessor','layout_scale')
+        self.column_detector = cp.get('RegistryProcessor','column_detector').strip().lower()
+
+        if self.column_detector not in COLUMN_DETECTORS:
+            raise ValueError("unknown column detector \"%s\" in %s, expected one of %s" %
+                             (self.column_detector, path, ", ".join(COLUMN_DETECTORS)))
 
     def save_settings_to_cfg(self, path):
         cp = ConfigParser.SafeConfigParser()
@@ -480,6 +620,8 @@ class RegistryProcessor(object):
         cp.set('RegistryProcessor','bb_expansion_percent',str(self.bb_expansion_percent))
         cp.set('RegistryProcessor','indent_width',str(self.indent_width))
         cp.set('RegistryProcessor','std_thresh',str(self.std_thresh))
+        cp.set('RegistryProcessor','layout_scale',str(self.layout_scale))
+        cp.set('RegistryProcessor','column_detector',self.column_detector)
 
         with open(path,'w') as cfg_file:
             cp.write(cfg_file)
@@ -487,23 +629,20 @@ class RegistryProcessor(object):
     def _remove_edge_contours(self, contours):
         """remove contours that touch the edge of image
         and crops self._image and self._thresh to an
-        appropriate size"""
-
-        filtered_contours = []
+        appropriate size
+        (returns a ContourTable of the remaining contours)"""
 
-        for contour in contours:
-            if (contour.x == 1 or contour.x + contour.w == self._image_width - 1) or \
-            (contour.y == 1 or contour.y + contour.h == self._image_height - 1):
-                continue
+        contours = ContourTable.from_contours(contours)
 
-            filtered_contours.append(contour)
+        touches_edge = (contours.x == 1) | (contours.x + contours.w == self._image_width - 1) | \
+                       (contours.y == 1) | (contours.y + contours.h == self._image_height - 1)
+        filtered_contours = contours.take(~touches_edge)
 
         if len(filtered_contours) == 0:
             raise RuntimeError("No non-background contours found, check debug images")
 
         # create cropped version of image
-        super_contour = np.concatenate([c.data for c in filtered_contours])
-        [x,y,w,h] = cv2.boundingRect(super_contour)
+        x,y,w,h = filtered_contours.bounding_rect()
 
         # make bounding box bigger
         x,y,w,h = self._expand_bb(x,y,w,h)
@@ -511,16 +650,8 @@ class RegistryProcessor(object):
         self.__image = self.__image[y:y + h, x:x + w]
         self.__thresh_image = self.__thresh_image[y:y + h, x:x + w]
 
-        # apply cropping offset to contours
-        for c in contours:
-            c.x -= x
-            c.x_mid -= x
-            c.y -= y
-            c.y_mid -= y
-            # apply cropping offset to each point in contours
-            for p in c.data:
-                p[0][0] -= x
-                p[0][1] -= y
+        # apply cropping offset to contours and their points
+        filtered_contours.shift(x, y)
 
         return filtered_contours
 
@@ -528,48 +659,53 @@ class RegistryProcessor(object):
         """
         Performs a close operation to close gaps between letters to make solid contours,
         then performs an open operation to remove stray noise contours and returns the result
+        (on an image downsampled by self.layout_scale if it is below 1, the contours are still at full resolution)
         :param make_new_thresh: if true this function will make a new thresh_image rather than using the existing self.__thresh_image
         :return: returns cv2 contour data (not wrapped in Contour() class)
         """
 
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, self.kernel_shape)
-
         if make_new_thresh: # if asked then we make a new thresh image
             if not self.assume_pre_processed:
                 _,self.__thresh_image = cv2.threshold(self.__image, self.thresh_value, 255, cv2.THRESH_BINARY_INV) # threshold
             else:
                 _,self.__thresh_image = cv2.threshold(self.__image, 0, 255, cv2.THRESH_BINARY_INV) # threshold with 0 threshold value
 
-        # close operation to fill contours
-        closed = cv2.morphologyEx(self.__thresh_image, cv2.MORPH_CLOSE, kernel, iterations = self.iterations)
-
-        # perform an open operation to remove noise
-        closed = cv2.morphologyEx(closed,cv2.MORPH_OPEN,kernel,iterations = self.iterations / 3)
-
-        return cv2.findContours(closed,cv2.RETR_EXTERNAL,cv2.CHAIN_APPROX_SIMPLE)[1] # actual contour data is the second element
+        return layout.find_text_contours(self.__thresh_image, self.kernel_shape, self.iterations, self.layout_scale)
 
     def _find_column_locations(self, contours):
         """find column column locations, and page boundary if two pages
         (returns column locations)"""
 
         # create array of coords for left and right edges of contours
-        coords = [[contour.x, contour.x + contour.w] for contour in contours]
-        coords_arr = np.array(coords)
+        coords_arr = ContourTable.from_contours(contours).edges()
 
-        # use k-means clustering to get column boundaries for expected # of cols
         num_cols = self.columns_per_page * self.pages_per_image
-        k_means = KMeans(n_clusters=num_cols)
 
-        if len(coords_arr) < num_cols:
-            raise RuntimeError("Number of contours detected fewer than number of expected columns")
+        if self.column_detector == "projection":
+            # columns are separated by the valleys of the vertical ink projection
+            clustering = find_columns_by_projection(self.__thresh_image, coords_arr, num_cols)
+        elif self.column_detector == "kmeans":
+            # use k-means clustering to get column boundaries for expected # of cols
+            # (or the volume's column layout once it is learnt)
+            if len(coords_arr) < num_cols:
+                raise RuntimeError("Number of contours detected fewer than number of expected columns")
+
+            if self._column_layout is None or self._column_layout.num_cols != num_cols:
+                self._column_layout = ColumnLayout(num_cols, self.column_template_pages)
 
-        clustering = k_means.fit(coords_arr)
+            clustering = self._column_layout.fit(coords_arr)
+        else:
+            raise ValueError("unknown column detector \"%s\", expected one of %s" %
+                             (self.column_detector, ", ".join(COLUMN_DETECTORS)))
 
         self.page_boundary = -1
         if self.pages_per_image == 2:  # if there are two pages find the page boundary
-            sorted_cols = sorted(clustering)
-            self.page_boundary = (sorted_cols[self.columns_per_page - 1][0] +
-                                  sorted_cols[self.columns_per_page][0]) / (2 * 1.0)
+            if getattr(clustering, "gutters", None) is not None:
+                self.page_boundary = float(clustering.gutters[self.columns_per_page - 1])
+            else:
+                sorted_cols = sorted(clustering.cluster_centers_.tolist())
+                self.page_boundary = (sorted_cols[self.columns_per_page - 1][0] +
+                                      sorted_cols[self.columns_per_page][0]) / (2 * 1.0)
 
         # draw columns lines and clusters
         if self.draw_debug_images:
@@ -605,43 +741,40 @@ class RegistryProcessor(object):
     def _make_contour_columns(self, contours, clustering):
         """makes contour columns based on column locations
            return: contour_columns, noncolumn_contours
-           (column contours are sorted by column and position)"""
+           (column contours are sorted by column and position, there is
+           a list for every column of clustering even if it is empty)"""
 
-        column_contours = []
-        non_column_contours = []
+        contours = ContourTable.from_contours(contours)
 
-        # sort contours by clusters
-        cluster_groups = sorted(zip(clustering.labels_, contours))
+        labels = np.asarray(clustering.labels_, dtype=np.int64)
+        centers = np.asarray(clustering.cluster_centers_, dtype=np.float64)
+        contours.labels[:] = labels
 
-        # iterate through column groups, deciding which contours are valid
-        for col_ix, cluster_group in itertools.groupby(cluster_groups, lambda x: x[0]):
+        # x-coords of contours
+        contour_locs = contours.edges().astype(np.float64)
 
-            # coords of column
-            col_loc = clustering.cluster_centers_[col_ix]
+        # standard deviation of the x-coords of each column's contours
+        num_coords = np.bincount(labels, minlength=len(centers)) * 2.0
+        present = num_coords > 0
+        col_means = np.bincount(labels, weights=contour_locs.sum(axis=1), minlength=len(centers))
+        col_means[present] /= num_coords[present]
+        squared_devs = ((contour_locs - col_means[labels][:, np.newaxis]) ** 2).sum(axis=1)
+        col_stds = np.bincount(labels, weights=squared_devs, minlength=len(centers))
+        col_stds[present] = np.sqrt(col_stds[present] / num_coords[present])
 
-            cluster_contours = [c for _, c in cluster_group]
+        # only keep contours if less than threshold std devs from column
+        dists = np.linalg.norm(contour_locs - centers[labels], axis=1)
+        in_column = dists < self.std_thresh * col_stds[labels]
 
-            # x-coords of contours
-            contour_locs = [[c.x, c.x + c.w] for c in cluster_contours]
-            # calculate standard deviation of contour x-coords
-            col_std = np.std(contour_locs)
-
-            # only keep contours if less than threshold std devs from column
-            keep_contours = []
-            for contour_ix, contour in enumerate(cluster_contours):
-                dist = abs(np.linalg.norm(contour_locs[contour_ix] - col_loc))
-                if dist < self.std_thresh * col_std:
-                    keep_contours.append(contour)
-                else:
-                    non_column_contours.append(contour)
-
-            column_contours.append(keep_contours)
-
-        # sort column and contour by position
+        # sort column and contour by position, columns without contours are kept (empty)
+        # so callers can slice the columns of each page by index
         sorted_column_contours = []
-        sorted_columns = sorted(enumerate(column_contours),key=lambda x: 
-                                 clustering.cluster_centers_[x[0]][0])
-        for i, column in sorted_columns:
-            sorted_column_contours.append(sorted(column,key=attrgetter('y')))
+        for col_ix in np.argsort(centers[:, 0], kind="mergesort"):
+            members = np.flatnonzero(in_column & (labels == col_ix))
+            members = members[np.argsort(contours.y[members], kind="mergesort")]
+            sorted_column_contours.append([contours[i] for i in members])
+
+        non_column_contours = [contours[i] for i in np.lexsort((np.arange(len(labels)), labels))
+                               if not in_column[i]]
 
         return sorted_column_contours, non_column_contours
@@ -6,7 +6,6 @@ import os.path
 import re
 import numpy as np
 import registry_processor as reg
-import business_geocoder as geo
 from operator import itemgetter, attrgetter
 
 class RegistryProcessorNew(reg.RegistryProcessor):
@@ -17,7 +16,7 @@ class RegistryProcessorNew(reg.RegistryProcessor):
          
         self.current_sic = ""
 
-        self.city_pattern = re.compile(r'[A-Za-z ]+(?=[,.][ ]+[A-Z]{2}[ ]+[0-9]{5})')
+        self.city_pattern = re.compile(r'[A-Za-z ]+(?=[,.][ ]+[A-Z]{2}[ ]+([0-9]{5}))')
         self.emp_pattern = re.compile(r'[Ee]mp.*\d+')
         self.registry_pattern = re.compile(r'[A-Za-z]+.*\n',)
         self.sic_pattern = re.compile(r'\d{4}')
@@ -30,7 +29,6 @@ class RegistryProcessorNew(reg.RegistryProcessor):
             business = self._parse_registry_block(contour_txt)
             business.category = self.current_sic
 
-            geo.geocode_business(business)
             return business
         elif sic_match:
             self.current_sic = sic_match.group(0)
@@ -49,7 +47,8 @@ class RegistryProcessorNew(reg.RegistryProcessor):
         match = self.city_pattern.search(registry_txt)
         if match:
             city = match.group(0)
-            match_city = self._city_detector.match_to_cities(city) # perform spell check and confirm this is a city
+            # perform spell check and confirm this is a city, fall back to the city of the zip code
+            match_city = self.gazetteer.match(city) or self.gazetteer.city_for_zip(match.group(1))
             if match_city:
                 if match_city != city:
                     print("Imperfect city match: %s matched to %s" % (city, match_city))
@@ -124,7 +123,6 @@ class RegistryProcessorOld(reg.RegistryProcessor):
             if len(self.current_zip) > 0:
                 business.zip = self.current_zip
 
-            geo.geocode_business(business)
             return business
         else:  # check if city header
             segments = contour_txt.rpartition(" ")
@@ -135,7 +133,9 @@ class RegistryProcessorOld(reg.RegistryProcessor):
                 zip = segments[2]
                 contour_txt = segments[0]
 
-            match_city = self._city_detector.match_to_cities(contour_txt)
+            match_city = self.gazetteer.match(contour_txt)
+            if not match_city and zip:
+                match_city = self.gazetteer.city_for_zip(zip)
 
             if match_city:
                 self.current_city = match_city
@@ -0,0 +1,119 @@
+"""
+Bulk construction of :class:`.SpellChecker`'s similar tokens graph.
+
+Instead of comparing every pair of words, pairs are blocked by length (two words
+can only be similar enough if their lengths are close enough) and by shared
+characters (the bag distance of two words, computed from their character counts,
+is a lower bound of their edit distance). Only the surviving pairs are compared
+with Levenshtein distance, spread over a process pool. Both filters are exact,
+so the result is the same graph add_token builds one word at a time.
+"""
+
+import multiprocessing
+import numpy as np
+from Levenshtein import distance
+
+__all__ = ("similar_pairs", )
+
+# slack for float comparisons in the filters, pairs near the threshold are always compared exactly
+_eps = 1e-6
+
+# per worker process state, set by _init_worker
+_words = None
+_thresh = None
+_lengths = None
+_counts = None
+_order = None
+_sorted_lengths = None
+
+def _init_worker(words, similarity_thresh):
+    global _words, _thresh, _lengths, _counts, _order, _sorted_lengths
+
+    _words = words
+    _thresh = similarity_thresh
+    _lengths = np.array([len(w) for w in words], dtype=np.int32)
+
+    # character count vectors of every word
+    alphabet = {}
+    for word in words:
+        for c in word:
+            alphabet.setdefault(c, len(alphabet))
+
+    _counts = np.zeros((len(words), max(len(alphabet), 1)), dtype=np.int16)
+    for i, word in enumerate(words):
+        for c in word:
+            _counts[i, alphabet[c]] += 1
+
+    _order = np.argsort(_lengths, kind="mergesort")
+    _sorted_lengths = _lengths[_order]
+
+def _clear_worker():
+    global _words, _lengths, _counts, _order, _sorted_lengths
+    _words = _lengths = _counts = _order = _sorted_lengths = None
+
+def _pairs_for(indices):
+    """(i, j, score) of similar pairs with j < i for every i in indices"""
+    s = _thresh / 100.0
+    pairs = []
+
+    for i in indices:
+        word = _words[i]
+        length = len(word)
+
+        # ratio >= s requires |len(a) - len(b)| <= distance <= (1 - s) * max(len(a), len(b))
+        if s > 0:
+            lo = np.searchsorted(_sorted_lengths, s * length - _eps, side="left")
+            hi = np.searchsorted(_sorted_lengths, length / s + _eps, side="right")
+        else:
+            lo, hi = 0, len(_sorted_lengths)
+
+        candidates = _order[lo:hi]
+        candidates = candidates[candidates < i]
+        if not len(candidates):
+            continue
+
+        candidate_lengths = _lengths[candidates]
+        max_lengths = np.maximum(candidate_lengths, length)
+
+        # bag distance = max(characters only in a, characters only in b) <= edit distance
+        abs_diff = np.abs(_counts[candidates] - _counts[i]).sum(axis=1)
+        bag_distance = (abs_diff + np.abs(candidate_lengths - length)) / 2
+
+        keep = bag_distance <= (1.0 - s) * max_lengths + _eps
+        for j, max_length in zip(candidates[keep].tolist(), max_lengths[keep].tolist()):
+            # same expression as spell_checker.ratio so the result is identical
+            score = (1.0 - distance(word, _words[j]) * 1.0 / max_length) * 100.0
+            if score >= _thresh:
+                pairs.append((i, j, score))
+
+    return pairs
+
+def similar_pairs(words, similarity_thresh, new_start=0, processes=None, chunk_size=200):
+    """
+    find every pair of words at least similarity_thresh similar (see spell_checker.ratio)
+    :param words: list of unique words
+    :param new_start: words before this index were already compared with each other,
+                      only pairs including a word at or after it are returned
+    :param processes: number of processes to compare words with (default: one per cpu, 1 for no pool)
+    :return: list of (i, j, score) for every similar pair of words[i] and words[j], i > j
+    """
+    words = [unicode(w) for w in words]
+    indices = range(new_start, len(words))
+    chunks = [indices[k:k + chunk_size] for k in xrange(0, len(indices), chunk_size)]
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    if processes <= 1 or len(chunks) <= 1:
+        _init_worker(words, similarity_thresh)
+        try:
+            return [pair for chunk in chunks for pair in _pairs_for(chunk)]
+        finally:
+            _clear_worker()
+
+    pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=(words, similarity_thresh))
+    try:
+        return [pair for chunk_pairs in pool.imap_unordered(_pairs_for, chunks) for pair in chunk_pairs]
+    finally:
+        pool.close()
+        pool.join()
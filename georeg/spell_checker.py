@@ -2,10 +2,29 @@ import nltk
 import re
 import csv
 import os
+import itertools
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 from Levenshtein import distance
 
 import exceptions
 
+from bk_tree import BKTree
+from deletion_index import DeletionIndex
+from similarity_graph import similar_pairs
+from token_graph import TokenGraph
+from compiled_dictionary import CompiledDictionary, write_compiled_dictionary
+from corpus_counter import count_tokens, DEFAULT_CHUNK_SIZE
+from correction_cache import CorrectionCache, DEFAULT_CACHE_SIZE
+
+# lookup engines SpellChecker.get_best_spelling_correction can use:
+# "graph" hill-climbs the graph of similar tokens from every token above the similarity threshold,
+# "bktree" searches a BK-tree of the tokens, only comparing against tokens within the edit distance
+# that could still beat the best match so far,
+# "symspell" looks up the query's deletion variants in an index of the tokens' deletion variants,
+# it only finds tokens within max_edit_distance edits but is by far the fastest
+LOOKUP_ENGINES = ("graph", "bktree", "symspell")
+
 # takes in text then returns tokens as a list of strings (without occurences!)
 def tokenize(text, min_len=2, allow_number_tokens=False):
 
@@ -37,117 +56,258 @@ def ratio(str1, str2):
         print type(str1), type(str2)
         raise
 
-class Token(object): # a "word" in our spellcheck dictionary
-    def __init__(self, value = "", count = 0):
-        self.count = count
-        self.value = value
-
-        self.similar_tokens = set([])
-
-    def touched_by(self, id):
-        try:
-            if id == self._touch_id: return True
-            else: return False
-        except AttributeError:
-            return False
+# marks a key missing from the correction cache (None is a valid cached value)
+_missing = object()
 
-    def touch_with(self, id):
-        self._touch_id = id
+# spell checker of correct_many's worker processes, set by _init_lookup_worker
+_lookup_checker = None
 
-    def remove_touch_id(self):
-        try:
-            del self._touch_id
-        except AttributeError:
-            pass
+def _init_lookup_worker(checker):
+    global _lookup_checker
+    _lookup_checker = checker
 
+def _lookup_chunk(args):
+    token_strs, target_similarity = args
+    return [_lookup_checker.get_best_spelling_correction(t, target_similarity) for t in token_strs]
 
 class SpellChecker(object):
-    def __init__(self, similarity_thresh = 50):
-        self._tokens = {}
+    def __init__(self, similarity_thresh = 50, lookup_engine = "graph", max_edit_distance = 2, similarity_floor = None,
+                 correction_cache_size = DEFAULT_CACHE_SIZE):
+        # the dictionary: words (token ids index them), their counts and their similarity links,
+        # a TokenGraph or a read-only CompiledDictionary (see load_compiled_dictionary)
+        self._graph = TokenGraph()
         self._total_occurrences = 0 # the sum of all tokens' count members
-        self.__next_touch_id = 0
 
         # this should not be changed manually (our dictionary will require reprocessing)
         self.__similarity_thresh = similarity_thresh
 
-    def _next_touch_id(self):
-        """only for use by search functions"""
-        self.__next_touch_id = (self.__next_touch_id + 1) % 5000
-        return self.__next_touch_id
+        # the similarity scores of all pairs at least this similar are kept, so the threshold
+        # can be changed to anything at or above it without comparing tokens again
+        self.__similarity_floor = similarity_thresh if similarity_floor is None else min(similarity_floor, similarity_thresh)
+
+        # recent lookups keyed by (string, target similarity, ..., dictionary version),
+        # the version changes (and the cache is cleared) whenever lookup results could change
+        self._correction_cache = CorrectionCache(correction_cache_size)
+        self._version = 0
+
+        # indexes of the token ids used by the "bktree" and "symspell" lookup engines
+        self._bk_tree = BKTree()
+        self._deletion_index = DeletionIndex(max_edit_distance)
+        self.__lookup_engine = None
+        self.set_lookup_engine(lookup_engine)
+
+    @property
+    def lookup_engine(self):
+        return self.__lookup_engine
+
+    def set_lookup_engine(self, lookup_engine):
+        """select the lookup engine used by get_best_spelling_correction (see LOOKUP_ENGINES)"""
+        if lookup_engine not in LOOKUP_ENGINES:
+            raise ValueError("unknown lookup engine \"%s\", expected one of %s" % (lookup_engine, ", ".join(LOOKUP_ENGINES)))
+
+        self.__lookup_engine = lookup_engine
+        self._build_index()
+
+    def _dictionary_changed(self):
+        """invalidate cached corrections, call after anything that can change lookup results"""
+        self._version += 1
+        self._correction_cache.clear()
+
+    @property
+    def correction_cache(self):
+        return self._correction_cache
+
+    def _cached(self, key, lookup):
+        """lookup() cached under key and the dictionary version"""
+        key = key + (self._version,)
+
+        result = self._correction_cache.get(key, _missing)
+        if result is _missing:
+            result = lookup()
+            self._correction_cache.put(key, result)
+        return result
+
+    def _build_index(self):
+        """(re)build the index of the selected lookup engine from our tokens"""
+        self._dictionary_changed()
+
+        self._bk_tree.clear()
+        self._deletion_index.clear()
+
+        if self.__lookup_engine != "graph":
+            for id in xrange(len(self._graph)):
+                self._index_token(id)
+
+    def _index_token(self, id):
+        if self.__lookup_engine == "bktree":
+            self._bk_tree.add(self._graph.words[id], id)
+        elif self.__lookup_engine == "symspell":
+            self._deletion_index.add(self._graph.words[id], id)
+
+    @property
+    def similarity_floor(self):
+        return self.__similarity_floor
+
+    def __getstate__(self):
+        # the lookup engine indexes are rebuilt rather than copied,
+        # a compiled dictionary is mapped again from its file
+        state = self.__dict__.copy()
+        state["_bk_tree"] = BKTree()
+        state["_deletion_index"] = DeletionIndex(self._deletion_index.max_distance, self._deletion_index.prefix_length)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build_index()
+
+    @property
+    def is_compiled(self):
+        """True if the dictionary is a read-only compiled dictionary (see load_compiled_dictionary)"""
+        return isinstance(self._graph, CompiledDictionary)
+
+    def _check_writable(self):
+        if self.is_compiled:
+            raise RuntimeError("compiled dictionary \"%s\" is read-only" % self._graph.file_name)
 
     @property
     def words(self):
-        return self._tokens.iterkeys()
+        return iter(self._graph.words)
     @property
     def words_with_count(self):
-        return ((t.value,t.count) for t in self._tokens.itervalues())
+        return itertools.izip(self._graph.words, self._graph.count_list())
+
+    def __contains__(self, token_str):
+        return self._graph.id_of(token_str) is not None
 
     def load_dictionary_from_tsv(self, file_name):
-        """This will throw a RuntimeError if the dictionary is corrupt"""
-        self._tokens = {} # free memory
+        """
+        This will throw a RuntimeError if the dictionary is corrupt.
+        Files written before similarity floors were stored (with no "|" edit distances)
+        are loaded with a floor equal to their threshold.
+        """
+        self._graph = TokenGraph() # free memory
         file_name = os.path.splitext(file_name)[0] + ".tsv" # force extension to .tsv
 
         try:
             with open(file_name, "r") as file:
                 file_reader = csv.reader(file, delimiter="\t")
 
-                self.__similarity_thresh, self._total_occurrences = file_reader.next()
+                header = file_reader.next()
 
-                self.__similarity_thresh = int(self.__similarity_thresh)
-                self._total_occurrences = int(self._total_occurrences)
+                self.__similarity_thresh = int(header[0])
+                self._total_occurrences = int(header[1])
+                self.__similarity_floor = int(header[2]) if len(header) > 2 else self.__similarity_thresh
 
-                # read in file and record similar token lists as strings
+                # read in file and record similar tokens as (string, edit distance or None) pairs
+                similar = []
                 for row in file_reader:
-                    new_token = Token(row[0], int(row[1]))
+                    self._graph.add(row[0], int(row[1]))
 
+                    similar_items = []
                     for item in row[2:]:
-                        new_token.similar_tokens.add(item)
+                        value, sep, edit_distance = item.rpartition("|")
+                        similar_items.append((value, int(edit_distance)) if sep else (item, None))
+                    similar.append(similar_items)
+
+            # replace string values with token ids, every pair is listed under both of its tokens
+            links = {}
+            words = self._graph.words
+            for id, similar_items in enumerate(similar):
+                for value, edit_distance in similar_items:
+                    similar_id = self._graph.id_of(value)
+                    if similar_id is None:
+                        raise KeyError(value)
+
+                    if edit_distance is None:
+                        score = ratio(words[id], value)
+                    else:
+                        score = (1.0 - edit_distance * 1.0 / max(len(words[id]), len(value))) * 100.0
 
-                    self._tokens[new_token.value] = new_token
+                    links[min(id, similar_id), max(id, similar_id)] = score
 
-            # replace string values with actual token objects
-            for token in self._tokens.itervalues():
-                token.similar_tokens = set([self._tokens[t] for t in token.similar_tokens])
+            for (i, j), score in links.iteritems():
+                self._graph.link(i, j, score)
 
-        except (IndexError, KeyError):
+        except (IndexError, KeyError, ValueError):
             e = RuntimeError("dictionary file \"%s\" seems to be corrupt" % file_name)
             raise e
 
+        self._build_index()
+
     def write_dictionary_to_tsv(self, file_name):
 
         # force extension to .tsv
         file_name = os.path.splitext(file_name)[0] + ".tsv"
 
+        words = self._graph.words
+
         with open(file_name, "w") as file:
             file_writer = csv.writer(file, delimiter="\t")
 
             # write general member attributes
-            file_writer.writerow([self.__similarity_thresh, self._total_occurrences])
+            file_writer.writerow([self.__similarity_thresh, self._total_occurrences, self.__similarity_floor])
+
+            # record tokens with every token at least __similarity_floor similar as "token|edit distance"
+            for id, (value, count) in enumerate(self.words_with_count):
+                similar_items = []
+                similar_ids, scores = self._graph.similar(id, self.__similarity_floor)
+                for similar_id, score in itertools.izip(similar_ids.tolist(), scores.tolist()):
+                    t = words[similar_id]
+                    edit_distance = int(round((1.0 - score / 100.0) * max(len(value), len(t))))
+                    similar_items.append("%s|%d" % (t, edit_distance))
+
+                file_writer.writerow([value, count] + similar_items)
+
+    def load_compiled_dictionary(self, file_name):
+        """
+        map a compiled dictionary (see write_compiled_dictionary) read-only instead of loading it into memory,
+        the dictionary can't be added to afterwards but copies of this object made for other processes
+        map the same file again, sharing one copy of the dictionary between them
+        This will throw a RuntimeError if the dictionary is corrupt.
+        """
+        file_name = os.path.splitext(file_name)[0] + ".bin" # force extension to .bin
+
+        self.remove_all_tokens()
+        self._graph = CompiledDictionary(file_name)
+
+        self.__similarity_thresh = self._graph.similarity_thresh
+        self.__similarity_floor = self._graph.similarity_floor
+        self._total_occurrences = self._graph.total_occurrences
+
+        self._build_index()
+
+    def write_compiled_dictionary(self, file_name):
+        """write the dictionary in the binary format load_compiled_dictionary maps (see compiled_dictionary)"""
 
-            # record tokens
-            for token in self._tokens.itervalues():
-                file_writer.writerow([token.value, token.count] + [t.value for t in token.similar_tokens])
+        # force extension to .bin
+        file_name = os.path.splitext(file_name)[0] + ".bin"
 
+        sources, targets, scores = self._graph.links()
+        keep = scores >= self.__similarity_floor
+
+        write_compiled_dictionary(file_name, self._graph.words, self._graph.count_list(),
+                                  (sources[keep], targets[keep], scores[keep]),
+                                  self.__similarity_thresh, self.__similarity_floor, self._total_occurrences)
 
     def get_best_spelling_correction_slow(self, token_str, target_similarity = 100):
         """perform a slow lookup, only for benchmarking purposes"""
-        if token_str in self._tokens:
+        if token_str in self:
             return token_str, 100
 
         best_score = 0
-        best_token = None
+        best_token_str = None
 
-        for known_token in self._tokens.itervalues():
-            sim_score = ratio(token_str, known_token.value)
+        for known_token_str in self._graph.words:
+            sim_score = ratio(token_str, known_token_str)
 
             if sim_score > best_score:
-                best_token = known_token
+                best_token_str = known_token_str
                 best_score = sim_score
 
                 if best_score >= target_similarity:
                     break
 
-        return best_token.value, best_score
+        return best_token_str, best_score
 
     def get_best_spelling_correction(self, token_str, target_similarity=80):
         """
@@ -159,76 +319,191 @@ class SpellChecker(object):
                if less than __similarity_thresh then stops after first recursive search
         :return: a tuple with the match and score as a percent i.e. (match, score)
         """
+        return self._cached((token_str, target_similarity),
+                            lambda: self._find_best_spelling_correction(token_str, target_similarity))
+
+    def _find_best_spelling_correction(self, token_str, target_similarity):
+        """get_best_spelling_correction without the correction cache"""
 
-        if token_str in self._tokens:
+        if token_str in self:
             return token_str, 100
 
-        touch_id = self._next_touch_id()
+        if self.__lookup_engine == "bktree":
+            return self._bk_tree_lookup(token_str, target_similarity)
+        if self.__lookup_engine == "symspell":
+            return self._deletion_index_lookup(token_str)
+
+        words = self._graph.words
+
+        # visited bitmap of this search only, lookups never modify the dictionary
+        # so any number of them can run at once (see correct_many)
+        visited = bytearray(len(words))
 
         best_score = 0
-        best_token = None
+        best_id = None
 
-        for known_token in self._tokens.itervalues():
-            sim_score = ratio(token_str, known_token.value)
+        for id, known_token_str in enumerate(words):
+            sim_score = ratio(token_str, known_token_str)
 
             if sim_score >= self.__similarity_thresh:
-                most_similar_token, overall_score = self.__find_most_similar_token(token_str, known_token, touch_id,
-                                                                                   sim_score)
+                most_similar_id, overall_score = self.__find_most_similar_token(token_str, id, visited, sim_score)
                 if overall_score > best_score:
-                    best_token = most_similar_token
+                    best_id = most_similar_id
                     best_score = overall_score
 
                     if best_score >= target_similarity:
                         break
-        if best_token is not None:
-            best_token_str = best_token.value
+
+        if best_id is not None:
+            best_token_str = words[best_id]
         else:
             best_token_str = token_str
 
         return best_token_str, best_score
 
+    def correct_many(self, token_strs, target_similarity=80, processes=None, use_threads=False, chunk_size=200):
+        """
+        get_best_spelling_correction of many strings, each distinct string is looked up once
+        and the lookups are spread over a pool of processes (or threads)
+        :param token_strs: list of strings to be matched
+        :param processes: number of processes (or threads) to look up with
+                          (default: one per cpu, 1 to look up in this process)
+        :param use_threads: use a thread pool instead of a process pool, threads share this object
+                            instead of receiving a copy (cheap for compiled dictionaries either way)
+        :return: list of (match, score) in the order of token_strs
+        """
+        distinct = list(set(token_strs))
+        chunks = [distinct[k:k + chunk_size] for k in xrange(0, len(distinct), chunk_size)]
+
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+
+        if processes <= 1 or len(chunks) <= 1:
+            results = [self.get_best_spelling_correction(t, target_similarity) for t in distinct]
+        elif use_threads:
+            pool = ThreadPool(processes)
+            try:
+                results = pool.map(lambda chunk: [self.get_best_spelling_correction(t, target_similarity) for t in chunk], chunks)
+            finally:
+                pool.close()
+                pool.join()
+            results = [r for chunk_results in results for r in chunk_results]
+        else:
+            pool = multiprocessing.Pool(processes, initializer=_init_lookup_worker, initargs=(self,))
+            try:
+                results = pool.map(_lookup_chunk, [(chunk, target_similarity) for chunk in chunks])
+            finally:
+                pool.close()
+                pool.join()
+            results = [r for chunk_results in results for r in chunk_results]
+
+        corrections = dict(itertools.izip(distinct, results))
+        return [corrections[t] for t in token_strs]
+
+    def _bk_tree_lookup(self, token_str, target_similarity):
+        """
+        get_best_spelling_correction for the "bktree" engine, finds the token with the best
+        similarity (ties go to the more frequent token) among tokens at least __similarity_thresh similar
+        """
+        query_len = len(token_str)
+        counts = self._graph.counts
+
+        def max_distance(similarity):
+            # ratio >= similarity means distance <= (1 - similarity) * max(len(token_str), len(token)),
+            # a token is at most distance characters longer than token_str
+            if similarity <= 0:
+                return float("inf")
+            return int((1.0 - similarity) * query_len / similarity + 1e-9)
+
+        def score(d, word, id):
+            similarity = (1.0 - d * 1.0 / max(query_len, len(word))) * 100.0
+            return (similarity, counts[id]), max_distance(similarity / 100.0)
+
+        best = self._bk_tree.closest(token_str, score, max_distance(self.__similarity_thresh / 100.0),
+                                     good_enough=(target_similarity, 0))
+
+        if best is None or best[0][0] < self.__similarity_thresh:
+            return token_str, 0
+
+        (best_score, _), _, best_id = best
+        return self._graph.words[best_id], best_score
+
+    def _deletion_index_lookup(self, token_str):
+        """
+        get_best_spelling_correction for the "symspell" engine, finds the token with the fewest edits
+        (ties go to the more frequent token) among tokens within max_edit_distance edits,
+        the match must still be at least __similarity_thresh similar
+        """
+        candidates = self._deletion_index.lookup(token_str)
+        if not candidates:
+            return token_str, 0
+
+        counts = self._graph.counts
+        _, _, best_id = min(candidates, key=lambda c: (c[0], -counts[c[2]], c[1]))
+
+        best_token_str = self._graph.words[best_id]
+        best_score = ratio(token_str, best_token_str)
+        if best_score < self.__similarity_thresh:
+            return token_str, 0
+
+        return best_token_str, best_score
+
     def change_similarity_threshold(self, new_sim_thresh):
-        """rebuilds the dictionary with the new similarity threshold"""
+        """
+        changes the similarity threshold of the dictionary, thresholds at or above the similarity floor
+        only change which stored similarity scores lookups follow, lower ones compare the tokens again
+        (and lower the floor)
+        """
 
-        # update our similar tokens lists
-        if new_sim_thresh < self.__similarity_thresh:
-            for token1 in self._tokens.itervalues():
-                for token2 in self._tokens.itervalues():
-                    if self.__similarity_thresh > ratio(token1.value, token2.value) >= new_sim_thresh:
-                        token1.similar_tokens.add(token2)
-                        token2.similar_tokens.add(token1)
-        elif new_sim_thresh > self.__similarity_thresh:
-            for token in self._tokens.itervalues():
-                # new similar token list for 'token' (the list can't be change while we iterate through it)
-                new_sim_set = set([])
-
-                for sim_token in token.similar_tokens:
-                    # see if the similar tokens still pass the threshold
-                    if ratio(token.value, sim_token.value) >= new_sim_thresh: # if they do add them to the new list
-                        new_sim_set.add(sim_token)
-                    else:
-                        sim_token.similar_tokens.discard(token) # if they don't remove this token from the other token's similar token list
-                token.similar_tokens = new_sim_set
+        if new_sim_thresh < self.__similarity_floor:
+            self._check_writable()
+
+            # pairs at least as similar as the old floor are already linked
+            for i, j, score in similar_pairs(self._graph.words, new_sim_thresh):
+                if score < self.__similarity_floor:
+                    self._graph.link(i, j, score)
+
+            self.__similarity_floor = new_sim_thresh
 
         self.__similarity_thresh = new_sim_thresh
+        self._dictionary_changed()
 
     def remove_all_tokens(self):
-        self._tokens = {}
+        self._graph = TokenGraph()
+        self._dictionary_changed()
         self._total_occurrences = 0
-        self.__next_touch_id = 0
+        self._bk_tree.clear()
+        self._deletion_index.clear()
 
-    def add_common_tokens_from_txt_file(self, fn, num=1000, start=0):
-        with open(fn,"r") as file:
-            txt = file.read()
-            self.add_common_tokens_from_txt(txt, num, start)
+    def add_common_tokens_from_txt_file(self, fn, num=1000, start=0, processes=None):
+        self.add_common_tokens_from_files([fn], num, start, processes)
 
-    def add_common_tokens_from_txt(self, text, num=1000, start=0):
+    def add_common_tokens_from_files(self, paths, num=1000, start=0, processes=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        finds most common tokens in text files and adds them to dictionary, the files are read
+        and counted a chunk at a time by a pool of processes (see :func:`.count_tokens`)
+        so the corpus never has to fit in memory
+        :param paths: list of text files and directories of text files
+        :param num: number of common tokens to add
+        :param start: number of common tokens to skip starting from most common
+        :param processes: number of processes used to count tokens and build the dictionary
+        :param chunk_size: approximate number of bytes tokenized at once by a process
+        :return:
+        """
+        counts = count_tokens(paths, tokenize, processes, chunk_size)
+        tokens = counts.most_common(num + start)[start:]
+        del counts
+
+        self.add_tokens(tokens, processes)
+
+    def add_common_tokens_from_txt(self, text, num=1000, start=0, processes=None):
         """
         finds most common tokens in provided text and adds them to dictionary
         :param text: text to get tokens from
         :param num: number of common tokens to add
         :param start: number of common tokens to skip starting from most common
                       (i.e. 10 would mean ignore the ten most common tokens)
+        :param processes: number of processes used to build the dictionary (see add_tokens)
         :return:
         """
         tokens = tokenize(text)
@@ -239,8 +514,46 @@ class SpellChecker(object):
         # crop out from starting pos
         tokens = tokens[start:]
 
-        for token_str, count in tokens:
-            self.add_token(token_str, count)
+        self.add_tokens(tokens, processes)
+
+    def add_tokens(self, tokens, processes=None):
+        """
+        Add many tokens to the spell checker's dictionary at once, the result is the same
+        as calling add_token for each of them but only pairs of tokens that could be similar
+        are compared, in parallel (see :func:`.similar_pairs`)
+        :param tokens: list of (token_str, token_count)
+        :param processes: number of processes to compare tokens with
+                          (default: one per cpu, 1 to compare in this process)
+        :return: no return
+        """
+        self._check_writable()
+        self._dictionary_changed()
+
+        new_start = len(self._graph)
+
+        for token_str, token_count in tokens:
+            id = self._graph.id_of(token_str)
+            if id is not None:
+                self._graph.counts[id] += token_count
+                continue
+
+            self._graph.add(token_str, token_count)
+            self._total_occurrences += token_count
+
+        if len(self._graph) == new_start:
+            return
+
+        # small additions aren't worth starting processes for
+        if len(self._graph) - new_start < 500:
+            processes = 1
+
+        pairs = similar_pairs(self._graph.words, self.__similarity_floor, new_start=new_start, processes=processes)
+
+        for i, j, score in pairs:
+            self._graph.link(i, j, score)
+
+        for id in xrange(new_start, len(self._graph)):
+            self._index_token(id)
 
     def add_token(self, token_str, token_count):
         """
@@ -250,56 +563,60 @@ class SpellChecker(object):
                             target text (this represents its frequency of occurrence)
         :return: no return
         """
+        self._check_writable()
+        self._dictionary_changed()
 
-        if token_str in self._tokens:
-            self._tokens[token_str].count += token_count
+        id = self._graph.id_of(token_str)
+        if id is not None:
+            self._graph.counts[id] += token_count
             return
 
-        new_token = Token(token_str, token_count)
-
         # update our similar tokens lists
-        for existing_token in self._tokens.itervalues():
-            if ratio(new_token.value, existing_token.value) >= self.__similarity_thresh:
-                new_token.similar_tokens.add(existing_token)
-                existing_token.similar_tokens.add(new_token)
+        scores = [ratio(token_str, existing_token_str) for existing_token_str in self._graph.words]
+
+        new_id = self._graph.add(token_str, token_count)
+        for id, score in enumerate(scores):
+            if score >= self.__similarity_floor:
+                self._graph.link(new_id, id, score)
 
         self._total_occurrences += token_count
-        self._tokens[token_str] = new_token
 
-    def __find_most_similar_token(self, token_str, similar_token, touch_id, sim_score):
+        self._index_token(new_id)
+
+    def __find_most_similar_token(self, token_str, similar_id, visited, sim_score):
         """
-        Searches for the token with spelling closest to token_str starting from similar_token
-        then calls __proximity_search_for_most_likely_match to find the token with the best
-        overall match score (similarity * frequency)
+        Searches for the token with spelling closest to token_str starting from similar_id
+        by hill-climbing the graph of similar tokens
         :param token_str: string of token to be matched to
-        :param similar_token: a token to start the search from, is assumed to have a high similarity score with token_str
-        :param sim_score: the similarity score between token_str and similar_token
-        :param touch_tag: the touch tag to be used for this search operation
-        :return: (best_token, best_overall_score)
+        :param similar_id: id of a token to start the search from, is assumed to have a high similarity score with token_str
+        :param visited: bitmap (bytearray) of the tokens the current search has visited
+        :param sim_score: the similarity score between token_str and the similar_id token
+        :return: (best_id, best_similarity_score)
         """
 
+        words = self._graph.words
+
         best_similarity_score = sim_score
-        best_token = similar_token
+        best_id = similar_id
 
         better_token_found = True
 
         while better_token_found:
             better_token_found = False
 
-            for token in best_token.similar_tokens:
-                if not token.touched_by(touch_id):
-                    token.touch_with(touch_id)
-                else:
+            for id in self._graph.similar_ids(best_id, self.__similarity_thresh):
+                if visited[id]:
                     continue
+                visited[id] = 1
 
-                similarity_score = ratio(token_str, token.value)
+                similarity_score = ratio(token_str, words[id])
 
                 if similarity_score > best_similarity_score:
                     best_similarity_score = similarity_score
-                    best_token = token
+                    best_id = id
                     better_token_found = True
 
-        return best_token, best_similarity_score
+        return best_id, best_similarity_score
 
 # spell_checker = SpellChecker(similarity_thresh=50)
 #
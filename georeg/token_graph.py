@@ -0,0 +1,140 @@
+"""
+Array-backed graph of similar tokens used by :class:`.SpellChecker`.
+
+Tokens are integer ids into a list of words and a list of counts. Every pair of
+tokens at least the dictionary's similarity floor similar is a link with its
+similarity score, neighbours are read from compressed sparse row arrays
+(indptr, indices, scores) so a token's similar tokens are a slice of an array
+rather than a set of objects.
+"""
+
+from array import array
+import numpy as np
+
+__all__ = ("SimilarityGraph", "TokenGraph")
+
+def _to_numpy(values, dtype):
+    """copy of an array.array as a numpy array"""
+    if not len(values):
+        return np.zeros(0, dtype=dtype)
+    return np.frombuffer(values, dtype=np.dtype(values.typecode)).astype(dtype)
+
+class SimilarityGraph(object):
+    """
+    common lookups of graphs with words, counts and CSR adjacency arrays
+    (indptr, indices, scores) holding both directions of every link
+    """
+
+    def __len__(self):
+        return len(self.words)
+
+    def count_list(self):
+        return np.asarray(self.counts).tolist()
+
+    def similar_ids(self, id, min_score):
+        """list of the ids of the tokens at least min_score similar to token id"""
+        indptr, indices = self._thresholded(min_score)
+        return indices[indptr[id]:indptr[id + 1]].tolist()
+
+    def similar(self, id, min_score):
+        """(ids, scores) arrays of the tokens at least min_score similar to token id"""
+        start, end = self.indptr[id], self.indptr[id + 1]
+        scores = self.scores[start:end]
+        keep = scores >= min_score
+        return self.indices[start:end][keep], scores[keep]
+
+    def links(self):
+        """(i, j, score) arrays of every link once"""
+        rows = np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.indptr).astype(np.int64))
+        once = self.indices < rows
+        return rows[once], self.indices[once].astype(np.int64), self.scores[once]
+
+    def _thresholded(self, min_score):
+        """(indptr, indices) of only the links at least min_score similar, kept until the graph changes"""
+        cached = getattr(self, "_thresholded_cache", None)
+        if cached is not None and cached[0] == min_score:
+            return cached[1:]
+
+        keep = self.scores >= min_score
+        if keep.all():
+            indptr, indices = self.indptr, self.indices
+        else:
+            rows = np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.indptr).astype(np.int64))
+            indptr = np.zeros(len(self) + 1, dtype=np.int64)
+            indptr[1:] = np.cumsum(np.bincount(rows[keep], minlength=len(self)))
+            indices = self.indices[keep]
+
+        self._thresholded_cache = (min_score, indptr, indices)
+        return indptr, indices
+
+class TokenGraph(SimilarityGraph):
+    """
+    in-memory, growable graph, links are appended to flat arrays and the CSR arrays
+    are rebuilt from them the next time they are needed
+    """
+
+    def __init__(self):
+        self.words = []
+        self.counts = []
+        self._ids = {} # word -> id
+
+        # every link once
+        self._sources = array("l")
+        self._targets = array("l")
+        self._scores = array("d")
+
+        self._invalidate()
+
+    def _invalidate(self):
+        """forget the CSR arrays (and thresholded copies of them) after the graph changes"""
+        self._csr = None
+        self._thresholded_cache = None
+
+    def id_of(self, word):
+        return self._ids.get(word)
+
+    def add(self, word, count):
+        """add a new word, returns its id"""
+        id = len(self.words)
+        self._ids[word] = id
+        self.words.append(word)
+        self.counts.append(count)
+
+        self._invalidate()
+        return id
+
+    def link(self, i, j, score):
+        self._sources.append(i)
+        self._targets.append(j)
+        self._scores.append(score)
+
+        self._invalidate()
+
+    @property
+    def indptr(self):
+        return self._build_csr()[0]
+    @property
+    def indices(self):
+        return self._build_csr()[1]
+    @property
+    def scores(self):
+        return self._build_csr()[2]
+
+    def links(self):
+        return _to_numpy(self._sources, np.int64), _to_numpy(self._targets, np.int64), _to_numpy(self._scores, np.float64)
+
+    def _build_csr(self):
+        if self._csr is None:
+            sources, targets, scores = self.links()
+
+            # both directions of every link, grouped by token
+            rows = np.concatenate((sources, targets))
+            columns = np.concatenate((targets, sources))
+            order = np.lexsort((columns, rows))
+
+            indptr = np.zeros(len(self.words) + 1, dtype=np.int64)
+            indptr[1:] = np.cumsum(np.bincount(rows, minlength=len(self.words)))
+
+            self._csr = (indptr, columns[order].astype(np.int32), np.concatenate((scores, scores))[order])
+
+        return self._csr
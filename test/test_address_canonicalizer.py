@@ -0,0 +1,47 @@
+import unittest
+
+from georeg.address_canonicalizer import canonical_key, fix_ocr_digits
+
+class FixOcrDigitsTest(unittest.TestCase):
+    """I and O are read as 1 and 0 only inside numbers"""
+
+    def test_numbers_are_fixed(self):
+        self.assertEqual(fix_ocr_digits("I23 MAIN ST"), "123 MAIN ST")
+        self.assertEqual(fix_ocr_digits("1O5 OLD RD"), "105 OLD RD")
+        self.assertEqual(fix_ocr_digits("O29O3"), "02903")
+        self.assertEqual(fix_ocr_digits("I"), "1")
+
+    def test_words_are_kept(self):
+        for text in ("IOWA ST", "ROBIN ST", "OLD RD", "I-95", "O"):
+            self.assertEqual(fix_ocr_digits(text), text)
+
+    def test_spacing_is_collapsed(self):
+        self.assertEqual(fix_ocr_digits("  12   MAIN  ST "), "12 MAIN ST")
+
+class CanonicalKeyTest(unittest.TestCase):
+    """the same address written different ways has one key, different addresses don't share it"""
+
+    def key(self, street, city="Providence", state="RI", zip_cd="02903"):
+        return canonical_key(street, city, state, zip_cd)
+
+    def test_collisions(self):
+        same = [("12 N. Main Street", "Providence", "RI", "02903"),
+                ("12 north main st", "PROVIDENCE", "ri", "02903"),
+                ("12  N MAIN ST.", "providence,", " ri ", " 02903 ")]
+        keys = set(canonical_key(*address) for address in same)
+
+        self.assertEqual(keys, set([("12 N MAIN ST", "PROVIDENCE", "RI", "02903")]))
+
+    def test_abbreviations(self):
+        self.assertEqual(self.key("5 Elm Avenue"), self.key("5 ELM AV"))
+        self.assertEqual(self.key("5 Elm Boulevard"), self.key("5 elm blvd"))
+
+    def test_non_collisions(self):
+        keys = [self.key("12 Main St"), self.key("13 Main St"), self.key("12 Main Ave"),
+                self.key("12 Maine St"), self.key("12 S Main St"), self.key("12 Main St", zip_cd="02904"),
+                self.key("12 Main St", city="Cranston"), self.key("12 Main St", state="MA")]
+
+        self.assertEqual(len(set(keys)), len(keys))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import json
+import unittest
+import urlparse
+
+from geopy.exc import GeocoderQueryError
+
+from georeg.brownarcgis import BrownArcGIS
+
+class Page(object):
+    def __init__(self, status, body):
+        self.status = status
+        self.body = body
+
+class FlakyPool(object):
+    """answers batch requests, with the status of failures[n] for the n-th request if there is one"""
+
+    maxsize = 1
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.requests = 0
+
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        status = self.failures.get(self.requests)
+        self.requests += 1
+        if status is not None:
+            return Page(status, json.dumps({"error": {"code": status, "message": "failed"}}))
+
+        records = json.loads(urlparse.parse_qs(body)['addresses'][0])['records']
+        locations = [{"score": 100, "location": {"x": 1.0, "y": 2.0},
+                      "attributes": {"ResultID": r["attributes"]["OBJECTID"], "Match_addr": "addr"}}
+                     for r in records]
+        return Page(200, json.dumps({"locations": locations}))
+
+class BatchServerErrorTest(unittest.TestCase):
+    """a 5xx response resends the chunk, 4xx responses are raised with the chunks geocoded before them"""
+
+    def geocoder(self, failures):
+        geocoder = BrownArcGIS(host="localhost:1")
+        geocoder.pool = FlakyPool(failures)
+        geocoder._max_batch_size = 300
+        return geocoder
+
+    def addresses(self, n):
+        return [(i, "%d MAIN ST, PROVIDENCE, RI" % i) for i in xrange(n)]
+
+    def test_transient_5xx_is_retried(self):
+        for status in (500, 502):
+            geocoder = self.geocoder({1: status})
+            geocoded = geocoder.geocode_batch(self.addresses(3000))['geocoded']
+
+            self.assertEqual(sorted(g['uid'] for g in geocoded), range(3000))
+            self.assertEqual(geocoder.chunker.errors, 1)
+
+    def test_repeated_5xx_gives_up(self):
+        geocoder = self.geocoder(dict((n, 500) for n in xrange(1, 100)))
+
+        with self.assertRaises(Exception) as raised:
+            geocoder.geocode_batch(self.addresses(3000))
+        self.assertEqual(len(raised.exception.geocoded), 100)
+        self.assertEqual(geocoder.pool.requests, 2 + BrownArcGIS._MAX_RETRIES)
+
+    def test_4xx_is_raised(self):
+        geocoder = self.geocoder({1: 400})
+
+        with self.assertRaises(GeocoderQueryError) as raised:
+            geocoder.geocode_batch(self.addresses(3000))
+        self.assertEqual(len(raised.exception.geocoded), 100)
+        self.assertEqual(geocoder.pool.requests, 2)
+
+if __name__ == "__main__":
+    unittest.main()
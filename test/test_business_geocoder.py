@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import georeg.business_geocoder as geo
+from georeg.geocode_cache import GeocodeCache
+from georeg.geocoder_backends import GeocoderBackend, OfflineGeocoder
+
+SEGMENTS = """from_number,to_number,street,city,state,zip,from_lat,from_long,to_lat,to_long
+1,99,Main St,Providence,RI,02903,41.0,-71.0,41.1,-71.1
+"""
+
+class Business(object):
+    def __init__(self, address):
+        self.address = address
+        self.city = "Providence"
+        self.zip = "02903"
+        self.lat = self.long = ""
+        self.confidence_score = 0.0
+        self.geocode_status = geo.GEOCODE_PENDING
+
+class NoMatches(GeocoderBackend):
+    """backend that finds nothing, counting its queries"""
+
+    def __init__(self):
+        self.queries = 0
+
+    def geocode(self, *args, **kwargs):
+        self.queries += 1
+        return None
+
+class CachePerBackendTest(unittest.TestCase):
+    """results cached for one backend aren't reused for another"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "segments.csv")
+        with open(self.path, "w") as file:
+            file.write(SEGMENTS)
+
+        self.old_cache, self.old_geolocator = geo.cache, geo._geolocator
+        geo.set_cache(GeocodeCache(os.path.join(self.dir, "cache.sqlite")))
+
+    def tearDown(self):
+        geo.cache.close()
+        geo.set_cache(self.old_cache)
+        geo.set_geolocator(self.old_geolocator)
+        shutil.rmtree(self.dir)
+
+    def test_offline_results_are_not_reused_by_other_backends(self):
+        geo.set_geolocator(OfflineGeocoder(self.path))
+        business = Business("500 Main St") # only matches the street
+        self.assertTrue(geo.geocode_business(business))
+        self.assertEqual(business.confidence_score, OfflineGeocoder.nearest_score)
+
+        other = NoMatches()
+        geo.set_geolocator(other)
+        business = Business("500 Main St")
+        self.assertFalse(geo.geocode_business(business))
+        self.assertEqual(other.queries, 1)
+
+        # each backend's result is still cached
+        geo.set_geolocator(OfflineGeocoder(self.path))
+        business = Business("500 MAIN STREET")
+        self.assertTrue(geo.geocode_business(business))
+        self.assertEqual(business.confidence_score, OfflineGeocoder.nearest_score)
+
+        geo.set_geolocator(other)
+        self.assertFalse(geo.geocode_business(Business("500 Main St")))
+        self.assertEqual(other.queries, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+
+import cv2
+import numpy as np
+
+from georeg.column_layout import find_columns_by_projection
+from georeg.contour_table import ContourTable
+
+try:
+    from georeg.registry_processor import RegistryProcessor
+except ImportError: # tessapi isn't installed
+    RegistryProcessor = None
+
+def sparse_two_page_image():
+    """
+    2000px wide image of two pages with two columns each, lines of text in the first
+    page's left column and both of the second page's columns (the first page's right column is empty)
+    """
+    thresh = np.zeros((1000, 2000), np.uint8)
+    for left in (50, 1050, 1550):
+        for top in xrange(50, 950, 60):
+            thresh[top:top + 30, left:left + 400] = 255
+    return thresh
+
+def contours_of(thresh):
+    return ContourTable(cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2])
+
+class SparseTwoPageLayoutTest(unittest.TestCase):
+    """an empty column keeps its place so columns can be sliced by page"""
+
+    def setUp(self):
+        self.thresh = sparse_two_page_image()
+        self.contours = contours_of(self.thresh)
+        self.clustering = find_columns_by_projection(self.thresh, self.contours.edges(), 4)
+
+    def test_page_boundary_between_pages(self):
+        gutters = self.clustering.gutters
+
+        self.assertEqual(len(gutters), 3)
+        self.assertTrue(450 <= gutters[0] < gutters[1], gutters)
+        self.assertTrue(950 <= gutters[1] <= 1050, gutters)
+        self.assertTrue(1450 <= gutters[2] <= 1550, gutters)
+
+    def test_labels(self):
+        labels = self.clustering.labels_
+
+        self.assertEqual(len(self.clustering.cluster_centers_), 4)
+        self.assertEqual(sorted(set(labels[self.contours.x == 50])), [0])
+        self.assertEqual(sorted(set(labels[self.contours.x == 1050])), [2])
+        self.assertEqual(sorted(set(labels[self.contours.x == 1550])), [3])
+
+    @unittest.skipIf(RegistryProcessor is None, "tessapi is not installed")
+    def test_contour_columns_keep_empty_column(self):
+        processor = RegistryProcessor.__new__(RegistryProcessor)
+        processor.std_thresh = 1
+
+        columns, _ = processor._make_contour_columns(self.contours, self.clustering)
+
+        self.assertEqual(len(columns), 4)
+        self.assertEqual([sorted(set(c.x for c in column)) for column in columns], [[50], [], [1050], [1550]])
+
+        # the first page's columns, as RegistryProcessorRI slices them
+        self.assertEqual([c.x for column in columns[0:2] for c in column], [50] * 15)
+
+if __name__ == "__main__":
+    unittest.main()
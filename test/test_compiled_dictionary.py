@@ -0,0 +1,53 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from georeg.spell_checker import SpellChecker
+
+WORDS = [("providence", 40), ("pawtucket", 25), ("warwick", 30), ("cranston", 20), ("woonsocket", 10),
+         ("newport", 15), ("bristol", 12), ("westerly", 8), ("coventry", 9), ("cumberland", 11)]
+
+class CompiledWordsTest(unittest.TestCase):
+    """a compiled dictionary's words are read from the mapped file, not copied into a list"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "vocab.bin")
+
+        self.checker = SpellChecker()
+        self.checker.add_tokens(WORDS)
+        self.checker.write_compiled_dictionary(self.path)
+
+        self.compiled = SpellChecker()
+        self.compiled.load_compiled_dictionary(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_words_by_id(self):
+        graph = self.compiled._graph
+        words = graph.words
+
+        self.assertNotIsInstance(words, list)
+        self.assertEqual(len(words), len(WORDS))
+        self.assertEqual(list(words), sorted(w for w, _ in WORDS))
+        self.assertEqual(words[-1], words[len(WORDS) - 1])
+        self.assertEqual(words[1:3], list(words)[1:3])
+        self.assertRaises(IndexError, lambda: words[len(WORDS)])
+
+        for id, word in enumerate(words):
+            self.assertEqual(graph.id_of(word), id)
+
+    def test_lookups_match_uncompiled(self):
+        for misspelling in ("providnce", "pawtuket", "warwik", "cranstn", "newprt", "cumberlnd", "zzzz"):
+            self.assertEqual(self.compiled.get_best_spelling_correction(misspelling),
+                             self.checker.get_best_spelling_correction(misspelling))
+
+    def test_pickles_as_path(self):
+        copy = pickle.loads(pickle.dumps(self.compiled._graph, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(list(copy.words), list(self.compiled._graph.words))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+
+import numpy as np
+
+from georeg.column_layout import ColumnClustering
+from georeg.contour_table import ContourTable
+
+try:
+    from georeg.registry_processor import RegistryProcessor
+except ImportError: # tessapi isn't installed
+    RegistryProcessor = None
+
+def rectangles(boxes):
+    """ContourTable of rectangles (left, right, y), right is the x past the last pixel as in ContourTable.edges"""
+    return ContourTable([np.array([[[left, y]], [[right - 1, y]], [[right - 1, y + 9]], [[left, y + 9]]], np.int32)
+                         for left, right, y in boxes])
+
+def reference_contour_columns(contours, clustering, std_thresh):
+    """contour columns made one contour at a time (as before the ContourTable rewrite), empty columns kept"""
+    column_contours = [[] for _ in clustering.cluster_centers_]
+    non_column_contours = []
+
+    for col_ix in sorted(set(clustering.labels_)):
+        col_loc = clustering.cluster_centers_[col_ix]
+        cluster_contours = [c for i, c in enumerate(contours) if clustering.labels_[i] == col_ix]
+
+        contour_locs = [[c.x, c.x + c.w] for c in cluster_contours]
+        col_std = np.std(contour_locs)
+
+        for contour_ix, contour in enumerate(cluster_contours):
+            if np.linalg.norm(np.array(contour_locs[contour_ix]) - col_loc) < std_thresh * col_std:
+                column_contours[col_ix].append(contour)
+            else:
+                non_column_contours.append(contour)
+
+    order = sorted(xrange(len(column_contours)), key=lambda ix: clustering.cluster_centers_[ix][0])
+    return [sorted(column_contours[ix], key=lambda c: c.y) for ix in order], non_column_contours
+
+def boxes(contours):
+    return [(c.x, c.x + c.w, c.y) for c in contours]
+
+@unittest.skipIf(RegistryProcessor is None, "tessapi is not installed")
+class ContourColumnsTest(unittest.TestCase):
+    """_make_contour_columns keeps every column in order of position and drops contours far from their column"""
+
+    def setUp(self):
+        self.processor = RegistryProcessor.__new__(RegistryProcessor)
+        self.processor.std_thresh = 1
+
+    def test_fixed_clustering(self):
+        contours = rectangles([(1000, 1200, 40), (100, 300, 50), (100, 900, 20), (100, 300, 10),
+                               (1000, 1200, 5), (102, 298, 30)])
+        # columns aren't in order of position and the middle one is empty
+        clustering = ColumnClustering([[1000, 1200], [600, 800], [100, 300]], [0, 2, 2, 2, 0, 2])
+
+        columns, non_columns = self.processor._make_contour_columns(contours, clustering)
+
+        self.assertEqual([boxes(column) for column in columns],
+                         [[(100, 300, 10), (102, 298, 30), (100, 300, 50)], [], [(1000, 1200, 5), (1000, 1200, 40)]])
+        self.assertEqual(boxes(non_columns), [(100, 900, 20)])
+
+    def test_matches_per_contour_reference(self):
+        random = np.random.RandomState(0)
+
+        for trial in xrange(20):
+            self.processor.std_thresh = 1 if trial % 2 else 0.4 # 0.4 leaves many contours out of their column
+            centers = random.permutation(5)[:, None] * 400 + np.array([[50, 350]])
+            labels = random.randint(0, 4, size=60) # the last column is always empty
+            lefts = centers[labels, 0] + random.normal(0, 20, size=60).astype(int)
+            rights = centers[labels, 1] + random.normal(0, 60, size=60).astype(int)
+            contours = rectangles(zip(lefts, rights, random.permutation(60) * 15))
+            clustering = ColumnClustering(centers, labels)
+
+            columns, non_columns = self.processor._make_contour_columns(contours, clustering)
+            expected_columns, expected_non_columns = reference_contour_columns(contours, clustering,
+                                                                                self.processor.std_thresh)
+
+            self.assertEqual([boxes(column) for column in columns], [boxes(column) for column in expected_columns])
+            self.assertEqual(boxes(non_columns), boxes(expected_non_columns))
+
+if __name__ == "__main__":
+    unittest.main()
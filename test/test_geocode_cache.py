@@ -0,0 +1,105 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from time import time
+
+from georeg.geocode_cache import DEFAULT_BACKEND, GeocodeCache
+
+KEY = ("12 N MAIN ST", "PROVIDENCE", "RI", "02903")
+OTHER_KEY = ("5 ELM AVE", "CRANSTON", "RI", "02910")
+
+class GeocodeCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "cache", "geocode_cache.sqlite") # the directory is created on first use
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def age_entry(self, key, seconds):
+        """move key's entry seconds into the past"""
+        conn = sqlite3.connect(self.path)
+        conn.execute("UPDATE geocode_results SET updated=? WHERE street=? AND city=? AND state=? AND zip=?",
+                     (time() - seconds,) + key)
+        conn.commit()
+        conn.close()
+
+    def test_hit_after_reopening(self):
+        cache = GeocodeCache(self.path)
+        cache.put(KEY, 95.5, 41.8, -71.4, "12 N MAIN ST, PROVIDENCE, RI, 02903")
+        cache.close()
+
+        cache = GeocodeCache(self.path)
+        self.assertEqual(cache.get(KEY), {'found': True, 'score': 95.5, 'lat': 41.8, 'long': -71.4,
+                                          'match_addr': "12 N MAIN ST, PROVIDENCE, RI, 02903"})
+        self.assertIsNone(cache.get(OTHER_KEY))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_negative_entry_expires(self):
+        cache = GeocodeCache(self.path, negative_ttl=3600)
+        cache.put_negative(KEY)
+        self.assertEqual(cache.get(KEY), {'found': False})
+
+        self.age_entry(KEY, 1800)
+        self.assertEqual(cache.get(KEY), {'found': False})
+
+        self.age_entry(KEY, 7200)
+        self.assertIsNone(cache.get(KEY))
+
+    def test_found_entry_does_not_expire(self):
+        cache = GeocodeCache(self.path, negative_ttl=3600)
+        cache.put(KEY, 100.0, 41.8, -71.4, "12 N MAIN ST")
+
+        self.age_entry(KEY, 7200)
+        self.assertTrue(cache.get(KEY)['found'])
+
+    def test_backends_are_kept_apart(self):
+        cache = GeocodeCache(self.path)
+        cache.put(KEY, 50.0, 41.8, -71.4, "12 N MAIN ST", backend="OfflineGeocoder:/tmp/streets.csv:0")
+
+        self.assertIsNone(cache.get(KEY))
+        self.assertEqual(cache.get(KEY, backend="OfflineGeocoder:/tmp/streets.csv:0")['score'], 50.0)
+
+        cache.put_negative(KEY)
+        self.assertEqual(cache.get(KEY), {'found': False})
+        self.assertTrue(cache.get(KEY, backend="OfflineGeocoder:/tmp/streets.csv:0")['found'])
+
+    def test_cache_without_backends_is_migrated(self):
+        os.makedirs(os.path.dirname(self.path))
+        conn = sqlite3.connect(self.path)
+        conn.execute("CREATE TABLE geocodes (street TEXT, city TEXT, state TEXT, zip TEXT, "
+                     "found INTEGER, score REAL, lat REAL, long REAL, match_addr TEXT, "
+                     "updated REAL, PRIMARY KEY (street, city, state, zip))")
+        conn.execute("INSERT INTO geocodes VALUES (?, ?, ?, ?, 1, 98.0, 41.8, -71.4, '12 N MAIN ST', ?)", KEY + (time(),))
+        conn.commit()
+        conn.close()
+
+        cache = GeocodeCache(self.path)
+        self.assertEqual(cache.get(KEY, backend=DEFAULT_BACKEND)['score'], 98.0)
+        self.assertIsNone(cache.get(KEY, backend="OfflineGeocoder:/tmp/streets.csv:0"))
+
+    def test_forked_process_opens_its_own_connection(self):
+        cache = GeocodeCache(self.path)
+        cache.put(KEY, 100.0, 41.8, -71.4, "12 N MAIN ST")
+
+        pid = os.fork()
+        if pid == 0:
+            # the child must not use the parent's connection
+            status = 1
+            try:
+                if cache.get(KEY)['found']:
+                    cache.put(OTHER_KEY, 90.0, 41.7, -71.4, "5 ELM AVE")
+                    status = 0
+            finally:
+                os._exit(status)
+
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(status, 0)
+        self.assertEqual(cache.get(OTHER_KEY)['score'], 90.0)
+        self.assertEqual(cache.get(KEY)['score'], 100.0)
+
+if __name__ == "__main__":
+    unittest.main()
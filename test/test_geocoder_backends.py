@@ -0,0 +1,48 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from georeg.geocoder_backends import OfflineGeocoder
+
+SEGMENTS = """from_number,to_number,street,city,state,zip,from_lat,from_long,to_lat,to_long
+1,99,Main St,Providence,RI,02903,41.0,-71.0,41.1,-71.1
+101,199,Main St,Providence,RI,02903,41.1,-71.1,41.2,-71.2
+"""
+
+class OfflineFallbackScoreTest(unittest.TestCase):
+    """addresses only matched to their street score below address matches"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "segments.csv")
+        with open(self.path, "w") as file:
+            file.write(SEGMENTS)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def score(self, geocoder, street):
+        result = geocoder.geocode(street=street, city="Providence", state="RI", zip_cd="02903")
+        return result and result['candidates'][0]['attributes']['score']
+
+    def test_fallback_scores(self):
+        geocoder = OfflineGeocoder(self.path)
+
+        exact = self.score(geocoder, "150 Main St")
+        nearest = self.score(geocoder, "500 Main St")
+        street = self.score(geocoder, "Main St")
+
+        self.assertEqual(exact, OfflineGeocoder.exact_score)
+        self.assertLess(nearest, OfflineGeocoder.city_score)
+        self.assertLess(street, nearest)
+
+    def test_min_score_drops_fallbacks(self):
+        geocoder = OfflineGeocoder(self.path, min_score=OfflineGeocoder.city_score)
+
+        self.assertEqual(self.score(geocoder, "150 Main St"), OfflineGeocoder.exact_score)
+        self.assertIsNone(self.score(geocoder, "500 Main St"))
+        self.assertIsNone(self.score(geocoder, "Main St"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import unittest
+
+import cv2
+import numpy as np
+
+from georeg import layout
+
+IMAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "img.png")
+
+def bounding_boxes(contours):
+    """(contours, 4) array of (x1, y1, x2, y2)"""
+    boxes = np.array([cv2.boundingRect(c) for c in contours], dtype=np.float64).reshape(-1, 4)
+    boxes[:, 2:] += boxes[:, :2]
+    return boxes
+
+def matched_share(full, scaled, min_iou=0.8):
+    """share of the full resolution boxes overlapped by a scaled box with at least min_iou"""
+    overlap = np.clip(np.minimum(full[:, None, 2], scaled[None, :, 2]) - np.maximum(full[:, None, 0], scaled[None, :, 0]), 0, None) * \
+              np.clip(np.minimum(full[:, None, 3], scaled[None, :, 3]) - np.maximum(full[:, None, 1], scaled[None, :, 1]), 0, None)
+    area = lambda boxes: (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    ious = overlap / np.maximum(area(full)[:, None] + area(scaled)[None, :] - overlap, 1)
+    return (ious.max(axis=1) >= min_iou).mean()
+
+class DownsampledLayoutTest(unittest.TestCase):
+    """contours found on a downsampled page match the ones found at full resolution"""
+
+    @classmethod
+    def setUpClass(cls):
+        image = cv2.imread(IMAGE, cv2.IMREAD_GRAYSCALE)
+        _, cls.thresh = cv2.threshold(image, 60, 255, cv2.THRESH_BINARY_INV)
+
+    def assert_scales_match(self, kernel_shape, iterations, min_share):
+        full = bounding_boxes(layout.find_text_contours(self.thresh, kernel_shape, iterations))
+
+        for scale in (0.5, 0.33, 0.25):
+            scaled = bounding_boxes(layout.find_text_contours(self.thresh, kernel_shape, iterations, scale))
+            share = matched_share(full, scaled)
+            self.assertGreaterEqual(share, min_share, "%.1f%% of contours matched at scale %.2f with kernel %s, %d iterations"
+                                    % (100 * share, scale, kernel_shape, iterations))
+
+    def test_default_settings(self):
+        self.assert_scales_match((10, 3), 8, 0.9)
+
+    def test_tall_kernel(self):
+        # RI 1979, the iterations were scaled from the width of the kernel only
+        self.assert_scales_match((10, 4), 10, 0.9)
+
+    def test_wide_kernel(self):
+        self.assert_scales_match((20, 3), 10, 0.9)
+
+    def test_short_close_keeps_full_resolution(self):
+        self.assertEqual(layout.max_downsample_factor((4, 2), 3), 1)
+
+        contours = layout.find_text_contours(self.thresh, (4, 2), 3, 0.5)
+        self.assertEqual(len(contours), len(layout.find_text_contours(self.thresh, (4, 2), 3)))
+
+    def test_scaled_morphology_preserves_both_axes(self):
+        close_shape, open_shape = layout.scaled_morphology((10, 4), 10, 2)
+
+        # a close of 90 x 30 pixels (and an open of 27 x 9) at full resolution
+        self.assertEqual(close_shape, (45, 15))
+        self.assertEqual(open_shape, (15, 6))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,24 @@
+import unittest
+
+from georeg import spell_checker
+
+class AddTokenAfterLookupTest(unittest.TestCase):
+    """lookups after add_token see the new token (and don't read stale neighbour arrays)"""
+
+    def test_lookups_mixed_with_add_token(self):
+        checker = spell_checker.SpellChecker()
+        checker.add_tokens([("providence", 40), ("warwick", 30), ("cranston", 20)])
+        best = lambda token_str: checker.get_best_spelling_correction(token_str)[0]
+
+        self.assertEqual(best("providnce"), "providence")
+
+        checker.add_token("pawtucket", 25)
+        self.assertEqual(best("pawtuket"), "pawtucket")
+        self.assertEqual(best("providnce"), "providence")
+
+        checker.add_token("pawtuckett", 1)
+        self.assertEqual(best("pawtuckett"), "pawtuckett")
+        self.assertEqual(best("warwik"), "warwick")
+
+if __name__ == "__main__":
+    unittest.main()